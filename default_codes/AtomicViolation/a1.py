@@ -1,6 +1,7 @@
 import threading
 import time
 import random
+from array import array
 
 class BankAccount:
     def __init__(self, account_id, balance):
@@ -41,6 +42,153 @@ def run_transfers(from_account, to_account, num_transfers):
         transfer(from_account, to_account, amount)
 
 
+class Ledger:
+    """Balances of many accounts, guarded by lock-striped shards.
+
+    Balances live in one flat ``array('q')`` indexed by account number.
+    Account ``i`` belongs to shard ``i % num_shards`` and is only touched
+    while that shard's lock is held.  Operations that need several shards
+    take their locks in ascending shard order, so concurrent transfers and
+    batches cannot deadlock.
+    """
+
+    def __init__(self, num_accounts, initial_balance=0, num_shards=64):
+        self.num_accounts = num_accounts
+        self.num_shards = num_shards
+        self.balances = array('q', [initial_balance]) * num_accounts
+        self.shard_locks = [threading.Lock() for _ in range(num_shards)]
+
+    def _locks_for(self, shards):
+        return [self.shard_locks[shard] for shard in sorted(set(shards))]
+
+    def _check_account(self, account):
+        # Negative ids would wrap around both the array and the shard index.
+        if not 0 <= account < self.num_accounts:
+            raise ValueError(f"no account {account} (ledger has {self.num_accounts})")
+
+    def balance(self, account):
+        self._check_account(account)
+        with self.shard_locks[account % self.num_shards]:
+            return self.balances[account]
+
+    def transfer(self, from_account, to_account, amount):
+        """Move amount between two accounts; False if the source lacks the funds"""
+        if amount <= 0:
+            raise ValueError(f"transfer amount must be positive, got {amount}")
+        self._check_account(from_account)
+        self._check_account(to_account)
+        locks = self._locks_for((from_account % self.num_shards, to_account % self.num_shards))
+        for lock in locks:
+            lock.acquire()
+        try:
+            balances = self.balances
+            remaining = balances[from_account] - amount
+            if remaining < 0:
+                return False
+            balances[from_account] = remaining
+            balances[to_account] += amount
+            return True
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def transfer_batch(self, sources, destinations, amounts):
+        """Apply transfers in order under one acquisition of each shard lock involved.
+
+        Transfers that would overdraw their source, have a non-positive
+        amount or name an account outside the ledger, are skipped.  Returns
+        the number of transfers applied.
+        """
+        n = self.num_accounts
+        if sources and not (0 <= min(sources) and max(sources) < n
+                            and 0 <= min(destinations) and max(destinations) < n):
+            # Drop bad ids before any lock is taken, so they cannot wrap
+            # around or fail halfway through the batch.
+            keep = [i for i, (src, dst) in enumerate(zip(sources, destinations))
+                    if 0 <= src < n and 0 <= dst < n]
+            sources = [sources[i] for i in keep]
+            destinations = [destinations[i] for i in keep]
+            amounts = [amounts[i] for i in keep]
+        if len(sources) >= self.num_shards:
+            # Larger batches touch every shard anyway.
+            locks = self.shard_locks
+        else:
+            n = self.num_shards
+            locks = self._locks_for([a % n for a in sources] + [a % n for a in destinations])
+        for lock in locks:
+            lock.acquire()
+        try:
+            balances = self.balances
+            rejected = 0
+            for src, dst, amount in zip(sources, destinations, amounts):
+                remaining = balances[src] - amount
+                if remaining >= 0 and amount > 0:
+                    balances[src] = remaining
+                    balances[dst] += amount
+                else:
+                    rejected += 1
+            return len(amounts) - rejected
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def total(self):
+        """Sum of all balances, taken with every shard locked"""
+        for lock in self.shard_locks:
+            lock.acquire()
+        try:
+            return sum(self.balances)
+        finally:
+            for lock in reversed(self.shard_locks):
+                lock.release()
+
+
+def make_batches(num_accounts, num_transfers, batch_size, seed=None):
+    """Random transfer batches as (sources, destinations, amounts) arrays"""
+    rng = random.Random(seed)
+    accounts = range(num_accounts)
+    amounts = range(10, 51)
+    batches = []
+    for start in range(0, num_transfers, batch_size):
+        size = min(batch_size, num_transfers - start)
+        batches.append((
+            array('q', rng.choices(accounts, k=size)),
+            array('q', rng.choices(accounts, k=size)),
+            array('q', rng.choices(amounts, k=size)),
+        ))
+    return batches
+
+
+def run_ledger(num_accounts=1_000_000, num_transfers=2_000_000, batch_size=4096,
+               num_threads=4, num_shards=64, initial_balance=1000):
+    """Run batched transfers on a Ledger from several threads and check the total"""
+    ledger = Ledger(num_accounts, initial_balance, num_shards)
+    batches = make_batches(num_accounts, num_transfers, batch_size, seed=random.random())
+    applied = [0] * num_threads
+
+    def worker(index):
+        for sources, destinations, amounts in batches[index::num_threads]:
+            applied[index] += ledger.transfer_batch(sources, destinations, amounts)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    expected_total = num_accounts * initial_balance
+    final_total = ledger.total()
+    print(f"Ledger: {num_accounts} accounts in {num_shards} shards, {num_threads} threads")
+    rate = f" ({num_transfers / elapsed:,.0f} transfers/sec)" if elapsed else ""
+    print(f"Applied {sum(applied)} of {num_transfers} transfers in {elapsed:.2f}s{rate}")
+    print(f"Total money in system: ${final_total} (expected ${expected_total})")
+    if final_total != expected_total:
+        print(f"Discrepancy: ${final_total - expected_total}")
+    return final_total == expected_total
+
+
 def main():
     account_a = BankAccount("A", 1000)
     account_b = BankAccount("B", 1000)
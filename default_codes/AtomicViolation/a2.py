@@ -1,6 +1,7 @@
 import threading
 import time
 import random
+from itertools import count
 
 class InventorySystem:
     def __init__(self):
@@ -25,6 +26,155 @@ class InventorySystem:
               f"Expected: {current_quantity + change_amount}, Set to: {new_quantity}")
 
 
+class InventoryStore:
+    """Product quantities guarded by lock stripes, with reservations.
+
+    Product ``p`` belongs to stripe ``hash(p) % num_stripes``; its on-hand
+    and held quantities are only touched while that stripe's lock is held.
+    Operations on several products take their stripes' locks in ascending
+    order, so orders over different products run in parallel and orders
+    over the same products cannot deadlock.  ``available = on_hand - held``
+    never goes negative.
+    """
+
+    def __init__(self, quantities=None, num_stripes=64):
+        self.num_stripes = num_stripes
+        self.stripe_locks = [threading.Lock() for _ in range(num_stripes)]
+        self.on_hand = dict(quantities or {})
+        self.held = {product: 0 for product in self.on_hand}
+        self.reservations = {}
+        self._reservation_ids = count(1)
+
+    def _acquire(self, products):
+        n = self.num_stripes
+        locks = [self.stripe_locks[i] for i in sorted({hash(p) % n for p in products})]
+        for lock in locks:
+            lock.acquire()
+        return locks
+
+    @staticmethod
+    def _release(locks):
+        for lock in reversed(locks):
+            lock.release()
+
+    def available(self, product_id):
+        locks = self._acquire((product_id,))
+        try:
+            return self.on_hand.get(product_id, 0) - self.held.get(product_id, 0)
+        finally:
+            self._release(locks)
+
+    def update_many(self, changes):
+        """Apply every (product, change) line item, or none of them.
+
+        Returns False, changing nothing, if any product would end up with
+        less available stock than zero.  Products are created on first
+        restock.
+        """
+        totals = {}
+        for product_id, change in (changes.items() if isinstance(changes, dict) else changes):
+            totals[product_id] = totals.get(product_id, 0) + change
+        locks = self._acquire(totals)
+        try:
+            on_hand, held = self.on_hand, self.held
+            for product_id, change in totals.items():
+                if on_hand.get(product_id, 0) + change < held.get(product_id, 0):
+                    return False
+            for product_id, change in totals.items():
+                if product_id not in on_hand:
+                    held[product_id] = 0
+                on_hand[product_id] = on_hand.get(product_id, 0) + change
+            return True
+        finally:
+            self._release(locks)
+
+    def update_inventory(self, product_id, change_amount):
+        return self.update_many(((product_id, change_amount),))
+
+    def reserve(self, items):
+        """Hold quantities of several products; returns a reservation id, or None"""
+        wanted = {}
+        for product_id, quantity in (items.items() if isinstance(items, dict) else items):
+            if quantity <= 0:
+                raise ValueError(f"reserved quantity must be positive, got {quantity}")
+            wanted[product_id] = wanted.get(product_id, 0) + quantity
+        locks = self._acquire(wanted)
+        try:
+            on_hand, held = self.on_hand, self.held
+            for product_id, quantity in wanted.items():
+                if on_hand.get(product_id, 0) - held.get(product_id, 0) < quantity:
+                    return None
+            for product_id, quantity in wanted.items():
+                held[product_id] += quantity
+        finally:
+            self._release(locks)
+        reservation_id = next(self._reservation_ids)
+        self.reservations[reservation_id] = wanted
+        return reservation_id
+
+    def commit(self, reservation_id):
+        """Turn a reservation into a sale: the held stock leaves the store"""
+        self._finish(reservation_id, sold=True)
+
+    def cancel(self, reservation_id):
+        """Give the held stock back"""
+        self._finish(reservation_id, sold=False)
+
+    def _finish(self, reservation_id, sold):
+        wanted = self.reservations.pop(reservation_id)
+        locks = self._acquire(wanted)
+        try:
+            for product_id, quantity in wanted.items():
+                self.held[product_id] -= quantity
+                if sold:
+                    self.on_hand[product_id] -= quantity
+        finally:
+            self._release(locks)
+
+
+def run_store(num_products=1000, num_workers=8, orders_per_worker=5000, items_per_order=4,
+              num_stripes=64, initial_quantity=1000):
+    """Place random orders and reservations from several threads and check the totals."""
+    products = [f"product_{i}" for i in range(num_products)]
+    store = InventoryStore({p: initial_quantity for p in products}, num_stripes)
+    applied = [0] * num_workers
+
+    def worker(index):
+        rng = random.Random(index)
+        net = 0
+        for _ in range(orders_per_worker):
+            items = [(rng.choice(products), rng.choice([-5, -3, -1, 1, 3, 5]))
+                     for _ in range(items_per_order)]
+            if rng.random() < 0.2:
+                reservation = store.reserve([(p, abs(q)) for p, q in items])
+                if reservation is not None:
+                    if rng.random() < 0.5:
+                        store.commit(reservation)
+                        net -= sum(abs(q) for _, q in items)
+                    else:
+                        store.cancel(reservation)
+            elif store.update_many(items):
+                net += sum(q for _, q in items)
+        applied[index] = net
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    orders = num_workers * orders_per_worker
+    expected = num_products * initial_quantity + sum(applied)
+    final = sum(store.on_hand.values())
+    rate = f" ({orders / elapsed:,.0f} orders/sec)" if elapsed else ""
+    print(f"InventoryStore: {num_products} products in {num_stripes} stripes, {num_workers} threads")
+    print(f"Processed {orders} orders in {elapsed:.2f}s{rate}")
+    print(f"Total stock: {final} (expected {expected}), still held: {sum(store.held.values())}")
+    return final == expected and not any(store.held.values())
+
+
 def simulate_user_activity(inventory_system, product_id, num_operations):
     """Simulate a user performing multiple inventory updates."""
     for _ in range(num_operations):
@@ -1,6 +1,8 @@
 import threading
 import time
 import random
+import re
+from array import array
 from tabulate import tabulate
 import sys
 
@@ -87,6 +89,129 @@ class Theater:
             print("\nNo booking conflicts detected.")
 
 
+def row_label(row):
+    """1 -> A, 26 -> Z, 27 -> AA, ..."""
+    label = ""
+    while row:
+        row, rest = divmod(row - 1, 26)
+        label = chr(65 + rest) + label
+    return label
+
+
+# Attempt counters saturate at 255; this maps "tried more than once" to 1.
+_CONTESTED = bytes([0, 0] + [1] * 254)
+_ONE = re.compile(b"\x01")
+
+
+class SeatMap:
+    """Stadium-scale seating as flat per-seat arrays indexed by (row, seat).
+
+    ``free`` is a bytearray with one byte per seat (1 = available),
+    ``booked_by`` holds the booking user id, and ``attempts`` counts how
+    often each seat was tried.  Rows and seats are numbered from 1, as in
+    Theater, and seat ``(row, seat)`` is at index
+    ``(row - 1) * seats_per_row + seat - 1``.
+
+    A reservation walks the user's whole preference list inside one
+    critical section that does nothing but index into these arrays, so
+    check and book can never be separated.  Analysis works on whole arrays
+    with ``bytes.translate``/``count`` and a regex scan, i.e. in C.
+    """
+
+    def __init__(self, rows, seats_per_row):
+        self.rows = rows
+        self.seats_per_row = seats_per_row
+        size = rows * seats_per_row
+        self.free = bytearray(b"\x01") * size
+        self.booked_by = array('q', [0]) * size
+        self.attempts = bytearray(size)
+        self.lock = threading.Lock()
+
+    def index(self, row, seat):
+        if not (1 <= row <= self.rows and 1 <= seat <= self.seats_per_row):
+            raise IndexError(f"no seat ({row}, {seat})")
+        return (row - 1) * self.seats_per_row + seat - 1
+
+    def position(self, index):
+        row, seat = divmod(index, self.seats_per_row)
+        return row + 1, seat + 1
+
+    def label(self, index):
+        row, seat = self.position(index)
+        return f"{row_label(row)}{seat}"
+
+    def reserve_first_available(self, preferred_seats, user_id):
+        """Book the first free seat of ``preferred_seats`` ((row, seat) pairs).
+
+        Returns the booked (row, seat), or None if all of them were taken.
+        """
+        indexes = [self.index(row, seat) for row, seat in preferred_seats]
+        free, attempts = self.free, self.attempts
+        with self.lock:
+            for i in indexes:
+                if attempts[i] < 255:
+                    attempts[i] += 1
+                if free[i]:
+                    free[i] = 0
+                    self.booked_by[i] = user_id
+                    return self.position(i)
+        return None
+
+    def available_count(self):
+        return self.free.count(1)
+
+    def analyze(self):
+        """Summary of bookings and of seats that more than one user tried"""
+        start = time.perf_counter()
+        with self.lock:
+            free = bytes(self.free)
+            contested = self.attempts.translate(_CONTESTED)
+        contested_seats = [m.start() for m in _ONE.finditer(contested)]
+        elapsed = time.perf_counter() - start
+        return {
+            "seats": len(free),
+            "booked": len(free) - free.count(1),
+            "contested": len(contested_seats),
+            "contested_seats": contested_seats,
+            "analysis_seconds": elapsed,
+        }
+
+
+def run_stadium(rows=200, seats_per_row=500, num_users=200_000, num_threads=8, choices=3):
+    """Let users book one of a few neighbouring seats each and check the result"""
+    seat_map = SeatMap(rows, seats_per_row)
+    rng = random.Random(0)
+    requests = []
+    for user_id in range(1, num_users + 1):
+        row = rng.randint(1, rows)
+        first = rng.randint(1, seats_per_row - choices + 1)
+        requests.append((user_id, [(row, first + k) for k in range(choices)]))
+    booked = [0] * num_threads
+
+    def worker(index):
+        for user_id, preferred in requests[index::num_threads]:
+            if seat_map.reserve_first_available(preferred, user_id) is not None:
+                booked[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    summary = seat_map.analyze()
+    rate = f" ({num_users / elapsed:,.0f} requests/sec)" if elapsed else ""
+    print(f"SeatMap: {summary['seats']} seats, {num_users} users, {num_threads} threads{rate}")
+    print(f"Booked {summary['booked']} seats for {sum(booked)} successful users; "
+          f"{summary['contested']} seats were contested "
+          f"(analysis took {summary['analysis_seconds'] * 1000:.1f} ms)")
+    if summary["booked"] != sum(booked):
+        print("\n⚠️ CRITICAL ERROR: booked seats and successful users do not match!")
+    return summary["booked"] == sum(booked)
+
+
 def simulate_user(theater, user_id, target_seats):
     """Simulate a user trying to book one of several preferred seats"""
     for seat_id in target_seats:
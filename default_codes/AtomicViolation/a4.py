@@ -64,6 +64,143 @@ class ChatRoom:
         if self.intended_order.qsize() > 0:
             print(f"WARNING: {self.intended_order.qsize()} messages were not delivered!")
 
+class MessageSlot:
+    __slots__ = ("seq", "user_id", "content", "timestamp")
+
+    def __init__(self):
+        self.seq = -1
+        self.user_id = None
+        self.content = None
+        self.timestamp = 0.0
+
+
+class MessageLog:
+    """Append-only chat log; a message's position is its sequence number.
+
+    ``append`` takes the next number and fills the slot for it inside one
+    critical section, so positions are assigned exactly once and in the
+    order messages enter the log.  Slots are preallocated ``MessageSlot``
+    objects in a ring whose size is a power of two; the ring doubles when
+    full until it reaches ``max_capacity``, after which the oldest messages
+    are overwritten (and their slots reused).
+
+    Readers never copy the log: ``read`` copies out at most ``limit``
+    messages as ``(seq, user_id, content, timestamp)`` tuples, and
+    ``messages`` streams pages of them from a cursor.
+    """
+
+    def __init__(self, capacity=1024, max_capacity=1 << 20):
+        capacity = 1 << max(0, capacity - 1).bit_length()
+        self.max_capacity = max(capacity, max_capacity)
+        self.slots = [MessageSlot() for _ in range(capacity)]
+        self.mask = capacity - 1
+        self.first_seq = 0
+        self.next_seq = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def _grow(self):
+        old = self.slots
+        capacity = len(old) * 2
+        slots = [None] * capacity
+        mask = capacity - 1
+        for seq in range(self.first_seq, self.next_seq):
+            slots[seq & mask] = old[seq & self.mask]
+        for i, slot in enumerate(slots):
+            if slot is None:
+                slots[i] = MessageSlot()
+        self.slots = slots
+        self.mask = mask
+
+    def append(self, user_id, content):
+        """Add a message and return its position"""
+        with self.lock:
+            seq = self.next_seq
+            if seq - self.first_seq > self.mask:
+                if len(self.slots) < self.max_capacity:
+                    self._grow()
+                else:
+                    self.first_seq += 1
+            slot = self.slots[seq & self.mask]
+            slot.seq = seq
+            slot.user_id = user_id
+            slot.content = content
+            slot.timestamp = time.time()
+            self.next_seq = seq + 1
+        return seq
+
+    def read(self, cursor, limit=1000):
+        """Up to ``limit`` messages from position ``cursor`` on, and the next cursor.
+
+        A cursor older than the oldest retained message continues from it.
+        """
+        with self.lock:
+            start = max(cursor, self.first_seq)
+            end = min(self.next_seq, start + limit)
+            slots, mask = self.slots, self.mask
+            page = [(slot.seq, slot.user_id, slot.content, slot.timestamp)
+                    for slot in (slots[seq & mask] for seq in range(start, end))]
+        return page, end
+
+    def messages(self, cursor=0, page_size=1000):
+        """Yield messages from ``cursor`` up to the end of the log, a page at a time"""
+        while True:
+            page, cursor = self.read(cursor, page_size)
+            if not page:
+                return
+            yield from page
+
+    def display_messages(self, cursor=0, limit=None, page_size=1000, out=print):
+        """Print messages from ``cursor``; memory use does not grow with the log"""
+        shown = 0
+        second, clock = None, ""
+        for seq, user_id, content, timestamp in self.messages(cursor, page_size):
+            if limit is not None and shown >= limit:
+                break
+            # Messages arrive many per second; format each second once.
+            if int(timestamp) != second:
+                second = int(timestamp)
+                clock = time.strftime("%H:%M:%S", time.localtime(second))
+            out(f"#{seq} User {user_id} ({clock}.{int((timestamp - second) * 1e6):06d}): {content}")
+            shown += 1
+        return shown
+
+
+def run_message_log(num_users=16, messages_per_user=62_500, page_size=1000):
+    """Append from many threads, then check positions and page through the log"""
+    log = MessageLog()
+
+    def user(user_id):
+        for i in range(messages_per_user):
+            log.append(user_id, f"Message {i+1} from User {user_id}")
+
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(1, num_users + 1)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Positions must be dense, and each user's messages must keep their order.
+    expected_seq = 0
+    last_index = {}
+    out_of_order = 0
+    for seq, user_id, content, _ in log.messages(page_size=page_size):
+        index = int(content.split()[1])
+        if seq != expected_seq or index <= last_index.get(user_id, 0):
+            out_of_order += 1
+        expected_seq = seq + 1
+        last_index[user_id] = index
+    total = num_users * messages_per_user
+    rate = f" ({total / elapsed:,.0f} messages/sec)" if elapsed else ""
+    print(f"MessageLog: {len(log)} messages from {num_users} users{rate}")
+    print(f"Out-of-order or missing positions: {out_of_order}")
+    return out_of_order == 0 and len(log) == total
+
+
 def user_simulation(user_id, chat_room, num_messages):
     """Simulate a user sending multiple messages to the chat room"""
     for i in range(num_messages):
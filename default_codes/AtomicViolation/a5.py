@@ -36,6 +36,79 @@ class ThreadSafeCounter:
             'failure_rate': self.failed_operations / self.total_operations if self.total_operations > 0 else 0
         }
 
+class _Cell:
+    __slots__ = ('value', 'total_operations', 'failed_operations')
+
+    def __init__(self):
+        self.value = 0
+        self.total_operations = 0
+        self.failed_operations = 0
+
+
+class StripedCounter:
+    """Counter with one cell per thread, summed only when read (LongAdder-style).
+
+    Each thread increments its own cell, which no other thread writes, so
+    increments need no lock and threads never contend.  The only locked
+    operations are registering a thread's cell (once per thread) and
+    get_stats, which adds the cells up.  A read concurrent with increments
+    sees some of them, like any snapshot of a running counter; after the
+    writers are joined it is exact.
+    """
+
+    def __init__(self, error_rate: float = 0.0001):
+        self.error_rate = error_rate
+        self._cells: List[_Cell] = []
+        self._cells_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _new_cell(self) -> _Cell:
+        cell = self._local.cell = _Cell()
+        with self._cells_lock:
+            self._cells.append(cell)
+        return cell
+
+    def increment(self, thread_id: Optional[int] = None) -> None:
+        """Increment this thread's cell."""
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell.total_operations += 1
+        current_value = cell.value
+
+        if random.random() < self.error_rate:
+            time.sleep(0.01)
+            cell.failed_operations += 1
+
+        cell.value = current_value + 1
+
+    # Already safe; kept so callers can switch counters freely.
+    increment_safe = increment
+
+    @property
+    def value(self) -> int:
+        with self._cells_lock:
+            return sum(cell.value for cell in self._cells)
+
+    def get_stats(self) -> dict:
+        """Return counter statistics, merged over all cells."""
+        with self._cells_lock:
+            cells = list(self._cells)
+        value = sum(cell.value for cell in cells)
+        total = sum(cell.total_operations for cell in cells)
+        failed = sum(cell.failed_operations for cell in cells)
+        return {
+            'value': value,
+            'total_operations': total,
+            'failed_operations': failed,
+            'failure_rate': failed / total if total > 0 else 0
+        }
+
+
+COUNTER_MODES = ('unsafe', 'global_lock', 'striped')
+
+
 class ThreadManager:
     def __init__(self, counter: ThreadSafeCounter, num_threads: int = 10, iterations: int = 100):
         self.counter = counter
@@ -74,6 +147,34 @@ class ThreadManager:
         
         return stats
 
+    @classmethod
+    def compare_modes(cls, thread_counts=(1, 2, 4, 8, 16, 32, 64), total_increments: int = 200_000,
+                      error_rate: float = 0.0) -> List[dict]:
+        """Run run_demo for each counter mode and thread count and print a table.
+
+        The same total number of increments is split over the threads, so
+        times are directly comparable.
+        """
+        results = []
+        print(f"\n{'threads':>7} {'mode':<12} {'time (s)':>9} {'incr/sec':>12} {'value':>9} {'lost':>7}")
+        for num_threads in thread_counts:
+            iterations = total_increments // num_threads
+            for mode in COUNTER_MODES:
+                if mode == 'striped':
+                    counter = StripedCounter(error_rate=error_rate)
+                else:
+                    counter = ThreadSafeCounter(error_rate=error_rate)
+                manager = cls(counter, num_threads=num_threads, iterations=iterations)
+                stats = manager.run_demo(use_safe_method=(mode == 'global_lock'))
+                expected = num_threads * iterations
+                elapsed = stats['execution_time']
+                rate = f"{expected / elapsed:,.0f}" if elapsed else "-"
+                stats.update(mode=mode, threads=num_threads, lost_updates=expected - stats['value'])
+                results.append(stats)
+                print(f"{num_threads:>7} {mode:<12} {elapsed:>9.3f} {rate:>12} "
+                      f"{stats['value']:>9} {stats['lost_updates']:>7}")
+        return results
+
 if __name__ == "__main__":
     counter = ThreadSafeCounter(error_rate=0.1)
     manager = ThreadManager(counter)
@@ -85,3 +186,10 @@ if __name__ == "__main__":
     manager = ThreadManager(counter)
     safe_results = manager.run_demo(use_safe_method=True)
     print("\nSafe Version Results:", safe_results)
+
+    counter = StripedCounter(error_rate=0.1)
+    manager = ThreadManager(counter)
+    striped_results = manager.run_demo()
+    print("\nStriped Version Results:", striped_results)
+
+    ThreadManager.compare_modes()
@@ -71,8 +71,170 @@ class BankSys:
         thread_a.join(timeout)
         thread_b.join(timeout)
 
+class TransactionAborted(Exception):
+    pass
+
+
+class TransactionEngine:
+    """Atomic transactions over any subset of N accounts, free of deadlock.
+
+    A transaction names the accounts it touches and a body that edits a
+    private copy of their balances.  The engine locks those accounts, runs
+    the body and then either writes every new balance back (commit) or
+    none of them (roll back: the body raised, or a balance would go
+    negative).
+
+    Locks are taken in one of two deadlock-free ways:
+
+    * ``"ordered"`` -- always in ascending account id, so no two
+      transactions can each hold a lock the other wants;
+    * ``"backoff"`` -- try-lock in the order given; on the first failure
+      release everything, sleep a random time up to an exponentially
+      growing bound (capped at ``max_backoff``) and start again.  After
+      ``max_attempts`` tries the transaction is aborted.
+    """
+
+    STRATEGIES = ("ordered", "backoff")
+
+    def __init__(self, num_accounts, initial_balance=1000, strategy="ordered",
+                 max_attempts=20, base_backoff=0.0001, max_backoff=0.01):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"strategy must be one of {self.STRATEGIES}, not {strategy!r}")
+        self.accounts = [BankAccount(i, initial_balance) for i in range(num_accounts)]
+        self.strategy = strategy
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.stats_lock = threading.Lock()
+        self.stats = {"committed": 0, "rolled_back": 0, "gave_up": 0, "lock_conflicts": 0}
+
+    def _count(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def _lock_ordered(self, accounts):
+        accounts = sorted(accounts, key=lambda a: a.account_id)
+        for account in accounts:
+            account.lock.acquire()
+        return accounts
+
+    def _lock_with_backoff(self, accounts):
+        for attempt in range(self.max_attempts):
+            held = []
+            for account in accounts:
+                if not account.lock.acquire(blocking=False):
+                    break
+                held.append(account)
+            else:
+                return held
+            for account in reversed(held):
+                account.lock.release()
+            self._count("lock_conflicts")
+            bound = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+            time.sleep(random.uniform(0, bound))
+        return None
+
+    def execute(self, account_ids, body):
+        """Run ``body(balances)`` atomically; return True if it committed.
+
+        ``balances`` maps each account id to its balance and may be changed
+        in place.  Raising TransactionAborted (or anything else) from the
+        body rolls the transaction back; other exceptions are re-raised.
+        """
+        accounts = [self.accounts[i] for i in dict.fromkeys(account_ids)]
+        if self.strategy == "ordered":
+            held = self._lock_ordered(accounts)
+        else:
+            held = self._lock_with_backoff(accounts)
+            if held is None:
+                self._count("gave_up")
+                return False
+        try:
+            balances = {a.account_id: a.balance for a in accounts}
+            try:
+                body(balances)
+            except TransactionAborted:
+                self._count("rolled_back")
+                return False
+            except Exception:
+                self._count("rolled_back")
+                raise
+            if any(balances[a.account_id] < 0 for a in accounts):
+                self._count("rolled_back")
+                return False
+            for account in accounts:
+                account.balance = balances[account.account_id]
+            self._count("committed")
+            return True
+        finally:
+            for account in reversed(held):
+                account.lock.release()
+
+    def transfer(self, changes):
+        """Apply {account_id: amount} changes as one transaction"""
+        def body(balances):
+            for account_id, amount in changes.items():
+                balances[account_id] += amount
+        return self.execute(changes, body)
+
+    def total_balance(self):
+        held = self._lock_ordered(self.accounts)
+        try:
+            return sum(a.balance for a in self.accounts)
+        finally:
+            for account in reversed(held):
+                account.lock.release()
+
+
+def run_engine(strategy="ordered", num_accounts=50, num_threads=32, transactions_per_thread=300,
+               max_accounts_per_transaction=5, timeout=60):
+    """Run random multi-account transfers concurrently and report the outcome"""
+    engine = TransactionEngine(num_accounts, strategy=strategy)
+    initial_total = engine.total_balance()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(transactions_per_thread):
+            ids = rng.sample(range(num_accounts), rng.randint(2, max_accounts_per_transaction))
+            amounts = [rng.randint(1, 300) for _ in ids[1:]]
+            # The first account pays everyone else, so the total is unchanged.
+            changes = dict(zip(ids[1:], amounts))
+            changes[ids[0]] = -sum(amounts)
+            engine.transfer(changes)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+    elapsed = time.perf_counter() - start
+    stuck = sum(thread.is_alive() for thread in threads)
+
+    stats = dict(engine.stats)
+    total = num_threads * transactions_per_thread
+    finished = stats["committed"] + stats["rolled_back"] + stats["gave_up"]
+    rate = f" ({finished / elapsed:,.0f}/sec)" if elapsed else ""
+    print(f"\n--- Transaction engine ({strategy}): {num_accounts} accounts, {num_threads} threads ---")
+    print(f"Finished {finished} of {total} transactions in {elapsed:.2f}s{rate}")
+    print(f"Committed: {stats['committed']}, rolled back: {stats['rolled_back']}, "
+          f"gave up: {stats['gave_up']} (abort rate {(finished - stats['committed']) / max(finished, 1):.1%}), "
+          f"lock conflicts: {stats['lock_conflicts']}")
+    if stuck:
+        print(f"Potential Deadlock Detected! {stuck} threads still blocked")
+    else:
+        final_total = engine.total_balance()
+        print(f"Total balance: {final_total} (initial {initial_total})")
+    stats.update(threads_stuck=stuck, elapsed=elapsed)
+    return stats
+
+
 if __name__ == "__main__":
     for i in range(5):
         print(f"\n--- Simulation {i+1} ---")
         simulation = BankSys(deadlock_probability=0.4)
         simulation.run_simulation()
+
+    for strategy in TransactionEngine.STRATEGIES:
+        run_engine(strategy)
@@ -1,6 +1,8 @@
+import asyncio
 import threading
 import time
 import random
+import tracemalloc
 
 class Intersection:
     def __init__(self):
@@ -57,5 +59,156 @@ def simulate_traffic():
         
     print(f"terminated")
 
+class SignalledIntersection:
+    """Intersection controlled by a signal instead of two locks.
+
+    Each axis has ``lanes`` lanes.  Cars queue FIFO for a lane of their
+    axis, wait in it for green and then spend the crossing time inside;
+    the signal switches every ``phase_time`` seconds, with an all-red
+    phase until the cars admitted on the old green are out, so the two
+    axes never occupy the intersection together.  Only lane holders wait
+    on the light, so a change of phase wakes at most ``lanes`` cars.
+    A car holds at most one intersection's lane at a time and never waits
+    for another intersection while holding one, so there is no
+    hold-and-wait and the grid cannot deadlock.
+    """
+
+    AXES = ('north_south', 'east_west')
+
+    def __init__(self, row, col, lanes=2, phase_time=0.02):
+        self.row = row
+        self.col = col
+        self.phase_time = phase_time
+        # One event per axis, set while that axis has green.
+        self.go = {axis: asyncio.Event() for axis in self.AXES}
+        self.go[self.AXES[(row + col) % 2]].set()
+        self.lanes = {axis: asyncio.Semaphore(lanes) for axis in self.AXES}
+        # Cars inside per axis, and an event set while that count is zero.
+        self.inside = {axis: 0 for axis in self.AXES}
+        self.empty = {axis: asyncio.Event() for axis in self.AXES}
+        for event in self.empty.values():
+            event.set()
+
+    async def run_signal(self, stop):
+        north_south, east_west = self.AXES
+        while not stop.is_set():
+            await asyncio.sleep(self.phase_time)
+            old, new = (north_south, east_west) if self.go[north_south].is_set() else (east_west, north_south)
+            self.go[old].clear()
+            # All red until the intersection is clear of the old axis.
+            await self.empty[old].wait()
+            self.go[new].set()
+
+    async def cross(self, axis, crossing_time):
+        """Wait for green on ``axis``, then spend ``crossing_time`` inside"""
+        go = self.go[axis]
+        async with self.lanes[axis]:
+            # The light may have turned red again before this car got to run.
+            while not go.is_set():
+                await go.wait()
+            self.inside[axis] += 1
+            self.empty[axis].clear()
+            try:
+                await asyncio.sleep(crossing_time)
+            finally:
+                self.inside[axis] -= 1
+                if not self.inside[axis]:
+                    self.empty[axis].set()
+
+
+class TrafficGrid:
+    """rows x cols signalled intersections; cars drive straight across"""
+
+    def __init__(self, rows=10, cols=10, lanes=2, phase_time=0.02):
+        self.rows = rows
+        self.cols = cols
+        self.intersections = [[SignalledIntersection(r, c, lanes, phase_time) for c in range(cols)]
+                              for r in range(rows)]
+        # Cars on the same line share one route tuple.
+        self.routes = {}
+        for c in range(cols):
+            column = tuple(row[c] for row in self.intersections)
+            self.routes['South', c] = column
+            self.routes['North', c] = column[::-1]
+        for r, row in enumerate(self.intersections):
+            self.routes['East', r] = tuple(row)
+            self.routes['West', r] = tuple(row[::-1])
+
+    def route(self, direction, line):
+        """Intersections met by a car entering on ``line`` heading ``direction``"""
+        lines = self.cols if direction in ('North', 'South') else self.rows
+        return self.routes[direction, line % lines]
+
+
+async def drive(route, axis, arrival, stats, crossing_time, segment_time):
+    await arrival.wait()
+    started = time.perf_counter()
+    for intersection in route:
+        await intersection.cross(axis, crossing_time)
+        await asyncio.sleep(segment_time)
+    stats['finished'] += 1
+    stats['travel_time'] += time.perf_counter() - started
+
+
+async def simulate_grid(num_cars, rows, cols, lanes, phase_time, crossing_time, segment_time,
+                        arrival_window, seed, arrival_step=0.01):
+    rng = random.Random(seed)
+    grid = TrafficGrid(rows, cols, lanes, phase_time)
+    stop = asyncio.Event()
+    signals = [asyncio.create_task(i.run_signal(stop)) for row in grid.intersections for i in row]
+    stats = {'finished': 0, 'travel_time': 0.0}
+    # Cars arriving in the same arrival_step share one event rather than
+    # each keeping its own timer.
+    arrivals = [asyncio.Event() for _ in range(max(1, int(arrival_window / arrival_step)))]
+    directions = ['North', 'South', 'East', 'West']
+
+    before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    cars = []
+    for _ in range(num_cars):
+        direction = rng.choice(directions)
+        axis = 'north_south' if direction in ('North', 'South') else 'east_west'
+        route = grid.route(direction, rng.randrange(rows if axis == 'east_west' else cols))
+        cars.append(asyncio.create_task(drive(route, axis, rng.choice(arrivals), stats,
+                                              crossing_time, segment_time)))
+    # Let every car reach its first await so that its frame exists.
+    await asyncio.sleep(0)
+    bytes_per_car = None
+    if before is not None:
+        bytes_per_car = (tracemalloc.get_traced_memory()[0] - before) / max(num_cars, 1)
+        tracemalloc.stop()
+
+    for arrival in arrivals:
+        arrival.set()
+        await asyncio.sleep(arrival_step)
+    await asyncio.gather(*cars)
+    stop.set()
+    await asyncio.gather(*signals)
+    stats['bytes_per_car'] = bytes_per_car
+    return stats
+
+
+def run_grid(num_cars=20000, rows=10, cols=10, lanes=2, phase_time=0.02, crossing_time=0.001,
+             segment_time=0.002, arrival_window=2.0, seed=0, measure_memory=True):
+    """Drive num_cars coroutine cars across a signalled grid and report throughput"""
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        stats = asyncio.run(simulate_grid(num_cars, rows, cols, lanes, phase_time, crossing_time,
+                                          segment_time, arrival_window, seed))
+    finally:
+        tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+
+    rate = f" ({stats['finished'] / elapsed:,.0f} cars/sec)" if elapsed else ""
+    print(f"Grid {rows}x{cols}: {stats['finished']} of {num_cars} cars passed in {elapsed:.2f}s{rate}")
+    if stats['finished']:
+        print(f"Average travel time: {stats['travel_time'] / stats['finished']:.3f}s")
+    if stats['bytes_per_car'] is not None:
+        print(f"Memory per waiting car: ~{stats['bytes_per_car']:.0f} bytes")
+    stats['elapsed'] = elapsed
+    return stats
+
+
 if __name__ == "__main__":
     simulate_traffic()
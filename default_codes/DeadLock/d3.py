@@ -2,8 +2,12 @@ import threading
 import time
 import random
 import logging
+from collections import deque
+from itertools import count
 
-logging.basicConfig(level=logging.INFO, format='%(message)s')
+from harness import asynclog, report
+
+asynclog.basic_config(level=logging.INFO, format='%(message)s')
 
 class DatabaseRecord:
     def __init__(self, record_id):
@@ -64,5 +68,257 @@ def simulate_database_transactions(num_transactions=50):
     for record in manager.records:
         logging.info(f"Record {record.record_id}: Value = {record.value}")
 
+SHARED = "S"
+EXCLUSIVE = "X"
+# Restart pauses grow exponentially from RESTART_BACKOFF (or op_time, if
+# longer) up to RESTART_BACKOFF_CAP, so aborts back off even when op_time is 0.
+RESTART_BACKOFF = 0.0001
+RESTART_BACKOFF_CAP = 0.05
+
+
+class TransactionAborted(Exception):
+    pass
+
+
+class LockTableTransaction:
+    """Per-transaction state seen by the lock manager.
+
+    ``timestamp`` orders transactions by age (smaller is older) and is kept
+    across restarts, so an aborted transaction eventually becomes the
+    oldest and cannot starve.
+    """
+
+    __slots__ = ("txn_id", "timestamp", "held", "aborted", "wakeup", "request")
+
+    def __init__(self, txn_id, timestamp):
+        self.txn_id = txn_id
+        self.timestamp = timestamp
+        self.held = {}
+        self.aborted = False
+        self.wakeup = threading.Event()
+        self.request = None
+
+
+class _LockRequest:
+    __slots__ = ("txn", "mode", "granted")
+
+    def __init__(self, txn, mode):
+        self.txn = txn
+        self.mode = mode
+        self.granted = False
+
+
+class _LockEntry:
+    __slots__ = ("holders", "queue")
+
+    def __init__(self):
+        self.holders = {}
+        self.queue = deque()
+
+
+def _compatible(mode, other):
+    return mode == SHARED and other == SHARED
+
+
+class LockManager:
+    """Lock table keyed by record id, with shared and exclusive modes.
+
+    Entries exist only while a record is locked or waited for, so the table
+    costs nothing for idle records.  Record ids are spread over
+    ``num_stripes`` mutexes that guard the table itself; a transaction that
+    has to wait blocks on its own event outside every mutex, and is woken
+    when its request is granted or when it is aborted.  Waiters are granted
+    in FIFO order.
+
+    Deadlock is prevented by timestamps instead of being detected:
+
+    * ``wait-die``: an older requester waits for younger blockers; a
+      younger one aborts (dies) at once.
+    * ``wound-wait``: an older requester aborts (wounds) younger blockers
+      and waits for them to release; a younger one waits.
+
+    Blockers are the conflicting holders and the conflicting requests
+    already queued, so every wait edge points the same way in age and no
+    cycle can form.
+    """
+
+    POLICIES = ("wait-die", "wound-wait")
+
+    def __init__(self, policy="wait-die", num_stripes=64):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}, not {policy!r}")
+        self.policy = policy
+        self.num_stripes = num_stripes
+        self.stripes = [threading.Lock() for _ in range(num_stripes)]
+        self.tables = [{} for _ in range(num_stripes)]
+
+    def acquire(self, txn, record_id, mode):
+        """Lock ``record_id`` for ``txn``; raises TransactionAborted if it must abort"""
+        held = txn.held.get(record_id)
+        if held == EXCLUSIVE or held == mode:
+            return
+        stripe = record_id % self.num_stripes
+        wounded = []
+        with self.stripes[stripe]:
+            # Clear before looking at ``aborted``: a wound that lands after the
+            # check then leaves the event set, so the wait below cannot miss it.
+            txn.wakeup.clear()
+            if txn.aborted:
+                raise TransactionAborted(f"transaction {txn.txn_id} was wounded")
+            table = self.tables[stripe]
+            entry = table.get(record_id)
+            if entry is None:
+                entry = table[record_id] = _LockEntry()
+            blockers = [t for t, m in entry.holders.items()
+                        if t is not txn and not _compatible(mode, m)]
+            blockers += [r.txn for r in entry.queue
+                         if r.txn is not txn and not _compatible(mode, r.mode)]
+            if not blockers:
+                entry.holders[txn] = mode
+                txn.held[record_id] = mode
+                return
+            if self.policy == "wait-die":
+                if any(b.timestamp < txn.timestamp for b in blockers):
+                    if not entry.holders and not entry.queue:
+                        del table[record_id]
+                    raise TransactionAborted(f"transaction {txn.txn_id} died on record {record_id}")
+            else:
+                for blocker in blockers:
+                    if blocker.timestamp > txn.timestamp and not blocker.aborted:
+                        blocker.aborted = True
+                        wounded.append(blocker)
+            request = _LockRequest(txn, mode)
+            entry.queue.append(request)
+            txn.request = request
+        for victim in wounded:
+            victim.wakeup.set()
+        while True:
+            txn.wakeup.wait()
+            txn.wakeup.clear()
+            with self.stripes[stripe]:
+                if request.granted:
+                    txn.request = None
+                    txn.held[record_id] = mode
+                    return
+                if txn.aborted:
+                    entry.queue.remove(request)
+                    txn.request = None
+                    self._grant(entry)
+                    if not entry.holders and not entry.queue:
+                        del self.tables[stripe][record_id]
+                    raise TransactionAborted(f"transaction {txn.txn_id} was wounded")
+
+    def _grant(self, entry):
+        """Grant queued requests from the head while they fit; caller holds the stripe"""
+        queue, holders = entry.queue, entry.holders
+        while queue:
+            request = queue[0]
+            others = [m for t, m in holders.items() if t is not request.txn]
+            if any(not _compatible(request.mode, m) for m in others):
+                return
+            queue.popleft()
+            holders[request.txn] = request.mode
+            request.granted = True
+            request.txn.wakeup.set()
+
+    def release_all(self, txn):
+        """Release every lock of ``txn`` (commit or abort)"""
+        by_stripe = {}
+        for record_id in txn.held:
+            by_stripe.setdefault(record_id % self.num_stripes, []).append(record_id)
+        for stripe, record_ids in by_stripe.items():
+            with self.stripes[stripe]:
+                table = self.tables[stripe]
+                for record_id in record_ids:
+                    entry = table[record_id]
+                    del entry.holders[txn]
+                    self._grant(entry)
+                    if not entry.holders and not entry.queue:
+                        del table[record_id]
+        txn.held.clear()
+
+
+def run_lock_table(policy="wait-die", num_records=100_000, num_threads=1000, transactions_per_thread=10,
+                   ops_per_transaction=(2, 8), hot_records=1000, hot_probability=0.5,
+                   write_probability=0.5, op_time=0.0005):
+    """Run concurrent read/write transactions through a LockManager and report per policy.
+
+    Half of all accesses (``hot_probability``) go to the first ``hot_records``
+    records so that transactions actually conflict.  Writes are buffered and
+    applied only at commit, so an aborted attempt leaves no trace.
+    """
+    manager = LockManager(policy)
+    values = [0] * num_records
+    timestamps = count()
+    stats_lock = threading.Lock()
+    stats = {"committed": 0, "aborted": 0, "written": 0}
+
+    def pick(rng):
+        if rng.random() < hot_probability:
+            return rng.randrange(hot_records)
+        return rng.randrange(num_records)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        committed = aborted = written = 0
+        for _ in range(transactions_per_thread):
+            plan = [(pick(rng), rng.random() < write_probability)
+                    for _ in range(rng.randint(*ops_per_transaction))]
+            txn = LockTableTransaction(seed, next(timestamps))
+            for attempt in count(1):
+                writes = {}
+                try:
+                    for record_id, write in plan:
+                        manager.acquire(txn, record_id, EXCLUSIVE if write else SHARED)
+                        if write:
+                            writes[record_id] = writes.get(record_id, 0) + 1
+                        else:
+                            values[record_id]
+                        time.sleep(op_time)
+                    if txn.aborted:
+                        raise TransactionAborted(f"transaction {txn.txn_id} was wounded")
+                    for record_id, delta in writes.items():
+                        values[record_id] += delta
+                    committed += 1
+                    written += sum(writes.values())
+                    break
+                except TransactionAborted:
+                    aborted += 1
+                finally:
+                    manager.release_all(txn)
+                # Restart with the same timestamp, pausing longer after each abort.
+                txn.aborted = False
+                backoff = max(op_time, RESTART_BACKOFF) * (1 << min(attempt, 16))
+                time.sleep(rng.uniform(0, min(backoff, RESTART_BACKOFF_CAP)))
+        with stats_lock:
+            stats["committed"] += committed
+            stats["aborted"] += aborted
+            stats["written"] += written
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    attempts = stats["committed"] + stats["aborted"]
+    rate = report.rate(stats['committed'], elapsed, "commits")
+    print(f"\n--- Lock table ({policy}): {num_records} records, {num_threads} threads ---")
+    print(f"Committed {stats['committed']} transactions in {elapsed:.2f}s{rate}")
+    print(f"Aborted attempts: {stats['aborted']} (abort rate {stats['aborted'] / max(attempts, 1):.1%})")
+    consistent = sum(values) == stats["written"]
+    print(f"Committed writes: {stats['written']}, record values sum: {sum(values)}"
+          f"{'' if consistent else '  <-- MISMATCH'}")
+    stats.update(elapsed=elapsed, consistent=consistent)
+    return stats
+
+
+def compare_lock_policies(**kwargs):
+    return {policy: run_lock_table(policy, **kwargs) for policy in LockManager.POLICIES}
+
+
 if __name__ == "__main__":
     simulate_database_transactions()
+    compare_lock_policies()
@@ -1,9 +1,13 @@
 import threading
 import time
 import random
-from typing import Dict, List
+from typing import Dict, List, Optional
+import json
 import logging
 
+from harness import asynclog, report
+from harness.lockstats import LogHistogram
+
 class Resource:
     def __init__(self, name: str, value: int = 100):
         self.name = name
@@ -11,6 +15,252 @@ class Resource:
         self.lock = threading.Lock()
         self.is_available = True
 
+class _Claim:
+    __slots__ = ("worker", "maximum", "allocation", "need", "short")
+
+    def __init__(self, worker: str, maximum: Dict[str, int]):
+        self.worker = worker
+        self.maximum = dict(maximum)
+        self.allocation: Dict[str, int] = {}
+        self.need = {name: units for name, units in maximum.items() if units}
+        # Number of resource types whose free units are below ``need``.
+        self.short = 0
+
+
+class _PendingRequest:
+    __slots__ = ("claim", "amounts", "start_ns", "granted", "event")
+
+    def __init__(self, claim: _Claim, amounts: Dict[str, int], start_ns: int):
+        self.claim = claim
+        self.amounts = amounts
+        self.start_ns = start_ns
+        self.granted = False
+        self.event = threading.Event()
+
+
+class BankersAdmission:
+    """Banker's-algorithm admission control over units of named resources.
+
+    Workers declare their maximum claim with :meth:`register` before asking
+    for anything.  A request is granted only if the units are free and the
+    state after granting it is safe, meaning every worker can still get its
+    whole claim in some order.  Otherwise it waits until a release makes it
+    grantable.
+
+    The safety check is incremental rather than a pass over workers x
+    resource types:
+
+    * every claim keeps count of the resource types it is short of, updated
+      only for the claimants of a type whose free units change, and the
+      holders short of nothing are kept in a set;
+    * a request that leaves the requester short of nothing is safe at once;
+    * otherwise the reduction starts from that set, and returning a
+      finished holder's units only revisits the claimants of those types;
+    * it stops as soon as the requester could finish.  The state before the
+      grant was safe, and once the requester has finished the rest is that
+      safe state minus finished workers, so the others can finish too.
+
+    Releases grant waiting requests themselves, so waiters are woken only
+    when their request has gone through.
+    """
+
+    def __init__(self, capacities: Dict[str, int]):
+        self.capacities = dict(capacities)
+        self.available = dict(capacities)
+        self.claims: Dict[str, _Claim] = {}
+        self.claimants: Dict[str, List[_Claim]] = {name: [] for name in capacities}
+        self.can_finish = set()
+        self.waiting: List[_PendingRequest] = []
+        self.mutex = threading.Lock()
+        self.grant_latency = LogHistogram()
+        self.granted = 0
+        self.queued = 0
+        self.timed_out = 0
+        self.safety_checks = 0
+        self.unsafe = 0
+        self.started = time.perf_counter()
+
+    def add_resource(self, name: str, units: int = 1):
+        with self.mutex:
+            if name in self.capacities:
+                raise ValueError(f"resource {name} already exists")
+            self.capacities[name] = units
+            self.available[name] = units
+            self.claimants[name] = []
+
+    def register(self, worker: str, maximum: Dict[str, int]):
+        with self.mutex:
+            for name, units in maximum.items():
+                if units > self.capacities.get(name, 0):
+                    raise ValueError(f"{worker} claims {units} {name}, capacity is "
+                                     f"{self.capacities.get(name, 0)}")
+            if worker in self.claims:
+                raise ValueError(f"{worker} is already registered")
+            claim = self.claims[worker] = _Claim(worker, maximum)
+            for name, units in claim.need.items():
+                self.claimants[name].append(claim)
+                if units > self.available[name]:
+                    claim.short += 1
+
+    def unregister(self, worker: str):
+        with self.mutex:
+            claim = self.claims[worker]
+            if claim.allocation:
+                raise ValueError(f"{worker} still holds {claim.allocation}")
+            del self.claims[worker]
+            for name in claim.maximum:
+                if claim in self.claimants.get(name, ()):
+                    self.claimants[name].remove(claim)
+
+    def request(self, worker: str, amounts: Dict[str, int], timeout: Optional[float] = None) -> bool:
+        """Wait until ``amounts`` can be granted safely; False if ``timeout`` ran out"""
+        amounts = {name: units for name, units in amounts.items() if units}
+        if not amounts:
+            # Nothing to move, and an unchanged state is as safe as it was.
+            return True
+        with self.mutex:
+            claim = self.claims[worker]
+            for name, units in amounts.items():
+                if units > claim.need.get(name, 0):
+                    raise ValueError(f"{worker} asked for {units} {name} beyond its maximum claim")
+            start_ns = time.perf_counter_ns()
+            if self._try_grant(claim, amounts):
+                self.grant_latency.add(time.perf_counter_ns() - start_ns)
+                return True
+            pending = _PendingRequest(claim, amounts, start_ns)
+            self.waiting.append(pending)
+            self.queued += 1
+        pending.event.wait(timeout)
+        with self.mutex:
+            if pending.granted:
+                return True
+            self.waiting.remove(pending)
+            self.timed_out += 1
+            return False
+
+    def release(self, worker: str, amounts: Optional[Dict[str, int]] = None):
+        """Give back ``amounts`` (everything held by default)"""
+        with self.mutex:
+            claim = self.claims[worker]
+            allocation = claim.allocation
+            if amounts is None:
+                amounts = dict(allocation)
+            for name, units in amounts.items():
+                if units > allocation.get(name, 0):
+                    raise ValueError(f"{worker} releases {units} {name} but holds "
+                                     f"{allocation.get(name, 0)}")
+            for name, units in amounts.items():
+                self._move(claim, name, -units)
+            if self.waiting:
+                self._grant_waiting()
+
+    def _move(self, claim: _Claim, name: str, units: int):
+        """Move ``units`` of ``name`` from the pool to ``claim`` (back if negative)"""
+        available = self.available
+        before = available[name]
+        claimants = self.claimants[name]
+        was_short = [c.need.get(name, 0) > before for c in claimants]
+        allocation, need = claim.allocation, claim.need
+        held = allocation.get(name, 0) + units
+        if held:
+            allocation[name] = held
+        else:
+            del allocation[name]
+        left = need.get(name, 0) - units
+        if left:
+            need[name] = left
+        else:
+            del need[name]
+        after = available[name] = before - units
+        for other, was in zip(claimants, was_short):
+            if (other.need.get(name, 0) > after) != was:
+                other.short += -1 if was else 1
+                if other is not claim:
+                    self._track(other)
+        self._track(claim)
+
+    def _track(self, claim: _Claim):
+        if claim.short or not claim.allocation:
+            self.can_finish.discard(claim)
+        else:
+            self.can_finish.add(claim)
+
+    def _try_grant(self, claim: _Claim, amounts: Dict[str, int]) -> bool:
+        available = self.available
+        for name, units in amounts.items():
+            if units > available[name]:
+                return False
+        for name, units in amounts.items():
+            self._move(claim, name, units)
+        if self._is_safe(claim):
+            self.granted += 1
+            return True
+        for name, units in amounts.items():
+            self._move(claim, name, -units)
+        self.unsafe += 1
+        return False
+
+    def _is_safe(self, requester: _Claim) -> bool:
+        self.safety_checks += 1
+        if not requester.short:
+            return True
+        # Reduction: finish holders that are short of nothing and return
+        # their units; a claimant of a returned type that stops being short
+        # of it counts down, and joins the finishers at zero.  Finished
+        # holders are never short again, since the pool only grows.
+        available = self.available
+        claimants = self.claimants
+        returned = {}
+        shortfalls = {}
+        ready = list(self.can_finish)
+        while ready:
+            claim = ready.pop()
+            if claim is requester:
+                return True
+            for name, units in claim.allocation.items():
+                before = available[name] + returned.get(name, 0)
+                after = before + units
+                returned[name] = after - available[name]
+                for other in claimants[name]:
+                    need = other.need.get(name, 0)
+                    if before < need <= after and other.allocation:
+                        short = shortfalls.get(other, other.short) - 1
+                        shortfalls[other] = short
+                        if not short:
+                            ready.append(other)
+        return False
+
+    def _grant_waiting(self):
+        now_ns = time.perf_counter_ns()
+        still_waiting = []
+        for pending in self.waiting:
+            if self._try_grant(pending.claim, pending.amounts):
+                self.grant_latency.add(now_ns - pending.start_ns)
+                pending.granted = True
+                pending.event.set()
+            else:
+                still_waiting.append(pending)
+        self.waiting = still_waiting
+
+    def metrics(self) -> dict:
+        """Counters, grant throughput and the grant latency histogram, JSON-ready"""
+        with self.mutex:
+            elapsed = time.perf_counter() - self.started
+            return {
+                "workers": len(self.claims),
+                "resource_types": len(self.capacities),
+                "granted": self.granted,
+                "queued": self.queued,
+                "timed_out": self.timed_out,
+                "waiting": len(self.waiting),
+                "safety_checks": self.safety_checks,
+                "unsafe": self.unsafe,
+                "elapsed_s": elapsed,
+                "grants_per_sec": self.granted / elapsed if elapsed else 0.0,
+                "grant_latency": self.grant_latency.to_dict(),
+            }
+
+
 class Worker(threading.Thread):
     def __init__(self, name: str, resources: List[Resource], manager):
         super().__init__()
@@ -30,8 +280,11 @@ class Worker(threading.Thread):
                 logging.error(f"Worker {self.name} encountered error: {e}")
 
     def acquire_resources(self):
+        admission = self.manager.admission
         for resource in self.resources:
             logging.info(f"Worker {self.name} attempting to acquire {resource.name}")
+            if admission is not None:
+                admission.request(self.name, {resource.name: 1})
             resource.lock.acquire()
             self.resources_held.append(resource)
             resource.is_available = False
@@ -48,17 +301,23 @@ class Worker(threading.Thread):
             resource.is_available = True
             resource.lock.release()
             logging.info(f"Worker {self.name} released {resource.name}")
+        if self.manager.admission is not None and self.resources_held:
+            self.manager.admission.release(self.name)
         self.resources_held.clear()
 
 class ResourceManager:
-    def __init__(self):
+    def __init__(self, admission: bool = False):
         self.resources: Dict[str, Resource] = {}
         self.workers: List[Worker] = []
         self.is_running = True
+        # With admission control every resource is one unit and each worker
+        # claims its resource list up front, so the differing lock orders
+        # below can no longer deadlock.
+        self.admission = BankersAdmission({}) if admission else None
         self.setup_logging()
 
     def setup_logging(self):
-        logging.basicConfig(
+        asynclog.basic_config(
             level=logging.INFO,
             format='%(asctime)s - %(message)s',
             datefmt='%H:%M:%S'
@@ -66,11 +325,15 @@ class ResourceManager:
 
     def create_resource(self, name: str, initial_value: int = 100):
         self.resources[name] = Resource(name, initial_value)
+        if self.admission is not None:
+            self.admission.add_resource(name)
         logging.info(f"Created resource {name}")
 
     def create_worker(self, name: str, resource_names: List[str]):
         resources = [self.resources[name] for name in resource_names]
         worker = Worker(name, resources, self)
+        if self.admission is not None:
+            self.admission.register(name, {resource_name: 1 for resource_name in resource_names})
         self.workers.append(worker)
         return worker
 
@@ -89,8 +352,62 @@ class ResourceManager:
             for name, resource in self.resources.items():
                 status = "Available" if resource.is_available else "In use"
                 logging.info(f"Resource {name}: Value={resource.value}, Status={status}")
+            if self.admission is not None:
+                metrics = self.admission.metrics()
+                logging.info(f"Admission: {metrics['granted']} granted, {metrics['waiting']} waiting, "
+                             f"grant latency p99 {metrics['grant_latency']['p99_ns'] / 1e6:.2f}ms")
             time.sleep(1)
 
+def run_admission(num_types=200, num_workers=200, rounds=20, claim_types=4, units_per_type=4,
+                  max_units=3, hold_time=0.001, metrics_path=None, seed=1):
+    """Workers claim up to ``max_units`` of ``claim_types`` resource types each and request them piecemeal.
+
+    Every worker takes its claim in random order, one type at a time, holds
+    it briefly and releases everything, ``rounds`` times.  Without admission
+    control this is a textbook deadlock; with it every round completes.
+    Prints throughput and grant latency and returns the metrics (also
+    written as JSON to ``metrics_path``).
+    """
+    rng = random.Random(seed)
+    names = [f"R{i}" for i in range(num_types)]
+    admission = BankersAdmission({name: units_per_type for name in names})
+    claims = {}
+    for i in range(num_workers):
+        maximum = {name: rng.randint(1, max_units) for name in rng.sample(names, claim_types)}
+        admission.register(f"W{i}", maximum)
+        claims[f"W{i}"] = maximum
+
+    def worker(name, seed):
+        rng = random.Random(seed)
+        steps = list(claims[name].items())
+        for _ in range(rounds):
+            rng.shuffle(steps)
+            for resource, units in steps:
+                admission.request(name, {resource: units})
+            time.sleep(hold_time)
+            admission.release(name)
+
+    threads = [threading.Thread(target=worker, args=(name, i)) for i, name in enumerate(claims)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    metrics = admission.metrics()
+    latency = metrics["grant_latency"]
+    rate = report.rate(metrics["granted"], metrics["elapsed_s"], "grants")
+    print(f"\n--- Banker's admission: {num_workers} workers, {num_types} resource types ---")
+    print(f"Granted {metrics['granted']} requests in {metrics['elapsed_s']:.2f}s{rate}")
+    print(f"Queued {metrics['queued']}, refused as unsafe {metrics['unsafe']} times "
+          f"over {metrics['safety_checks']} safety checks")
+    print(f"Grant latency: p50 {latency['p50_ns'] / 1e6:.3f}ms, p99 {latency['p99_ns'] / 1e6:.3f}ms, "
+          f"max {latency['max_ns'] / 1e6:.3f}ms")
+    if metrics_path:
+        with open(metrics_path, "w") as f:
+            json.dump(metrics, f, indent=2)
+    return metrics
+
+
 if __name__ == "__main__":
     manager = ResourceManager()
     manager.create_resource("CPU", 100)
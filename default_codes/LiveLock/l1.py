@@ -2,15 +2,25 @@ import threading
 import time
 import random
 
+from harness import contention
+
 class Resource:
     def __init__(self, name):
         self.name = name
         self.lock = threading.Lock()
         self.owner = None
+        self.holder = None
     
-    def acquire(self, owner):
-        """Try to acquire the resource for the given owner"""
-        result = self.lock.acquire(blocking=False)
+    def acquire(self, owner, manager=None):
+        """Try to acquire the resource for the given owner
+
+        With a contention manager (see harness.contention), the manager decides
+        after each failed try whether to keep waiting for the holder or give up.
+        """
+        if manager is None:
+            result = self.lock.acquire(blocking=False)
+        else:
+            result = contention.acquire(self, manager)
         if result:
             self.owner = owner
             print(f"{time.time():.2f}: {owner} acquired {self.name}")
@@ -20,19 +30,25 @@ class Resource:
         """Release the resource"""
         previous_owner = self.owner
         self.owner = None
+        self.holder = None
         self.lock.release()
         print(f"{time.time():.2f}: {previous_owner} released {self.name}")
 
 
 class Worker(threading.Thread):
-    def __init__(self, name, first_resource, second_resource):
+    def __init__(self, name, first_resource, second_resource, manager=None):
         super().__init__(name=name)
         self.first_resource = first_resource
         self.second_resource = second_resource
+        self.manager = manager
         self.active = True
         self.last_progress = time.time()
     
     def run(self):
+        if self.manager is not None:
+            while self.active:
+                self.attempt_managed()
+            return
         while self.active:
             if self.first_resource.acquire(self.name):
                 try:
@@ -63,13 +79,42 @@ class Worker(threading.Thread):
             
             time.sleep(random.uniform(0.05, 0.1))
 
+    def attempt_managed(self):
+        """One attempt at both resources, leaving retries and backoff to the manager"""
+        manager = self.manager
+        manager.begin()
+        if self.first_resource.acquire(self.name, manager):
+            try:
+                time.sleep(0.1)
+                print(f"{time.time():.2f}: {self.name} is trying to acquire {self.second_resource.name}")
+                if self.second_resource.acquire(self.name, manager):
+                    try:
+                        self.last_progress = time.time()
+                        print(f"{time.time():.2f}: {self.name} has both resources!")
+                        time.sleep(0.2)
+                    finally:
+                        self.second_resource.release()
+                    manager.committed()
+                    return
+                print(f"{time.time():.2f}: {self.name} giving up on {self.second_resource.name} ({manager.name})")
+            finally:
+                self.first_resource.release()
+        time.sleep(manager.backoff())
+
+
+def detect_livelock(workers, timeout=5, duration=None):
+    """Monitor worker threads to detect livelock condition
 
-def detect_livelock(workers, timeout=5):
-    """Monitor worker threads to detect livelock condition"""
+    With ``duration``, the workers are also stopped after that many seconds.
+    """
     start_time = time.time()
     
     while all(worker.is_alive() for worker in workers):
         current_time = time.time()
+        if duration is not None and current_time - start_time > duration:
+            for worker in workers:
+                worker.active = False
+            break
         stuck_workers = [w for w in workers if current_time - w.last_progress > timeout]
         
         if len(stuck_workers) == len(workers) and current_time - start_time > timeout:
@@ -85,18 +130,24 @@ def detect_livelock(workers, timeout=5):
         time.sleep(1)
 
 
-def main():
+def main(policy=None, duration=None):
+    """Run the two workers; ``policy`` names a harness.contention policy for both"""
     resource_x = Resource("Resource X")
     resource_y = Resource("Resource Y")
     
-    thread_a = Worker("Thread A", resource_x, resource_y)
-    thread_b = Worker("Thread B", resource_y, resource_x)
+    def manager():
+        # The scenario sleeps in tenths of seconds; scale the backoff to match.
+        return contention.make(policy, base=0.1, cap=1.0) if policy else None
+    
+    thread_a = Worker("Thread A", resource_x, resource_y, manager())
+    thread_b = Worker("Thread B", resource_y, resource_x, manager())
     
     print("Starting workers...")
     thread_a.start()
     thread_b.start()
     
-    detector = threading.Thread(target=detect_livelock, args=([thread_a, thread_b],))
+    detector = threading.Thread(target=detect_livelock, args=([thread_a, thread_b],),
+                                kwargs={"duration": duration})
     detector.start()
     
     detector.join()
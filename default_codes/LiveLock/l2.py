@@ -1,9 +1,10 @@
 import threading
 import time
-import queue
 import random
+from collections import deque
 from enum import Enum
 from dataclasses import dataclass
+from itertools import count
 
 class Priority(Enum):
     LOW = 1
@@ -20,49 +21,91 @@ class Message:
     
     id: int = 0
 
-message_counter = 0
+# next() on itertools.count is atomic, so ids are unique across all queues
+# without a lock of their own.
+message_ids = count()
 
 class MessageQueue:
     def __init__(self, name):
+        """
+        Multi-level message queue: one FIFO deque per Priority level, highest
+        level served first, all guarded by one lock. Consumers wait on a
+        condition instead of polling.
+        """
         self.name = name
-        self.queue = queue.PriorityQueue()
+        self.by_priority = {priority: deque() for priority in Priority}
+        self.levels = [self.by_priority[priority]
+                       for priority in sorted(Priority, key=lambda p: p.value, reverse=True)]
         self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.count = 0
     
     def enqueue(self, message):
-        """Add a message to the queue with priority (lower number = higher priority)"""
-        global message_counter
+        """Add a message to the queue behind others of the same priority"""
         message.timestamp = time.time()
-        message.id = message_counter
-        message_counter += 1
-        
-        priority_value = 10 - message.priority.value
+        message.id = next(message_ids)
+        with self.lock:
+            self.by_priority[message.priority].append(message)
+            self.count += 1
+            self.not_empty.notify()
+    
+    def enqueue_many(self, messages):
+        """Add several messages with a single lock round-trip"""
+        now = time.time()
+        for message in messages:
+            message.timestamp = now
+            message.id = next(message_ids)
+        with self.lock:
+            for message in messages:
+                self.by_priority[message.priority].append(message)
+            self.count += len(messages)
+            self.not_empty.notify(len(messages))
+    
+    def wait_for_message(self, timeout=None):
+        """Block until a message is queued; False if ``timeout`` ran out first"""
+        with self.lock:
+            return self.not_empty.wait_for(lambda: self.count, timeout) > 0
+    
+    def dequeue(self, timeout=0):
+        """Get the highest priority message, waiting up to ``timeout`` (None: forever)"""
+        batch = self.dequeue_batch(1, timeout)
+        return batch[0] if batch else None
+    
+    def dequeue_batch(self, max_n, timeout=None):
+        """Take up to ``max_n`` messages in priority order under one lock acquisition
+
+        Waits up to ``timeout`` seconds (None: forever, 0: not at all) for the
+        first message; returns an empty list if none arrived.
+        """
         with self.lock:
-            self.queue.put((priority_value, message.id, message))
-    
-    def dequeue(self):
-        """Get the highest priority message from the queue"""
-        try:
-            with self.lock:
-                if not self.queue.empty():
-                    _, _, message = self.queue.get(block=False)
-                    return message
-                return None
-        except queue.Empty:
-            return None
+            if not self.count and not self.not_empty.wait_for(lambda: self.count, timeout):
+                return []
+            batch = []
+            for level in self.levels:
+                take = min(len(level), max_n - len(batch))
+                if take:
+                    popleft = level.popleft
+                    batch.extend([popleft() for _ in range(take)])
+                    if len(batch) == max_n:
+                        break
+            self.count -= len(batch)
+            return batch
     
     def size(self):
-        return self.queue.qsize()
+        return self.count
 
 class System:
-    def __init__(self, name, message_policy):
+    def __init__(self, name, message_policy, batch_size=32):
         """
         Initialize a system that processes messages according to a policy.
         
         Args:
             name: System identifier
             message_policy: Function that determines if a message can be processed
+            batch_size: Most messages taken from the inbox per lock acquisition
         """
         self.name = name
+        self.batch_size = batch_size
         self.inbox = MessageQueue(f"{name}_inbox")
         self.message_policy = message_policy
         self.last_processed_time = time.time()
@@ -82,20 +125,21 @@ class System:
     def process_messages(self):
         """Process messages from the inbox according to policy"""
         while self.is_running:
-            message = self.inbox.dequeue()
-            if message:
+            batch = self.inbox.dequeue_batch(self.batch_size, timeout=0.1)
+            blocked = []
+            for message in batch:
                 if self.message_policy(self, message):
                     print(f"[{self.name}] Processing {message.priority.name} priority message from {message.sender}: {message.content}")
                     self.last_processed_time = time.time()
                     self.messages_processed += 1
                     time.sleep(0.1)
                 else:
-                    self.inbox.enqueue(message)
                     wait_time = round(time.time() - message.timestamp, 2)
+                    blocked.append(message)
                     self.blocked_count += 1
                     print(f"[{self.name}] BLOCKED {message.priority.name} message from {message.sender} (waiting {wait_time}s): {message.content}")
-                    time.sleep(0.1)
-            else:
+            if blocked:
+                self.inbox.enqueue_many(blocked)
                 time.sleep(0.1)
 
 def system_a_policy(system, message):
@@ -196,5 +240,44 @@ def main():
         system_a.is_running = False
         system_b.is_running = False
 
+def run_queue_benchmark(num_producers=4, num_consumers=4, messages_per_producer=50_000, batch_size=64):
+    """Push messages of random priority through one MessageQueue as fast as possible"""
+    inbox = MessageQueue("Bench_inbox")
+    priorities = list(Priority)
+    consumed = [0] * num_consumers
+    total = num_producers * messages_per_producer
+    remaining = [total]
+    remaining_lock = threading.Lock()
+
+    def produce(seed):
+        rng = random.Random(seed)
+        for i in range(messages_per_producer):
+            inbox.enqueue(Message(f"P{seed}", "Bench", rng.choice(priorities), "payload"))
+
+    def consume(index):
+        while True:
+            batch = inbox.dequeue_batch(batch_size, timeout=0.05)
+            if batch:
+                consumed[index] += len(batch)
+                with remaining_lock:
+                    remaining[0] -= len(batch)
+            elif not remaining[0]:
+                return
+
+    threads = [threading.Thread(target=produce, args=(i,)) for i in range(num_producers)]
+    threads += [threading.Thread(target=consume, args=(i,)) for i in range(num_consumers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    rate = f" ({total / elapsed:,.0f} messages/sec)" if elapsed else ""
+    print(f"\n--- MessageQueue: {num_producers} producers, {num_consumers} consumers, batches of {batch_size} ---")
+    print(f"Moved {sum(consumed):,} of {total:,} messages in {elapsed:.2f}s{rate}")
+    return sum(consumed), elapsed
+
+
 if __name__ == "__main__":
     main()
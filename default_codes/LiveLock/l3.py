@@ -1,10 +1,13 @@
 import threading
 import time
 import random
+from collections import deque
 from enum import Enum
 import logging
 
-logging.basicConfig(
+from harness import asynclog
+
+asynclog.basic_config(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
@@ -14,16 +17,26 @@ class LockStatus(Enum):
     UNLOCKED = 0
     LOCKED = 1
 
+class LockWaiter:
+    __slots__ = ("transaction_id", "granted", "event")
+    
+    def __init__(self, transaction_id):
+        self.transaction_id = transaction_id
+        self.granted = False
+        self.event = threading.Event()
+
 class DataItem:
     def __init__(self, item_id):
         self.item_id = item_id
         self.lock_status = LockStatus.UNLOCKED
         self.lock_holder = None
         self.lock = threading.Lock()
+        # Transactions blocked in lock(), granted the item in arrival order.
+        self.waiters = deque()
     
     def try_lock(self, transaction_id):
         with self.lock:
-            if self.lock_status == LockStatus.UNLOCKED:
+            if self.lock_status == LockStatus.UNLOCKED and not self.waiters:
                 self.lock_status = LockStatus.LOCKED
                 self.lock_holder = transaction_id
                 logger.info(f"Transaction {transaction_id} acquired lock on data item {self.item_id}")
@@ -32,18 +45,79 @@ class DataItem:
                 logger.info(f"Transaction {transaction_id} failed to lock data item {self.item_id} (held by Transaction {self.lock_holder})")
                 return False
     
+    def lock_blocking(self, transaction_id, timeout=None, on_wait=None):
+        """
+        Wait in FIFO order until the item is handed to this transaction.
+        
+        Returns False if ``timeout`` ran out or cancel_wait() gave up the
+        wait. ``on_wait(self)`` is called once the transaction is queued.
+        """
+        with self.lock:
+            if self.lock_status == LockStatus.UNLOCKED and not self.waiters:
+                self.lock_status = LockStatus.LOCKED
+                self.lock_holder = transaction_id
+                logger.info(f"Transaction {transaction_id} acquired lock on data item {self.item_id}")
+                return True
+            waiter = LockWaiter(transaction_id)
+            self.waiters.append(waiter)
+            logger.info(f"Transaction {transaction_id} waiting for data item {self.item_id} "
+                        f"(held by Transaction {self.lock_holder}, {len(self.waiters)} in queue)")
+        if on_wait is not None:
+            on_wait(self)
+        waiter.event.wait(timeout)
+        with self.lock:
+            if waiter.granted:
+                return True
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            return False
+    
+    def cancel_wait(self, transaction_id):
+        """Wake a transaction blocked in lock_blocking() without the item"""
+        with self.lock:
+            return self._cancel_wait(transaction_id)
+    
+    def _cancel_wait(self, transaction_id):
+        # Caller holds self.lock.
+        for waiter in self.waiters:
+            if waiter.transaction_id == transaction_id:
+                self.waiters.remove(waiter)
+                waiter.event.set()
+                return True
+        return False
+    
+    def is_waiting(self, transaction_id):
+        # Caller holds self.lock.
+        return any(waiter.transaction_id == transaction_id for waiter in self.waiters)
+    
     def unlock(self, transaction_id):
         with self.lock:
             if self.lock_status == LockStatus.LOCKED and self.lock_holder == transaction_id:
-                self.lock_status = LockStatus.UNLOCKED
                 prev_holder = self.lock_holder
-                self.lock_holder = None
                 logger.info(f"Transaction {prev_holder} released lock on data item {self.item_id}")
+                if self.waiters:
+                    # Hand the item straight to the next waiter.
+                    waiter = self.waiters.popleft()
+                    self.lock_holder = waiter.transaction_id
+                    waiter.granted = True
+                    waiter.event.set()
+                    logger.info(f"Transaction {waiter.transaction_id} acquired lock on data item {self.item_id}")
+                else:
+                    self.lock_status = LockStatus.UNLOCKED
+                    self.lock_holder = None
                 return True
             return False
 
 class Transaction(threading.Thread):
-    def __init__(self, transaction_id, data_items, lock_sequence, database, max_attempts=20):
+    def __init__(self, transaction_id, data_items, lock_sequence, database, max_attempts=20,
+                 blocking=False, ordered=False, lock_timeout=None):
+        """
+        With ``blocking``, items are taken with DataItem.lock_blocking() instead
+        of try_lock() and backoff. ``ordered`` takes them in item id order,
+        which rules out deadlock; ``lock_timeout`` gives up a wait after that
+        many seconds and restarts the transaction. Without either, deadlocks
+        are broken by the database's deadlock detector.
+        """
         super().__init__(name=f"Transaction-{transaction_id}")
         self.transaction_id = transaction_id
         self.data_items = data_items
@@ -55,9 +129,18 @@ class Transaction(threading.Thread):
         self.attempts = 0
         self.max_attempts = max_attempts
         self.last_progress_time = time.time()
+        self.blocking = blocking
+        self.ordered = ordered
+        self.lock_timeout = lock_timeout
+        self.aborted = False
+        self.commit_latency = None
     
     def run(self):
         logger.info(f"Transaction {self.transaction_id} started")
+        self.start_time = time.time()
+        if self.blocking:
+            self.run_blocking()
+            return
         
         while not self.completed and self.attempts < self.max_attempts:
             self.attempts += 1
@@ -82,6 +165,7 @@ class Transaction(threading.Thread):
                     self.database.data_items[item_id].unlock(self.transaction_id)
                 self.locked_items = []
                 self.completed = True
+                self.commit_latency = time.time() - self.start_time
                 logger.info(f"Transaction {self.transaction_id} completed successfully")
             else:
                 if time.time() - self.last_progress_time > 5:
@@ -92,15 +176,65 @@ class Transaction(threading.Thread):
             for item_id in self.locked_items:
                 self.database.data_items[item_id].unlock(self.transaction_id)
             logger.warning(f"Transaction {self.transaction_id} failed to complete after {self.attempts} attempts")
+    
+    def run_blocking(self):
+        sequence = sorted(self.lock_sequence) if self.ordered else self.lock_sequence
+        
+        while not self.completed and self.attempts < self.max_attempts:
+            self.attempts += 1
+            self.aborted = False
+            
+            for item_id in sequence:
+                if item_id in self.locked_items:
+                    continue
+                granted = self.database.data_items[item_id].lock_blocking(
+                    self.transaction_id, self.lock_timeout, self.database.notify_wait)
+                if not granted:
+                    break
+                self.locked_items.append(item_id)
+                self.last_progress_time = time.time()
+            else:
+                logger.info(f"Transaction {self.transaction_id} processing data...")
+                time.sleep(0.2)
+                
+                for item_id in self.locked_items:
+                    self.database.data_items[item_id].unlock(self.transaction_id)
+                self.locked_items = []
+                self.completed = True
+                self.commit_latency = time.time() - self.start_time
+                logger.info(f"Transaction {self.transaction_id} completed successfully")
+                break
+            
+            reason = "aborted as deadlock victim" if self.aborted else "timed out"
+            logger.warning(f"Transaction {self.transaction_id} {reason} waiting for data item {item_id}, "
+                           f"releasing {self.locked_items} and restarting")
+            for locked_id in self.locked_items:
+                self.database.data_items[locked_id].unlock(self.transaction_id)
+            self.locked_items = []
+            if not self.aborted and self.lock_timeout:
+                # Transactions that timed out together must not retry together.
+                time.sleep(random.uniform(0, self.lock_timeout))
+        
+        if not self.completed:
+            self.deadlocked = True
+            logger.warning(f"Transaction {self.transaction_id} failed to complete after {self.attempts} attempts")
 
 class Database:
-    def __init__(self, num_items=5):
+    def __init__(self, num_items=5, blocking=False, ordered=False, lock_timeout=None):
         self.data_items = {i: DataItem(i) for i in range(num_items)}
         self.transactions = []
         self.livelock_detector = None
+        self.blocking = blocking
+        self.ordered = ordered
+        self.lock_timeout = lock_timeout
+        self.wait_events = threading.Condition()
+        self.pending_waits = 0
+        self.deadlocks_resolved = 0
     
     def add_transaction(self, transaction_id, lock_sequence):
-        transaction = Transaction(transaction_id, self.data_items, lock_sequence, self)
+        transaction = Transaction(transaction_id, self.data_items, lock_sequence, self,
+                                  blocking=self.blocking, ordered=self.ordered,
+                                  lock_timeout=self.lock_timeout)
         self.transactions.append(transaction)
         return transaction
     
@@ -141,20 +275,97 @@ class Database:
                     self.data_items[item_id].unlock(victim.transaction_id)
                 victim.locked_items = []
 
+    def notify_wait(self, data_item):
+        """Called by a transaction that has just started waiting for ``data_item``"""
+        with self.wait_events:
+            self.pending_waits += 1
+            self.wait_events.notify()
+    
+    def detect_deadlocks(self):
+        """
+        Event-driven deadlock detection for blocking transactions.
+        
+        Sleeps until a transaction starts waiting, then follows the waits-for
+        graph (each waiting transaction points at the holder of the item it
+        waits for) and aborts the youngest transaction of every cycle. With a
+        lock timeout the transactions resolve deadlocks themselves and no
+        detector runs.
+        """
+        while True:
+            with self.wait_events:
+                while not self.pending_waits:
+                    self.wait_events.wait()
+                self.pending_waits = 0
+            while self.resolve_deadlock():
+                pass
+    
+    def resolve_deadlock(self):
+        # Each edge is read from an item's own queue under its lock, so a
+        # transaction counts as waiting only while it really is queued.
+        waits_for = {}
+        for item in self.data_items.values():
+            with item.lock:
+                holder = item.lock_holder
+                for waiter in item.waiters:
+                    if holder is not None and waiter.transaction_id != holder:
+                        waits_for[waiter.transaction_id] = (holder, item)
+        
+        by_id = {t.transaction_id: t for t in self.transactions}
+        stale = False
+        for start in waits_for:
+            path = []
+            node = start
+            while node in waits_for and node not in path:
+                path.append(node)
+                node = waits_for[node][0]
+            if node not in path:
+                continue
+            cycle = path[path.index(node):]
+            # The edges were read one item at a time; confirm them all at once,
+            # holding every item of the cycle, before aborting anyone.
+            items = sorted({waits_for[t][1] for t in cycle}, key=lambda item: item.item_id)
+            for item in items:
+                item.lock.acquire()
+            try:
+                confirmed = all(waits_for[t][1].lock_holder == waits_for[t][0]
+                                and waits_for[t][1].is_waiting(t) for t in cycle)
+                if confirmed:
+                    victim = by_id[max(cycle)]
+                    victim.aborted = True
+                    waits_for[victim.transaction_id][1]._cancel_wait(victim.transaction_id)
+            finally:
+                for item in reversed(items):
+                    item.lock.release()
+            if not confirmed:
+                # Some wait ended meanwhile; rescan once the other cycles are tried.
+                stale = True
+                continue
+            logger.critical(f"DEADLOCK DETECTED: Transactions {' -> '.join(map(str, cycle + [node]))}")
+            self.deadlocks_resolved += 1
+            logger.warning(f"Resolving deadlock by aborting Transaction {victim.transaction_id}")
+            return True
+        return stale
+
     def start_livelock_detector(self):
-        """Start livelock detection in a separate thread"""
-        self.livelock_detector = threading.Thread(target=self.check_livelock, name="LivelockDetector")
+        """Start livelock detection (deadlock detection for blocking transactions) in a separate thread"""
+        if self.blocking and self.lock_timeout is not None:
+            return
+        target = self.detect_deadlocks if self.blocking else self.check_livelock
+        self.livelock_detector = threading.Thread(target=target, name="LivelockDetector")
         self.livelock_detector.daemon = True
         self.livelock_detector.start()
 
-def run_simulation(create_livelock=True):
+def run_simulation(create_livelock=True, blocking=False, ordered=False, lock_timeout=None):
     """
     Run the database transaction simulation
     
     Args:
         create_livelock: If True, creates a lock pattern likely to cause livelock
+        blocking: Wait in the data items' FIFO queues instead of try_lock and backoff
+        ordered: With blocking, lock items in id order
+        lock_timeout: With blocking, give up a wait after this many seconds and restart
     """
-    db = Database(num_items=5)
+    db = Database(num_items=5, blocking=blocking, ordered=ordered, lock_timeout=lock_timeout)
     
     if create_livelock:
         db.add_transaction(1, [0, 1, 2])
@@ -181,9 +392,15 @@ def run_simulation(create_livelock=True):
     logger.info(f"Total transactions: {len(db.transactions)}")
     logger.info(f"Completed successfully: {completed}")
     logger.info(f"Potentially livelocked: {deadlocked}")
+    latencies = [t.commit_latency for t in db.transactions if t.completed]
+    if latencies:
+        logger.info(f"Commit latency: mean {sum(latencies) / len(latencies):.2f}s, max {max(latencies):.2f}s")
+    if blocking:
+        logger.info(f"Deadlocks resolved: {db.deadlocks_resolved}")
     
     if db.livelock_detector:
         db.livelock_detector.join(timeout=1)
+    return {"completed": completed, "latencies": latencies, "deadlocks_resolved": db.deadlocks_resolved}
 
 if __name__ == "__main__":
     logger.info("Starting Database Livelock Simulation...")
@@ -191,3 +408,9 @@ if __name__ == "__main__":
     logger.info("=================================================================")
     
     run_simulation(create_livelock=True)
+    
+    for ordered, lock_timeout in ((False, None), (True, None), (False, 1.0)):
+        mode = "ordered acquisition" if ordered else (f"{lock_timeout}s lock timeout" if lock_timeout else "deadlock detection")
+        logger.info("=================================================================")
+        logger.info(f"Blocking FIFO wait queues with {mode}")
+        run_simulation(create_livelock=True, blocking=True, ordered=ordered, lock_timeout=lock_timeout)
@@ -2,9 +2,12 @@ import threading
 import time
 import random
 from enum import Enum
+from itertools import count
 import logging
 
-logging.basicConfig(
+from harness import asynclog, report
+
+asynclog.basic_config(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
@@ -21,7 +24,7 @@ class Resource:
         self.type = resource_type
         self.lock = threading.Lock()
         self.owner = None
-        self.requested_by = []
+        self.requested_by = set()
     
     def try_acquire(self, robot):
         """Attempt to acquire the resource without blocking"""
@@ -30,8 +33,7 @@ class Resource:
             logger.info(f"Robot {robot.id} acquired {self.type.value} {self.id}")
             return True
         else:
-            if robot not in self.requested_by:
-                self.requested_by.append(robot)
+            self.requested_by.add(robot)
             logger.info(f"Robot {robot.id} waiting for {self.type.value} {self.id} (owned by Robot {self.owner.id if self.owner else 'None'})")
             return False
     
@@ -39,8 +41,7 @@ class Resource:
         """Release the resource if owned by the robot"""
         if self.owner == robot:
             self.owner = None
-            if robot in self.requested_by:
-                self.requested_by.remove(robot)
+            self.requested_by.discard(robot)
             self.lock.release()
             logger.info(f"Robot {robot.id} released {self.type.value} {self.id}")
             return True
@@ -49,17 +50,134 @@ class Resource:
     def __str__(self):
         return f"{self.type.value} {self.id}"
 
+class BrokerRequest:
+    __slots__ = ("robot", "resources", "busy", "sequence", "since", "granted", "event")
+    
+    def __init__(self, robot, resources, busy, sequence):
+        self.robot = robot
+        self.resources = resources
+        self.busy = busy
+        self.sequence = sequence
+        self.since = time.time()
+        self.granted = False
+        self.event = threading.Event()
+
+class ResourceBroker:
+    """
+    Grants each robot its whole resource set at once, or queues the request
+    until every resource in it is free. A robot never holds part of its set
+    while it waits, so robots cannot hold each other up in a cycle.
+    
+    Bookkeeping is set-based: a resource's requested_by is the set of robots
+    queued for it, and each queued request counts how many of its resources
+    are in use. A release only visits the robots queued for what was released,
+    and a request whose count reaches zero is granted, oldest first.
+    """
+    
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.pending = {}
+        self.sequence = count()
+        self.granted = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def acquire_all(self, robot, resources, timeout=None):
+        """Give ``robot`` all of ``resources`` at once; False if ``timeout`` ran out first"""
+        resources = frozenset(resources)
+        with self.mutex:
+            busy = sum(1 for resource in resources if resource.owner is not None)
+            if not busy:
+                self._grant(robot, resources)
+                return True
+            request = BrokerRequest(robot, resources, busy, next(self.sequence))
+            self.pending[robot] = request
+            for resource in resources:
+                resource.requested_by.add(robot)
+            self.queued += 1
+        logger.info(f"Robot {robot.id} queued for {len(resources)} resources ({busy} in use)")
+        request.event.wait(timeout)
+        with self.mutex:
+            if request.granted:
+                waited = time.time() - request.since
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                return True
+            self._withdraw(request)
+            return False
+    
+    def release_all(self, robot):
+        """Free everything ``robot`` holds and grant the requests that became satisfiable"""
+        with self.mutex:
+            ready = []
+            for resource in robot.resources_held:
+                resource.owner = None
+                for waiter in resource.requested_by:
+                    request = self.pending[waiter]
+                    request.busy -= 1
+                    if not request.busy:
+                        ready.append(request)
+            robot.resources_held = []
+            ready.sort(key=lambda request: request.sequence)
+            for request in ready:
+                if request.busy:
+                    # An older request just took one of its resources.
+                    continue
+                self._withdraw(request)
+                self._grant(request.robot, request.resources)
+                request.granted = True
+                request.event.set()
+    
+    def _grant(self, robot, resources):
+        for resource in resources:
+            resource.owner = robot
+            for waiter in resource.requested_by:
+                self.pending[waiter].busy += 1
+        robot.resources_held = list(resources)
+        self.granted += 1
+    
+    def _withdraw(self, request):
+        del self.pending[request.robot]
+        for resource in request.resources:
+            resource.requested_by.discard(request.robot)
+    
+    def wait_graph(self):
+        """Robot id -> (resource, holder id) for each held resource its queued request needs, oldest request first"""
+        with self.mutex:
+            requests = sorted(self.pending.values(), key=lambda request: request.sequence)
+            return {request.robot.id: [(str(resource), resource.owner.id) for resource in request.resources
+                                       if resource.owner is not None]
+                    for request in requests}
+    
+    def dependency_chain(self):
+        """One line per queued robot, built from wait_graph()"""
+        lines = []
+        for robot_id, edges in self.wait_graph().items():
+            waiting_for = [f"{name} (held by Robot {holder})" for name, holder in edges]
+            lines.append(f"Robot {robot_id} holds [] and waits for [{', '.join(waiting_for)}]")
+        return lines
+
 class Robot:
-    def __init__(self, robot_id, resources_needed):
+    def __init__(self, robot_id, resources_needed, broker=None, max_cycles=None,
+                 work_time=(0.5, 2.0), rest_time=(0.2, 1.0)):
         self.id = robot_id
         self.resources_needed = resources_needed
         self.resources_held = []
         self.status = "idle"
         self.last_progress_time = time.time()
         self.give_up_resource_probability = 0.0
+        self.broker = broker
+        self.max_cycles = max_cycles
+        self.work_time = work_time
+        self.rest_time = rest_time
+        self.cycles_completed = 0
     
     def run(self):
         """Main robot operation loop"""
+        if self.broker is not None:
+            self.run_brokered()
+            return
         while True:
             all_acquired = True
             
@@ -86,7 +204,7 @@ class Robot:
                 if old_status != "working":
                     logger.info(f"Robot {self.id} is now working with all required resources")
                 self.last_progress_time = time.time()
-                time.sleep(random.uniform(0.5, 2.0))
+                time.sleep(random.uniform(*self.work_time))
 
                 for resource in self.resources_held.copy():
                     resource.release(self)
@@ -94,14 +212,30 @@ class Robot:
                 
                 self.status = "idle"
                 logger.info(f"Robot {self.id} completed work cycle and released all resources")
-                time.sleep(random.uniform(0.2, 1.0))  
+                time.sleep(random.uniform(*self.rest_time))  
             else:
                 self.status = "waiting"
                 time.sleep(0.1)  
+    
+    def run_brokered(self):
+        """Work cycles with the whole resource set granted by the broker at once"""
+        while self.max_cycles is None or self.cycles_completed < self.max_cycles:
+            self.status = "waiting"
+            self.broker.acquire_all(self, self.resources_needed)
+            self.status = "working"
+            self.last_progress_time = time.time()
+            logger.info(f"Robot {self.id} is now working with all required resources")
+            time.sleep(random.uniform(*self.work_time))
+            self.broker.release_all(self)
+            self.cycles_completed += 1
+            self.status = "idle"
+            logger.info(f"Robot {self.id} completed work cycle and released all resources")
+            time.sleep(random.uniform(*self.rest_time))
 
 class LivelockMonitor:
-    def __init__(self, robots, livelock_threshold=5.0):
+    def __init__(self, robots, livelock_threshold=5.0, broker=None):
         self.robots = robots
+        self.broker = broker
         self.livelock_threshold = livelock_threshold
         self.livelock_detected = False
     
@@ -133,6 +267,11 @@ class LivelockMonitor:
     
     def _print_dependency_chain(self):
         """Prints the circular dependency chain that caused the livelock"""
+        if self.broker is not None:
+            logger.critical("Dependency Chain:")
+            for msg in self.broker.dependency_chain():
+                logger.critical(msg)
+            return
         dependency_messages = []
         for robot in self.robots:
             waiting_for = []
@@ -168,8 +307,8 @@ def livelock_resolution_strategy(robots):
         robot.give_up_resource_probability = 0.3
     return True
 
-def simulate_production_line(duration=60):
-    """Set up and run the simulation"""
+def simulate_production_line(duration=60, brokered=False):
+    """Set up and run the simulation (with ``brokered``, robots get their resources from a ResourceBroker)"""
     charger1 = Resource(1, ResourceType.CHARGER)
     charger2 = Resource(2, ResourceType.CHARGER)
     tool1 = Resource(1, ResourceType.TOOL)
@@ -177,13 +316,14 @@ def simulate_production_line(duration=60):
     workstation = Resource(1, ResourceType.WORKSTATION)
     
     
-    robot1 = Robot(1, [charger1, tool1, workstation])
-    robot2 = Robot(2, [charger1, tool2, workstation])
-    robot3 = Robot(3, [charger2, tool1, workstation])
+    broker = ResourceBroker() if brokered else None
+    robot1 = Robot(1, [charger1, tool1, workstation], broker)
+    robot2 = Robot(2, [charger1, tool2, workstation], broker)
+    robot3 = Robot(3, [charger2, tool1, workstation], broker)
     
     robots = [robot1, robot2, robot3]
     
-    monitor = LivelockMonitor(robots)
+    monitor = LivelockMonitor(robots, broker=broker)
     
     threads = []
     for robot in robots:
@@ -209,6 +349,66 @@ def simulate_production_line(duration=60):
     
     logger.info("Simulation completed")
 
+PRODUCTION_LINES = {
+    "demo": dict(num_robots=3, chargers=2, tools=2, workstations=1),
+    "balanced": dict(num_robots=200, chargers=50, tools=100, workstations=50),
+    "workstation-bound": dict(num_robots=200, chargers=100, tools=200, workstations=10),
+    "multi-tool": dict(num_robots=300, chargers=60, tools=200, workstations=40, tools_per_robot=3),
+}
+
+def build_production_line(num_robots, chargers, tools, workstations, tools_per_robot=1, seed=0):
+    """Resources of each type and robots that each need a charger, some tools and a workstation"""
+    rng = random.Random(seed)
+    pools = {
+        ResourceType.CHARGER: [Resource(i + 1, ResourceType.CHARGER) for i in range(chargers)],
+        ResourceType.TOOL: [Resource(i + 1, ResourceType.TOOL) for i in range(tools)],
+        ResourceType.WORKSTATION: [Resource(i + 1, ResourceType.WORKSTATION) for i in range(workstations)],
+    }
+    needs = []
+    for _ in range(num_robots):
+        needed = [rng.choice(pools[ResourceType.CHARGER])]
+        needed += rng.sample(pools[ResourceType.TOOL], tools_per_robot)
+        needed.append(rng.choice(pools[ResourceType.WORKSTATION]))
+        needs.append(needed)
+    return pools, needs
+
+def run_production_line(config="balanced", cycles=20, work_time=(0.001, 0.005),
+                        rest_time=(0.0005, 0.002), seed=0):
+    """Run every robot of a PRODUCTION_LINES configuration through the broker and report throughput"""
+    pools, needs = build_production_line(**PRODUCTION_LINES[config], seed=seed)
+    broker = ResourceBroker()
+    robots = [Robot(i + 1, needed, broker=broker, max_cycles=cycles, work_time=work_time,
+                    rest_time=rest_time)
+              for i, needed in enumerate(needs)]
+    threads = [threading.Thread(target=robot.run, name=f"Robot-{robot.id}") for robot in robots]
+    
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    start = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        logger.setLevel(level)
+    elapsed = time.perf_counter() - start
+    
+    total = sum(robot.cycles_completed for robot in robots)
+    rate = report.rate(total, elapsed, "cycles")
+    mean_wait = broker.total_wait / broker.queued if broker.queued else 0.0
+    resources = sum(len(pool) for pool in pools.values())
+    print(f"\n--- Production line '{config}': {len(robots)} robots, {resources} resources ---")
+    print(f"Completed {total} work cycles in {elapsed:.2f}s{rate}")
+    print(f"Queued {broker.queued} of {broker.granted} grants, "
+          f"wait mean {mean_wait * 1000:.1f}ms, max {broker.max_wait * 1000:.1f}ms")
+    return {"cycles": total, "elapsed": elapsed, "queued": broker.queued,
+            "mean_wait": mean_wait, "max_wait": broker.max_wait}
+
+def compare_production_lines(**kwargs):
+    return {config: run_production_line(config, **kwargs) for config in PRODUCTION_LINES}
+
 if __name__ == "__main__":
     logger.info("Starting robot production line simulation")
     simulate_production_line(duration=120)  # Run for 2 minutes
+    compare_production_lines()
@@ -4,6 +4,9 @@ import random
 from enum import Enum
 from datetime import datetime
 
+from harness import report
+from harness.lockstats import LogHistogram
+
 class WorkerStatus(Enum):
     IDLE = "IDLE"
     WORKING = "WORKING"
@@ -28,6 +31,15 @@ class SharedResource:
             self.last_accessed_by = worker_name
             self.last_access_time = datetime.now()
             
+    def toggle(self, worker_name):
+        """Flip the active flag atomically and return the new value"""
+        with self.lock:
+            self.active = not self.active
+            self.access_count += 1
+            self.last_accessed_by = worker_name
+            self.last_access_time = datetime.now()
+            return self.active
+            
     def get_stats(self):
         return {
             "access_count": self.access_count,
@@ -46,6 +58,65 @@ class Task:
         self.completed = True
         return f"Completed task: {self.name}"
 
+class TokenRing:
+    """
+    Turn-taking for N workers: exactly one of them holds the turn.
+    
+    Each worker waits on its own Event, and pass_turn() sets the Event of the
+    next worker still in the ring, so the turn moves in one wake-up and
+    nobody polls. Membership and the holder change under one lock, whose
+    condition also wakes anyone watching handoffs.
+    """
+    
+    def __init__(self, size, first=0):
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.turns = [threading.Event() for _ in range(size)]
+        self.members = [True] * size
+        self.holder = first
+        self.handoffs = 0
+        self.turns[first].set()
+    
+    def wait_turn(self, index, timeout=None):
+        """Block until worker ``index`` holds the turn; False on timeout"""
+        return self.turns[index].wait(timeout)
+    
+    def pass_turn(self, index):
+        """Hand the turn from worker ``index`` to the next worker in the ring"""
+        with self.lock:
+            if self.holder != index:
+                raise RuntimeError(f"worker {index} passed a turn it does not hold")
+            self._hand_on(index)
+    
+    def leave(self, index):
+        """Take worker ``index`` out of the ring, passing the turn on if it holds it"""
+        with self.lock:
+            self.members[index] = False
+            if self.holder == index:
+                self._hand_on(index)
+            else:
+                self.changed.notify_all()
+    
+    def _hand_on(self, index):
+        self.turns[index].clear()
+        size = len(self.members)
+        for step in range(1, size + 1):
+            candidate = (index + step) % size
+            if self.members[candidate]:
+                self.holder = candidate
+                self.turns[candidate].set()
+                break
+        else:
+            self.holder = None
+        self.handoffs += 1
+        self.changed.notify_all()
+    
+    def wait_for_handoff(self, seen, timeout=None):
+        """Block until more than ``seen`` handoffs happened (or timeout); returns the count"""
+        with self.lock:
+            self.changed.wait_for(lambda: self.handoffs > seen or self.holder is None, timeout)
+            return self.handoffs
+
 class Worker:
     def __init__(self, name, active):
         self.name = name
@@ -102,9 +173,39 @@ class Worker:
         print(f"\n{self.name} Statistics:")
         print(f"Tasks Completed: {self.tasks_completed}")
         print(f"Total Work Time: {self.total_work_time:.2f} seconds")
+        
+    def take_turns(self, shared_resource, ring, index, max_tasks=5):
+        """Like work(), but the turn comes from a TokenRing instead of polling the other worker"""
+        while self.tasks_completed < max_tasks:
+            self.status = WorkerStatus.WAITING
+            ring.wait_turn(index)
+            
+            self.status = WorkerStatus.WORKING
+            self.active = True
+            task_result = self.perform_task()
+            print(f"{self.name} [{self.status}]: {task_result}")
+            if shared_resource.toggle(self.name):
+                print(f"{self.name} activates the shared resource.")
+            else:
+                print(f"{self.name} sets the shared resource to inactive.")
+            self.active = False
+            ring.pass_turn(index)
+        
+        ring.leave(index)
+        self.status = WorkerStatus.FINISHED
+        print(f"\n{self.name} Statistics:")
+        print(f"Tasks Completed: {self.tasks_completed}")
+        print(f"Total Work Time: {self.total_work_time:.2f} seconds")
 
-def monitor_resource(shared_resource, workers, interval=1.0):
+def monitor_resource(shared_resource, workers, interval=1.0, ring=None):
+    """Print status every ``interval``; with a ring, only after handoffs (at most once per interval)"""
+    seen = 0
     while any(worker.get_status() != WorkerStatus.FINISHED for worker in workers):
+        if ring is not None:
+            handoffs = ring.wait_for_handoff(seen)
+            if handoffs == seen:
+                break
+            seen = handoffs
         stats = shared_resource.get_stats()
         print(f"\nResource Monitor:")
         print(f"Access Count: {stats['access_count']}")
@@ -115,6 +216,92 @@ def monitor_resource(shared_resource, workers, interval=1.0):
             print(f"- {worker.get_name()}: {worker.get_status().value}")
         time.sleep(interval)
 
+def run_turns(num_workers=2, max_tasks=5):
+    """The ping-pong of main() for ``num_workers`` workers, coordinated by a TokenRing"""
+    shared_resource = SharedResource()
+    workers = [Worker(f"Worker {i + 1}", False) for i in range(num_workers)]
+    ring = TokenRing(num_workers)
+    
+    monitor_thread = threading.Thread(target=monitor_resource, args=(shared_resource, workers),
+                                      kwargs={"ring": ring}, daemon=True)
+    threads = [threading.Thread(target=worker.take_turns, args=(shared_resource, ring, i, max_tasks))
+               for i, worker in enumerate(workers)]
+    monitor_thread.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return shared_resource.get_stats()
+
+def run_token_ring(num_workers=2, handoffs=20000, idle_turns=5, idle_hold=0.2, poll_interval=0.1,
+                   polling_handoffs=20):
+    """
+    Measure turn handoff latency and the CPU used by waiting workers.
+    
+    Workers pass the turn around the ring with no work in between; latency
+    runs from pass_turn() to the next worker waking up. Then each holder
+    keeps the turn for ``idle_hold`` seconds while the others wait, and the
+    process CPU time over that stretch is the cost of waiting. The same
+    handoffs done by polling a shared holder index every ``poll_interval``
+    (what Worker.work does) are timed for comparison.
+    """
+    def measure(wait_turn, pass_turn, count, hold=0.0):
+        latency = LogHistogram()
+        passed_at = [0]
+        done = [0]
+        done_lock = threading.Lock()
+        
+        def worker(index):
+            while True:
+                wait_turn(index)
+                now = time.perf_counter_ns()
+                with done_lock:
+                    if done[0] >= count:
+                        pass_turn(index)
+                        return
+                    if passed_at[0]:
+                        latency.add(now - passed_at[0])
+                    done[0] += 1
+                if hold:
+                    time.sleep(hold)
+                passed_at[0] = time.perf_counter_ns()
+                pass_turn(index)
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(num_workers)]
+        wall, cpu = time.perf_counter(), time.process_time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latency, time.perf_counter() - wall, time.process_time() - cpu
+    
+    ring = TokenRing(num_workers)
+    latency, elapsed, _ = measure(ring.wait_turn, ring.pass_turn, handoffs)
+    idle_ring = TokenRing(num_workers)
+    _, idle_wall, idle_cpu = measure(idle_ring.wait_turn, idle_ring.pass_turn, idle_turns, idle_hold)
+    
+    holder = [0]
+    def poll_wait(index):
+        while holder[0] != index:
+            time.sleep(poll_interval)
+    def poll_pass(index):
+        holder[0] = (index + 1) % num_workers
+    polled, _, _ = measure(poll_wait, poll_pass, polling_handoffs)
+    
+    summary = latency.summary()
+    polled_summary = polled.summary()
+    rate = report.rate(handoffs, elapsed, "handoffs")
+    print(f"\n--- Token ring: {num_workers} workers ---")
+    print(f"{handoffs} handoffs in {elapsed:.2f}s{rate}")
+    print(f"Handoff latency: mean {summary['mean_ns'] / 1000:.1f}us, p50 {summary['p50_ns'] / 1000:.1f}us, "
+          f"p99 {summary['p99_ns'] / 1000:.1f}us")
+    print(f"Polling every {poll_interval * 1000:.0f}ms: mean {polled_summary['mean_ns'] / 1000:.1f}us, "
+          f"p99 {polled_summary['p99_ns'] / 1000:.1f}us")
+    if idle_wall:
+        print(f"Idle CPU while waiting: {idle_cpu / idle_wall:.2%} of one core over {idle_wall:.2f}s")
+    return {"latency": summary, "polling_latency": polled_summary, "elapsed": elapsed,
+            "idle_cpu": idle_cpu, "idle_wall": idle_wall}
+
 def main():
     shared_resource = SharedResource()
     worker1 = Worker("Worker 1", True)
@@ -4,6 +4,20 @@ import random
 import queue
 from datetime import datetime
 
+from harness import trace
+
+# Decoded only after the run; formatting and printing inside the critical
+# section used to dominate the runtime.
+DEPOSIT_WAIT = trace.event("lp1.deposit_wait", "Client {obj} waiting to deposit ${arg}...")
+WITHDRAW_WAIT = trace.event("lp1.withdraw_wait", "Client {obj} waiting to withdraw ${arg}...")
+LOCK_ACQUIRED = trace.event("lp1.lock_acquired", "Client {obj} acquired lock after waiting {arg_s:.3f} seconds")
+DEPOSITED = trace.event("lp1.deposited", "Client {obj} deposited ${arg}")
+WITHDREW = trace.event("lp1.withdrew", "Client {obj} withdrew ${arg}")
+WITHDRAW_FAILED = trace.event("lp1.withdraw_failed", "Client {obj} failed to withdraw ${arg}. Insufficient funds")
+BALANCE = trace.event("lp1.balance", "Client {obj} sees balance: ${arg}")
+DEPOSIT_RELEASED = trace.event("lp1.deposit_released", "Client {obj} released lock after deposit")
+WITHDRAW_RELEASED = trace.event("lp1.withdraw_released", "Client {obj} released lock after withdrawal attempt")
+
 class BankAccount:
     def __init__(self, balance=1000):
         self.balance = balance
@@ -12,13 +26,13 @@ class BankAccount:
         
     def deposit(self, amount, client_id):
         start_time = time.time()
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} waiting to deposit ${amount}...")
+        trace.emit(DEPOSIT_WAIT, client_id, amount)
         
         with self.lock:
             lock_acquired_time = time.time()
             wait_time = lock_acquired_time - start_time
             
-            print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} acquired lock after waiting {wait_time:.3f} seconds")
+            trace.emit(LOCK_ACQUIRED, client_id, int(wait_time * 1e9))
             
             time.sleep(random.uniform(0.1, 0.5))
             old_balance = self.balance
@@ -34,20 +48,21 @@ class BankAccount:
                 'timestamp': datetime.now()
             })
             
-            print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} deposited ${amount}. New balance: ${self.balance}")
+            trace.emit(DEPOSITED, client_id, amount)
+            trace.emit(BALANCE, client_id, self.balance)
         
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} released lock after deposit")
+        trace.emit(DEPOSIT_RELEASED, client_id)
         return wait_time
         
     def withdraw(self, amount, client_id):
         start_time = time.time()
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} waiting to withdraw ${amount}...")
+        trace.emit(WITHDRAW_WAIT, client_id, amount)
         
         with self.lock:
             lock_acquired_time = time.time()
             wait_time = lock_acquired_time - start_time
             
-            print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} acquired lock after waiting {wait_time:.3f} seconds")
+            trace.emit(LOCK_ACQUIRED, client_id, int(wait_time * 1e9))
             
             time.sleep(random.uniform(0.1, 0.5))
             
@@ -70,11 +85,13 @@ class BankAccount:
             })
             
             if success:
-                print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} withdrew ${amount}. New balance: ${self.balance}")
+                trace.emit(WITHDREW, client_id, amount)
+                trace.emit(BALANCE, client_id, self.balance)
             else:
-                print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} failed to withdraw ${amount}. Insufficient funds: ${self.balance}")
+                trace.emit(WITHDRAW_FAILED, client_id, amount)
+                trace.emit(BALANCE, client_id, self.balance)
         
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Client {client_id} released lock after withdrawal attempt")
+        trace.emit(WITHDRAW_RELEASED, client_id)
         return wait_time
 
 def client_activity(account, client_id, num_transactions):
@@ -151,6 +168,7 @@ def run_simulation(num_clients, transactions_per_client):
     for t in threads:
         t.join()
     
+    print(trace.format_text(trace.drain()))
     print("\n===== SIMULATION COMPLETED =====")
     print(f"Final account balance: ${account.balance}")
     
@@ -2,10 +2,20 @@ import threading
 import time
 import random
 import queue
-from datetime import datetime
 import statistics
 from concurrent.futures import ThreadPoolExecutor
 
+from harness import trace
+
+# Decoded only after each simulation; formatting timestamps while holding
+# the pool lock used to dominate the runtime.
+LOCK_WAIT = trace.event("lp3.lock_wait", "Worker {obj} waiting to acquire resource lock...")
+LOCK_ACQUIRED = trace.event("lp3.lock_acquired", "Worker {obj} acquired resource lock after {arg_s:.6f}s")
+RESOURCE_WAIT = trace.event("lp3.resource_wait", "Worker {obj} waited {arg_s:.6f}s for a free resource")
+RESOURCE_ACQUIRED = trace.event("lp3.resource_acquired", "Worker {obj} acquired resource-{arg}")
+PROCESSING = trace.event("lp3.processing", "Worker {obj} processing request for {arg_s:.3f}s")
+RESOURCE_RELEASED = trace.event("lp3.resource_released", "Worker {obj} releasing resource-{arg}")
+
 class ResourcePool:
     """Simulates a limited pool of resources (e.g., database connections)"""
     def __init__(self, pool_size):
@@ -15,28 +25,29 @@ class ResourcePool:
         self.wait_times = []
         
         for i in range(pool_size):
-            self.resources.put(f"resource-{i}")
+            self.resources.put(i)
     
     def acquire_resource(self, worker_id):
         """Acquires a resource from the pool, recording wait time"""
         start_wait = time.time()
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Worker {worker_id} waiting to acquire resource lock...")
+        trace.emit(LOCK_WAIT, worker_id)
         
         with self.lock:
             wait_duration = time.time() - start_wait
             self.wait_times.append(wait_duration)
-            print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Worker {worker_id} acquired resource lock after {wait_duration:.6f}s")
+            trace.emit(LOCK_ACQUIRED, worker_id, int(wait_duration * 1e9))
             
             resource_wait_start = time.time()
             resource = self.resources.get(block=True)
             resource_wait_duration = time.time() - resource_wait_start
             
-            print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Worker {worker_id} acquired {resource} after waiting {resource_wait_duration:.6f}s")
+            trace.emit(RESOURCE_WAIT, worker_id, int(resource_wait_duration * 1e9))
+            trace.emit(RESOURCE_ACQUIRED, worker_id, resource)
             return resource, wait_duration
     
     def release_resource(self, resource, worker_id):
         """Returns a resource to the pool"""
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Worker {worker_id} releasing {resource}")
+        trace.emit(RESOURCE_RELEASED, worker_id, resource)
         self.resources.put(resource)
     
     def get_wait_statistics(self):
@@ -58,7 +69,7 @@ def process_request(worker_id, resource_pool, request_complexity):
         resource, wait_time = resource_pool.acquire_resource(worker_id)
         
         processing_time = request_complexity * random.uniform(0.1, 0.5)
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Worker {worker_id} processing request (complexity: {request_complexity}) with {resource}")
+        trace.emit(PROCESSING, worker_id, int(processing_time * 1e9))
         time.sleep(processing_time)
         
         resource_pool.release_resource(resource, worker_id)
@@ -124,6 +135,8 @@ def simulate_web_server(num_workers, num_resources, num_requests, traffic_patter
     
     total_simulation_time = time.time() - start_time
     
+    print(trace.format_text(trace.drain()))
+    
     print(f"\n{'='*80}")
     print(f"SIMULATION COMPLETED in {total_simulation_time:.2f} seconds")
     print(f"{'='*80}")
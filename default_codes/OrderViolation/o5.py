@@ -7,7 +7,9 @@ from dataclasses import dataclass
 from queue import Queue
 from contextlib import contextmanager
 
-logging.basicConfig(
+from harness import asynclog
+
+asynclog.basic_config(
     level=logging.INFO,
     format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
 )
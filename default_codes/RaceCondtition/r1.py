@@ -176,8 +176,8 @@ def generate_booking_report(booking_system):
         print(f"  Successes: {stats['successes']}")
         print(f"  Success Rate: {success_rate:.1f}%")
 
-def main():
-    booking_system = TicketBookingSystem(20)
+def main(total_seats=20):
+    booking_system = TicketBookingSystem(total_seats)
     
     customers = [
         Customer(i, f"Customer_{i}", random.uniform(300, 1000))
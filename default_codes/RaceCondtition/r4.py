@@ -25,20 +25,24 @@ def update_dictionary(key, value):
     log_list.append(log_entry)
     print(f"Thread {threading.current_thread().name} end: {key} = {value}, start: {log_entry['start_time']}, terminated: {log_entry['end_time']}")
 
-threads = []
-for i in range(10):
-    key = 'test'
-    value = random.randint(1, 100)
-    thread = threading.Thread(target=update_dictionary, args=(key, value))
-    thread.start()
-    threads.append(thread)
-
-for thread in threads:
-    thread.join()
-
-print("final dictionary contents:", shared_dict)
-
-print("\nThread Log:")
-for log in log_list:
-    race_condition = "data race!" if log['race_condition'] else "no data race."
-    print(f"{log['thread']}: {log['key']} was {log['original_value']} -> {log['new_value']}, {race_condition}")
+def main():
+    threads = []
+    for i in range(10):
+        key = 'test'
+        value = random.randint(1, 100)
+        thread = threading.Thread(target=update_dictionary, args=(key, value))
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    print("final dictionary contents:", shared_dict)
+
+    print("\nThread Log:")
+    for log in log_list:
+        race_condition = "data race!" if log['race_condition'] else "no data race."
+        print(f"{log['thread']}: {log['key']} was {log['original_value']} -> {log['new_value']}, {race_condition}")
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,15 @@ import time
 import random
 import queue
 from datetime import datetime
-import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 import threading
 
+from harness import report, trace
+
+# The allocator records grants and completions in its in-process trace
+# instead of formatting and shipping each line through the Manager list.
+GRANTED = trace.event("s1.granted", "Process {obj} granted resource access after waiting {arg_s:.2f} seconds")
+COMPLETED = trace.event("s1.completed", "Process {obj} completed task, held resource for {arg_s:.2f} seconds")
+
 class ResourceManager:
     def __init__(self, resource_units=1):
         """
@@ -52,10 +56,7 @@ class ResourceManager:
                     else:
                         self.waiting_times[process_id] = [wait_time]
                     
-                    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-                    log_entry = f"{timestamp} - Process {process_id} (Priority: {priority}) granted resource access after waiting {wait_time:.2f} seconds"
-                    self.resource_access_logs.append(log_entry)
-                    print(log_entry)
+                    trace.emit(GRANTED, process_id, int(wait_time * 1e9))
                     
                     time.sleep(work_time)
                     
@@ -67,10 +68,7 @@ class ResourceManager:
                     else:
                         self.completion_times[process_id] = [completion_time]
                         
-                    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-                    log_entry = f"{timestamp} - Process {process_id} completed task, held resource for {work_time:.2f} seconds"
-                    self.resource_access_logs.append(log_entry)
-                    print(log_entry)
+                    trace.emit(COMPLETED, process_id, int(work_time * 1e9))
                 
                 time.sleep(0.1)
                 
@@ -150,6 +148,26 @@ def analyze_results(resource_manager):
     process_ids = sorted(avg_waiting_times.keys())
     avg_waits = [avg_waiting_times[pid] for pid in process_ids]
     
+    if report.headless():
+        report.write_csv('waiting_times.csv', ('process_id', 'request', 'wait_s', 'starved'),
+                         [(pid, i, wait, pid in starved_processes)
+                          for pid in process_ids for i, wait in enumerate(waiting_times[pid])])
+        report.write_csv('tasks_completed.csv', ('process_id', 'task', 'completed_at'),
+                         [(pid, i, at) for pid in sorted(completion_times)
+                          for i, at in enumerate(completion_times[pid])])
+        print("\nSaved timelines: waiting_times.csv and tasks_completed.csv")
+    else:
+        plot_results(process_ids, avg_waits, tasks_completed, starved_processes)
+    
+    with open('resource_access_logs.txt', 'w') as f:
+        for log in sorted(resource_manager.resource_access_logs):
+            f.write(log + '\n')
+    
+    print("\nDetailed logs saved to resource_access_logs.txt")
+
+def plot_results(process_ids, avg_waits, tasks_completed, starved_processes):
+    """Save the waiting time and completed task charts"""
+    plt = report.pyplot()
     plt.figure(figsize=(10, 6))
     plt.bar(process_ids, avg_waits, color=['red' if pid in starved_processes else 'blue' for pid in process_ids])
     plt.title('Average Waiting Time by Process')
@@ -169,12 +187,6 @@ def analyze_results(resource_manager):
     plt.savefig('tasks_completed.png')
     
     print("\nSaved visualizations: waiting_times.png and tasks_completed.png")
-    
-    with open('resource_access_logs.txt', 'w') as f:
-        for log in resource_manager.resource_access_logs:
-            f.write(log + '\n')
-    
-    print("\nDetailed logs saved to resource_access_logs.txt")
 
 def main():
     """Main function to run the simulation"""
@@ -227,6 +239,12 @@ def main():
     
     print("All processes have completed or been terminated")
     
+    for event in trace.to_json(trace.drain()):
+        timestamp = datetime.fromtimestamp(event["ts_ns"] / 1e9).strftime("%H:%M:%S.%f")[:-3]
+        log_entry = f"{timestamp} - {event['message']}"
+        resource_manager.resource_access_logs.append(log_entry)
+        print(log_entry)
+    
 
     analyze_results(resource_manager)
 
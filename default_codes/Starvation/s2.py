@@ -6,7 +6,9 @@ import logging
 from dataclasses import dataclass, field
 from typing import List, Dict
 
-logging.basicConfig(
+from harness import asynclog
+
+asynclog.basic_config(
     level=logging.INFO,
     format='%(asctime)s - %(message)s',
     datefmt='%H:%M:%S'
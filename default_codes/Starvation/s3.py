@@ -4,12 +4,13 @@ import random
 import logging
 from queue import PriorityQueue
 from datetime import datetime
-import matplotlib.pyplot as plt
-import numpy as np
 from collections import defaultdict
+from statistics import mean, median
 
+from harness import asynclog, report
 
-logging.basicConfig(
+
+asynclog.basic_config(
     level=logging.INFO,
     format='%(asctime)s - %(message)s',
     datefmt='%H:%M:%S'
@@ -92,8 +93,8 @@ class FileSystem:
             'LP': 'red',
         }
         
-        plt.figure(figsize=(15, 8))
-        
+        # One row per access interval; drawn with a single hlines call.
+        rows, starts, ends, segment_colors = [], [], [], []
         y_pos = len(thread_ids)
         for i, thread_id in enumerate(thread_ids):
             events = sorted(thread_events[thread_id])
@@ -109,10 +110,22 @@ class FileSystem:
             
             for j in range(0, len(events), 2):
                 if j+1 < len(events):
-                    start_time, _ = events[j]
-                    end_time, _ = events[j+1]
-                    plt.hlines(y=y_pos-i, xmin=start_time, xmax=end_time, 
-                              linewidth=10, color=color, alpha=0.7)
+                    rows.append(y_pos-i)
+                    starts.append(events[j][0])
+                    ends.append(events[j+1][0])
+                    segment_colors.append(color)
+        
+        if report.headless():
+            report.write_csv('starvation_visualization.csv', ('thread_id', 'start_s', 'end_s'),
+                             [(thread_ids[y_pos-row], start, end)
+                              for row, start, end in zip(rows, starts, ends)])
+            logging.info("Saved access timeline to 'starvation_visualization.csv'")
+            self.visualize_wait_times(thread_info)
+            return
+        
+        plt = report.pyplot()
+        plt.figure(figsize=(15, 8))
+        plt.hlines(y=rows, xmin=starts, xmax=ends, linewidth=10, colors=segment_colors, alpha=0.7)
         
         legend_elements = [
             plt.Line2D([0], [0], color='green', lw=4, label='High Priority'),
@@ -152,23 +165,30 @@ class FileSystem:
         def calc_stats(wait_times):
             if not wait_times:
                 return 0, 0, 0
-            return np.mean(wait_times), np.median(wait_times), np.max(wait_times)
+            return mean(wait_times), median(wait_times), max(wait_times)
         
         high_stats = calc_stats(high_waits)
         medium_stats = calc_stats(medium_waits)
         low_stats = calc_stats(low_waits)
-        plt.figure(figsize=(12, 8))
         groups = ['High Priority', 'Medium Priority', 'Low Priority']
         means = [high_stats[0], medium_stats[0], low_stats[0]]
         medians = [high_stats[1], medium_stats[1], low_stats[1]]
         maxes = [high_stats[2], medium_stats[2], low_stats[2]]
         
-        x = np.arange(len(groups))
+        if report.headless():
+            report.write_csv('wait_time_analysis.csv', ('group', 'mean_s', 'median_s', 'max_s'),
+                             zip(groups, means, medians, maxes))
+            logging.info("Saved wait time analysis to 'wait_time_analysis.csv'")
+            return
+        
+        plt = report.pyplot()
+        plt.figure(figsize=(12, 8))
+        x = range(len(groups))
         width = 0.25
         
-        plt.bar(x - width, means, width, label='Mean Wait Time', color='blue')
+        plt.bar([i - width for i in x], means, width, label='Mean Wait Time', color='blue')
         plt.bar(x, medians, width, label='Median Wait Time', color='green')
-        plt.bar(x + width, maxes, width, label='Max Wait Time', color='red')
+        plt.bar([i + width for i in x], maxes, width, label='Max Wait Time', color='red')
         
         plt.ylabel('Wait Time (seconds)')
         plt.title('Resource Wait Times by Priority Group')
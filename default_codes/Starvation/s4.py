@@ -4,8 +4,10 @@ import time
 from enum import Enum
 from dataclasses import dataclass
 from typing import List, Optional
-import matplotlib.pyplot as plt
-import numpy as np
+
+from harness import report
+
+TIMELINE_COLUMNS = ('request_id', 'priority', 'created', 'started', 'completed', 'wait')
 
 class Priority(Enum):
     HIGH = 1
@@ -177,6 +179,12 @@ class ResourceManager:
             print("No completed requests to plot.")
             return
         
+        if report.headless():
+            report.write_csv('request_timeline.csv', TIMELINE_COLUMNS, timeline_rows(completed_requests))
+            print("Saved request timeline to request_timeline.csv")
+            return
+        
+        plt = report.pyplot()
         plt.figure(figsize=(12, 8))
         plt.subplot(2, 2, 1)
         priorities = [p for p in Priority]
@@ -207,25 +215,7 @@ class ResourceManager:
             plt.title('Average Wait Time by Priority')
         
         plt.subplot(2, 1, 2)
-        for req in completed_requests:
-            color = 'green' if req.priority == Priority.HIGH else ('orange' if req.priority == Priority.MEDIUM else 'red')
-            plt.plot([req.creation_time, req.start_time, req.completion_time], 
-                     [req.id, req.id, req.id], 
-                     marker='o', 
-                     color=color,
-                     alpha=0.7)
-            
-            plt.plot([req.creation_time, req.start_time], 
-                     [req.id, req.id], 
-                     linewidth=2, 
-                     color='blue',
-                     alpha=0.5)
-            
-            plt.plot([req.start_time, req.completion_time], 
-                     [req.id, req.id], 
-                     linewidth=2, 
-                     color='green',
-                     alpha=0.5)
+        plot_timeline(plt, completed_requests, phases=True)
         
         plt.xlabel('Time')
         plt.ylabel('Request ID')
@@ -235,6 +225,26 @@ class ResourceManager:
         plt.show()
 
 
+def timeline_rows(requests):
+    return [(r.id, str(r.priority), r.creation_time, r.start_time, r.completion_time, r.wait_time())
+            for r in requests]
+
+
+def plot_timeline(plt, requests, phases=False):
+    """Draw every request's timeline with one call per style instead of one per request"""
+    colors = ['green' if r.priority == Priority.HIGH else ('orange' if r.priority == Priority.MEDIUM else 'red')
+              for r in requests]
+    ids = [r.id for r in requests]
+    created = [r.creation_time for r in requests]
+    started = [r.start_time for r in requests]
+    completed = [r.completion_time for r in requests]
+    plt.hlines(ids, created, completed, colors=colors, alpha=0.7)
+    plt.scatter(created + started + completed, ids * 3, c=colors * 3, alpha=0.7)
+    if phases:
+        plt.hlines(ids, created, started, linewidth=2, colors='blue', alpha=0.5)
+        plt.hlines(ids, started, completed, linewidth=2, colors='green', alpha=0.5)
+
+
 def run_simple_demo():
     print("=== RESOURCE ALLOCATION SIMULATION ===")
     print("This simulation demonstrates priority-based resource allocation with preemption")
@@ -316,31 +326,26 @@ def run_comparative_demo():
             print(f"{'Avg wait - ' + str(p):<25} {wait1:.2f if wait1 > 0 else 'N/A':<20} {wait2:.2f if wait2 > 0 else 'N/A':<20}")
     
 
+    completed1 = [r for r in manager1.all_requests if r.is_complete()]
+    completed2 = [r for r in manager2.all_requests if r.is_complete()]
+    if report.headless():
+        report.write_csv('request_timeline_preemption.csv', TIMELINE_COLUMNS, timeline_rows(completed1))
+        report.write_csv('request_timeline_no_preemption.csv', TIMELINE_COLUMNS, timeline_rows(completed2))
+        print("Saved timelines to request_timeline_preemption.csv and request_timeline_no_preemption.csv")
+        return
+    
+    plt = report.pyplot()
     plt.figure(figsize=(15, 10))
     
     plt.subplot(2, 1, 1)
-    completed1 = [r for r in manager1.all_requests if r.is_complete()]
-    for req in completed1:
-        color = 'green' if req.priority == Priority.HIGH else ('orange' if req.priority == Priority.MEDIUM else 'red')
-        plt.plot([req.creation_time, req.start_time, req.completion_time], 
-                 [req.id, req.id, req.id], 
-                 marker='o', 
-                 color=color,
-                 alpha=0.7)
+    plot_timeline(plt, completed1)
     plt.title('Request Timeline WITH Preemption')
     plt.xlabel('Time')
     plt.ylabel('Request ID')
     plt.text(0.02, 0.9, 'Color: Green=HIGH, Orange=MEDIUM, Red=LOW', transform=plt.gca().transAxes)
     
     plt.subplot(2, 1, 2)
-    completed2 = [r for r in manager2.all_requests if r.is_complete()]
-    for req in completed2:
-        color = 'green' if req.priority == Priority.HIGH else ('orange' if req.priority == Priority.MEDIUM else 'red')
-        plt.plot([req.creation_time, req.start_time, req.completion_time], 
-                 [req.id, req.id, req.id], 
-                 marker='o', 
-                 color=color,
-                 alpha=0.7)
+    plot_timeline(plt, completed2)
     plt.title('Request Timeline WITHOUT Preemption')
     plt.xlabel('Time')
     plt.ylabel('Request ID')
@@ -0,0 +1,6 @@
+"""Tooling for running and analysing the concurrency bug corpus.
+
+The scenarios under ``default_codes/`` and ``short_codes/`` are standalone
+scripts and stay that way; everything in this package drives them from the
+outside.
+"""
@@ -0,0 +1,189 @@
+"""Logging that keeps handler I/O out of the calling thread.
+
+Several scenarios log from inside critical sections, so every hold time used
+to include formatting the record and writing it to the terminal.
+:func:`basic_config` is a drop-in for ``logging.basicConfig`` that sets up the
+usual handlers and then puts one :class:`AsyncHandler` in front of them:
+
+* ``emit`` only appends the record to a bounded in-memory queue;
+* a background writer takes up to ``batch_size`` records at a time, formats
+  them and hands each target handler the whole batch (stream handlers get a
+  single ``write`` and ``flush`` per batch);
+* when the queue is full, ``policy="block"`` makes the caller wait for room
+  (backpressure, nothing lost) and ``policy="drop"`` discards the new record
+  and counts it.  The count is reported when the pipeline shuts down.
+
+Records are timestamped by ``logging`` when they are created, so asctime
+still shows when the event happened, not when it was written.  Everything
+queued is written before the interpreter exits.
+"""
+
+import atexit
+import collections
+import logging
+import sys
+import threading
+
+DEFAULT_CAPACITY = 10000
+DEFAULT_BATCH_SIZE = 256
+POLICIES = ("block", "drop")
+
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None))
+_CALLER_FIELDS = ("%(pathname)", "%(filename)", "%(module)", "%(funcName)", "%(lineno)")
+_PROCESS_FIELDS = ("%(process)", "%(processName)")
+
+
+class AsyncHandler(logging.Handler):
+    """Queue records for a background writer that feeds ``targets``."""
+
+    def __init__(self, targets, capacity=DEFAULT_CAPACITY, batch_size=DEFAULT_BATCH_SIZE,
+                 policy="block"):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, not {policy!r}")
+        super().__init__()
+        self.targets = list(targets)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.policy = policy
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._closing = False
+        self._busy = False
+        self._writer = threading.Thread(target=self._run, name="asynclog-writer", daemon=True)
+        self._writer.start()
+
+    def handle(self, record):
+        # The queue has its own lock; Handler.handle would add a second one.
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def prepare(self, record):
+        """Freeze what could change before the writer gets to the record."""
+        if record.args and not all(isinstance(a, _IMMUTABLE_ARGS) for a in
+                                   (record.args.values() if isinstance(record.args, dict)
+                                    else record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        record = self.prepare(record)
+        cond = self._cond
+        with cond:
+            queue = self._queue
+            if len(queue) >= self.capacity and not self._closing:
+                if self.policy == "drop":
+                    self.dropped += 1
+                    return
+                if threading.current_thread() is not self._writer:
+                    while len(queue) >= self.capacity and not self._closing:
+                        cond.wait()
+            queue.append(record)
+            if len(queue) == 1:
+                cond.notify_all()
+
+    def _take_batch(self):
+        cond = self._cond
+        with cond:
+            # The previous batch is written; wake flush() and blocked producers.
+            self._busy = False
+            cond.notify_all()
+            while not self._queue and not self._closing:
+                cond.wait()
+            queue = self._queue
+            batch = [queue.popleft() for _ in range(min(len(queue), self.batch_size))]
+            self._busy = bool(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            for target in self.targets:
+                try:
+                    _write_batch(target, batch)
+                except Exception:
+                    target.handleError(batch[-1])
+
+    def flush(self):
+        """Wait until everything queued so far has been written."""
+        cond = self._cond
+        with cond:
+            while (self._queue or self._busy) and self._writer.is_alive():
+                cond.wait()
+        for target in self.targets:
+            target.flush()
+
+    def close(self):
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        if self._writer.is_alive() and threading.current_thread() is not self._writer:
+            self._writer.join()
+        if self.dropped:
+            summary = logging.LogRecord("harness.asynclog", logging.WARNING, __file__, 0,
+                                        "%d log records dropped (queue full)",
+                                        (self.dropped,), None)
+            for target in self.targets:
+                target.handle(summary)
+        for target in self.targets:
+            target.flush()
+        super().close()
+
+
+def _write_batch(target, batch):
+    records = [r for r in batch if r.levelno >= target.level and target.filter(r)]
+    if not records:
+        return
+    stream = getattr(target, "stream", None)
+    if isinstance(target, logging.StreamHandler) and stream is not None:
+        text = "".join(target.format(r) + target.terminator for r in records)
+        with target.lock:
+            target.stream.write(text)
+            target.flush()
+    else:
+        for record in records:
+            target.handle(record)
+
+
+def basic_config(capacity=DEFAULT_CAPACITY, batch_size=DEFAULT_BATCH_SIZE, policy="block",
+                 **kwargs):
+    """``logging.basicConfig(**kwargs)`` with the handlers moved behind an
+    :class:`AsyncHandler`.  Returns that handler.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, AsyncHandler):
+            return handler
+    logging.basicConfig(**kwargs)
+    # The record is still built in the caller; skip the parts of it that
+    # the format never shows (see "Optimization" in the logging HOWTO).
+    fmt = kwargs.get("format", logging.BASIC_FORMAT)
+    if not any(field in fmt for field in _CALLER_FIELDS):
+        logging._srcfile = None
+    if not any(field in fmt for field in _PROCESS_FIELDS):
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+    targets = list(root.handlers)
+    handler = AsyncHandler(targets, capacity, batch_size, policy)
+    for target in targets:
+        root.removeHandler(target)
+    root.addHandler(handler)
+    atexit.register(_shutdown, handler)
+    return handler
+
+
+def _shutdown(handler):
+    try:
+        handler.close()
+    except Exception:
+        print("harness.asynclog: could not flush queued records", file=sys.stderr)
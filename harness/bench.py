@@ -0,0 +1,437 @@
+"""Benchmark the scenarios against a stored baseline.
+
+Every Python scenario is run in a fresh process with a fixed ``random`` seed.
+Scenarios listed in :data:`SCALED` run one of their own functions with
+parameters well above the demo values; the others run their ``__main__``
+block unchanged.  For each run the harness records
+
+* ``wall_time`` -- seconds spent in the benchmarked code,
+* ``ops_per_sec`` -- the benchmark's own operation count (requests, transfers,
+  ...) or, where none is defined, lock acquisitions, per second,
+* ``wait_p50_ns`` / ``wait_p99_ns`` -- lock wait percentiles over every lock
+  the scenario created (from :mod:`harness.lockstats`),
+* ``peak_rss_kb`` -- the process's peak resident set size.
+
+By default the runs use the virtual clock, so ``time.sleep`` costs nothing
+and ``wall_time`` measures the work the scenario actually does.  Waits are
+then in simulated time.  ``--real-time`` turns that off.
+
+    python -m harness.bench --save                 # record bench-baseline.json
+    python -m harness.bench                        # compare; exit 1 on regression
+    python -m harness.bench -k '*LP3*' --repeat 5
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import random
+import resource
+import runpy
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from harness import runner
+
+DEFAULT_BASELINE = runner.REPO_ROOT / "bench-baseline.json"
+DEFAULT_SEED = 1234
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    script: str
+    # Expression evaluated in the scenario's namespace; ``None`` runs the
+    # script as ``__main__``.
+    call: str | None = None
+    # Operations performed by ``call``; defaults to lock acquisitions.
+    ops: int | None = None
+    seed: int = DEFAULT_SEED
+
+
+@dataclass(frozen=True)
+class Metric:
+    name: str
+    higher_is_worse: bool
+    # Differences below this absolute amount are noise, whatever the ratio.
+    floor: float
+    # Percentiles come from power-of-two buckets, so moving up one bucket
+    # must not count as a regression by itself.
+    min_ratio: float = 0.0
+
+
+METRICS = (
+    Metric("wall_time", True, 0.05),
+    Metric("ops_per_sec", False, 0.0),
+    Metric("wait_p50_ns", True, 1_000_000, min_ratio=1.0),
+    Metric("wait_p99_ns", True, 1_000_000, min_ratio=1.0),
+    Metric("peak_rss_kb", True, 4096),
+)
+
+SCALED = {
+    "default_codes/AtomicViolation/a1.py": [
+        ("main", "main()", None),
+        ("Ledger.transfer_batch",
+         "run_ledger(num_accounts=1_000_000, num_transfers=1_000_000, batch_size=4096, "
+         "num_threads=4)", 1_000_000),
+    ],
+    "default_codes/AtomicViolation/a2.py": [
+        ("run_simulation", "run_simulation(num_users=50, operations_per_user=40)", 2000),
+        ("InventoryStore.update_many",
+         "run_store(num_products=1000, num_workers=8, orders_per_worker=5000)", 40000),
+    ],
+    "default_codes/AtomicViolation/a3.py": [
+        ("main", "main()", None),
+        ("SeatMap.reserve_first_available",
+         "run_stadium(rows=200, seats_per_row=500, num_users=200_000)", 200_000),
+    ],
+    "default_codes/AtomicViolation/a4.py": [
+        ("run_simulation", "run_simulation(num_users=40, messages_per_user=50)", 2000),
+        ("MessageLog.append", "run_message_log(num_users=16, messages_per_user=62_500)",
+         1_000_000),
+    ],
+    "default_codes/DeadLock/d1.py": [
+        ("__main__", None, None),
+        ("TransactionEngine:ordered", "run_engine('ordered')", 9600),
+        ("TransactionEngine:backoff", "run_engine('backoff')", 9600),
+    ],
+    "default_codes/DeadLock/d2.py": [
+        ("__main__", None, None),
+        ("run_grid", "run_grid(num_cars=20000, measure_memory=False)", 20000),
+    ],
+    "default_codes/DeadLock/d3.py": [
+        ("__main__", None, None),
+        ("LockManager:wait-die", "run_lock_table('wait-die')", 10000),
+        ("LockManager:wound-wait", "run_lock_table('wound-wait')", 10000),
+    ],
+    "default_codes/DeadLock/d4.py": [
+        ("__main__", None, None),
+        ("PacketRouter:xy", "run_router(num_packets=200_000)", 200_000),
+    ],
+    "default_codes/DeadLock/d5.py": [
+        ("__main__", None, None),
+        ("BankersAdmission", "run_admission()", 16000),
+    ],
+    "default_codes/LiveLock/l2.py": [
+        ("__main__", None, None),
+        ("MessageQueue.dequeue_batch", "run_queue_benchmark()", 200_000),
+    ],
+    "default_codes/LiveLock/l3.py": [
+        ("__main__", None, None),
+        ("DataItem.lock_blocking:detector", "run_simulation(blocking=True)", 5),
+        ("DataItem.lock_blocking:ordered", "run_simulation(blocking=True, ordered=True)", 5),
+        ("DataItem.lock_blocking:timeout", "run_simulation(blocking=True, lock_timeout=1.0)", 5),
+    ],
+    "default_codes/LiveLock/l4.py": [
+        ("__main__", None, None),
+        ("ResourceBroker:balanced", "run_production_line('balanced')", 4000),
+        ("ResourceBroker:workstation-bound", "run_production_line('workstation-bound')", 4000),
+        ("ResourceBroker:multi-tool", "run_production_line('multi-tool')", 6000),
+    ],
+    "default_codes/LiveLock/l5.py": [
+        ("__main__", None, None),
+        ("TokenRing", "run_token_ring(num_workers=8, handoffs=200_000)", 200_000),
+    ],
+    "default_codes/LockingProblem/LP1.py": [
+        ("run_simulation", "run_simulation(num_clients=40, transactions_per_client=25)", 1000),
+    ],
+    "default_codes/LockingProblem/LP3.py": [
+        ("simulate_web_server",
+         "simulate_web_server(num_workers=64, num_resources=8, num_requests=2000, "
+         "traffic_pattern='burst')", 2000),
+    ],
+    "default_codes/LockingProblem/LP4.py": [
+        ("simulate_resource_contention",
+         "simulate_resource_contention(num_threads=32, resource_use_range=(1, 3), "
+         "access_count=10)", 320),
+    ],
+    "default_codes/RaceCondtition/r2.py": [
+        ("run_experiment", "run_experiment(16, 2000)", 32000),
+    ],
+    "default_codes/Starvation/s2.py": [
+        ("PriorityBasedResourceManager", "run_simulation(num_threads=20, runtime_seconds=300)",
+         None),
+    ],
+    "default_codes/Starvation/s3.py": [
+        ("run_simulation", "run_simulation(duration=120)", None),
+    ],
+}
+
+
+def discover_benchmarks(roots=runner.CORPUS_ROOTS, patterns=None):
+    benchmarks = []
+    for path in runner.discover_scenarios(roots):
+        if path.suffix != ".py":
+            continue
+        rel = path.relative_to(runner.REPO_ROOT).as_posix()
+        entries = SCALED.get(rel)
+        if entries is None:
+            candidates = [Benchmark(rel, rel)]
+        else:
+            candidates = [Benchmark(f"{rel}:{label}", rel, call, ops)
+                          for label, call, ops in entries]
+        for bench in candidates:
+            if patterns and not any(fnmatch.fnmatch(bench.name, p) for p in patterns):
+                continue
+            benchmarks.append(bench)
+    return benchmarks
+
+
+# -- inside the benchmark process -------------------------------------------
+
+
+def _peak_rss_kb():
+    # ru_maxrss is in KiB on Linux; children cover multiprocessing scenarios.
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def _run_in_process(bench, virtual_clock):
+    from harness import launch, lockstats
+
+    # Measure with the real clock even when the scenario runs on virtual time.
+    perf_counter = time.perf_counter
+    if virtual_clock:
+        from harness import vclock
+        vclock.install()
+    lockstats.install()
+
+    script = str(runner.REPO_ROOT / bench.script)
+    sys.argv = [script]
+    sys.path.insert(0, os.path.dirname(script))
+    random.seed(bench.seed)
+    start = perf_counter()
+    try:
+        if bench.call is None:
+            try:
+                runpy.run_path(script, run_name="__main__")
+            except SystemExit as exc:
+                if exc.code not in (None, 0):
+                    raise
+        else:
+            namespace = runpy.run_path(script, run_name="__bench__")
+            eval(bench.call, namespace)
+    finally:
+        launch._join_non_daemon_threads()
+    wall_time = perf_counter() - start
+
+    locks = lockstats.combined()
+    waits = locks.wait_histogram()
+    ops = bench.ops if bench.ops is not None else locks.acquisitions
+    return {
+        "wall_time": wall_time,
+        "ops": ops,
+        "ops_per_sec": ops / wall_time if wall_time > 0 else 0.0,
+        "wait_p50_ns": waits.percentile(50),
+        "wait_p99_ns": waits.percentile(99),
+        "peak_rss_kb": _peak_rss_kb(),
+        "lock_acquisitions": locks.acquisitions,
+    }
+
+
+def _worker_main(spec_path, result_path):
+    spec = json.loads(Path(spec_path).read_text())
+    bench = Benchmark(**spec["benchmark"])
+    result = _run_in_process(bench, spec["virtual_clock"])
+    Path(result_path).write_text(json.dumps(result))
+    # Daemon threads of the scenario must not delay or break the exit.
+    os._exit(0)
+
+
+# -- driver -----------------------------------------------------------------
+
+
+def run_benchmark(bench, timeout, virtual_clock=True):
+    """Run ``bench`` once in a child process and return its metrics."""
+    env = dict(os.environ)
+    env.setdefault("MPLBACKEND", "Agg")
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [str(runner.REPO_ROOT), env.get("PYTHONPATH")]))
+    env["PYTHONHASHSEED"] = str(bench.seed)
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        workdir = Path(tmp)
+        spec_path = workdir / "spec.json"
+        result_path = workdir / "result.json"
+        spec_path.write_text(json.dumps({"benchmark": asdict(bench),
+                                         "virtual_clock": virtual_clock}))
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "harness.bench", "--worker", str(spec_path), str(result_path)],
+            cwd=workdir,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            _, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            runner._kill_group(proc)
+            proc.communicate()
+            return {"status": "timeout"}
+        finally:
+            runner._kill_group(proc)
+        try:
+            metrics = json.loads(result_path.read_text())
+        except (OSError, ValueError):
+            return {"status": "error", "stderr_tail": stderr[-2000:].decode(errors="replace")}
+    return {"status": "ok", **metrics}
+
+
+def _median_runs(runs):
+    ok = [run for run in runs if run["status"] == "ok"]
+    if not ok:
+        return runs[-1]
+    merged = {"status": "ok", "runs": len(ok)}
+    for key in ok[0]:
+        if key != "status":
+            merged[key] = statistics.median(run[key] for run in ok)
+    return merged
+
+
+def run_suite(benchmarks, repeat, timeout, virtual_clock=True, progress=None):
+    results = {}
+    for bench in benchmarks:
+        runs = []
+        for _ in range(repeat):
+            runs.append(run_benchmark(bench, timeout, virtual_clock))
+            # A scenario that hangs once will hang again; don't pay for it twice.
+            if runs[-1]["status"] != "ok":
+                break
+        results[bench.name] = _median_runs(runs)
+        if progress is not None:
+            progress(bench.name, results[bench.name])
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {"repeat": repeat, "timeout": timeout, "virtual_clock": virtual_clock},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Return one message per metric that regressed by more than ``threshold``.
+
+    A benchmark that ran in the baseline but no longer completes is a
+    regression; one that is missing from either side is ignored.
+    """
+    regressions = []
+    for name, now in current["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None or before["status"] != "ok":
+            continue
+        if now["status"] != "ok":
+            regressions.append(f"{name}: status {now['status']} (was ok)")
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric.name), now.get(metric.name)
+            if old is None or new is None:
+                continue
+            worse = new - old if metric.higher_is_worse else old - new
+            if worse <= metric.floor or not old:
+                continue
+            ratio = worse / old
+            if ratio > max(threshold, metric.min_ratio):
+                regressions.append(
+                    f"{name}: {metric.name} {_fmt(old)} -> {_fmt(new)} ({ratio:+.0%} worse)")
+    return regressions
+
+
+def _fmt(value):
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+
+def format_results(report):
+    lines = [f"{'benchmark':<64} {'status':>7} {'wall s':>8} {'ops/s':>10} "
+             f"{'wait p50':>9} {'wait p99':>9} {'rss MiB':>8}"]
+    for name, result in report["benchmarks"].items():
+        if result["status"] != "ok":
+            lines.append(f"{name[-64:]:<64} {result['status']:>7}")
+            continue
+        lines.append(
+            f"{name[-64:]:<64} {'ok':>7} {result['wall_time']:8.3f} {result['ops_per_sec']:10.1f} "
+            f"{_fmt_ns(result['wait_p50_ns']):>9} {_fmt_ns(result['wait_p99_ns']):>9} "
+            f"{result['peak_rss_kb'] / 1024:8.1f}")
+    return "\n".join(lines)
+
+
+def _fmt_ns(ns):
+    from harness.lockstats import _fmt_ns as fmt
+    return fmt(int(ns))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the scenarios against a baseline.")
+    parser.add_argument("-k", "--filter", action="append", dest="patterns",
+                        help="glob on the benchmark name, may be repeated")
+    parser.add_argument("--roots", nargs="+", default=list(runner.CORPUS_ROOTS))
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per benchmark; the median of each metric is kept")
+    parser.add_argument("-t", "--timeout", type=float, default=60.0,
+                        help="seconds before a run is killed")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save", action="store_true",
+                        help="write the results as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative change that counts as a regression")
+    parser.add_argument("--real-time", action="store_true",
+                        help="run on the real clock, so sleeps count towards wall time")
+    parser.add_argument("-o", "--output", help="also write the results as JSON here")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--worker", nargs=2, metavar=("SPEC", "RESULT"), help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.worker:
+        _worker_main(*args.worker)
+        return 0
+
+    benchmarks = discover_benchmarks(args.roots, args.patterns)
+    if args.list:
+        for bench in benchmarks:
+            print(bench.name)
+        return 0
+
+    def progress(name, result):
+        print(f"{result['status']:>8}  {result.get('wall_time', 0):8.3f}s  {name}",
+              file=sys.stderr)
+
+    report = run_suite(benchmarks, max(1, args.repeat), args.timeout,
+                       virtual_clock=not args.real_time, progress=progress)
+    print(format_results(report))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline)
+    if args.save:
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nbaseline written to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"\nno baseline at {baseline_path}; run with --save first")
+        return 0
+    regressions = compare(json.loads(baseline_path.read_text()), report, args.threshold)
+    if regressions:
+        print("\nregressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Contention managers for workers that take several locks by trying.
+
+The LiveLock scenarios take their first lock, try the second and, if it is
+held, release the first and sleep a fixed interval.  Two workers doing that
+against each other retry in lockstep forever.  A contention manager decides
+instead, once per worker:
+
+* on a conflict (a lock it wants is held), whether to wait for the holder
+  or give up and release what it has; and
+* after giving up, how long to back off before the next attempt.
+
+Policies, by name in :data:`POLICIES`:
+
+``fixed``
+    What the scenarios do today: give up at once, sleep ``base``.  Kept as
+    the baseline.
+``backoff``
+    Give up at once, back off exponentially with full jitter
+    (``uniform(0, min(cap, base * 2**failures))``).
+``priority``
+    Draw a random priority per attempt; wait for a lower-priority holder,
+    yield to a higher one.
+``karma``
+    Priority is the work lost to earlier aborted attempts (locks taken
+    and given up), ties going to the older attempt, so whoever has wasted
+    the most goes through next.
+``polite-aggressive``
+    Polite backoff for the first ``patience`` failures, after which the
+    worker waits for holders instead; between two aggressive workers the
+    older one waits.
+
+A priority is fixed when an attempt begins, while the worker holds nothing,
+and priorities are totally ordered, so waiting workers never form a cycle.
+
+:func:`acquire` runs the protocol on anything with ``lock`` and ``holder``
+attributes, such as :class:`ManagedLock`.  ``python -m harness.contention``
+measures completed critical sections per second for each policy with 2 to
+64 workers around a ring of locks.
+"""
+
+import argparse
+import itertools
+import random
+import sys
+import threading
+import time
+
+DEFAULT_BASE = 0.001
+DEFAULT_CAP = 0.1
+
+_tickets = itertools.count()
+
+
+class ContentionManager:
+    """Per-worker policy; the base class gives up at once and sleeps ``base``."""
+
+    name = "fixed"
+
+    def __init__(self, base=DEFAULT_BASE, cap=DEFAULT_CAP, rng=None):
+        self.base = base
+        self.cap = cap
+        self.rng = rng or random.Random()
+        self.failures = 0
+        self.taken = 0
+        self.ticket = None
+        self.priority = None
+
+    def begin(self):
+        """A new attempt at the critical section starts; nothing is held."""
+        if self.ticket is None:
+            self.ticket = next(_tickets)
+        self.taken = 0
+        self.priority = self._priority()
+
+    def _priority(self):
+        return None
+
+    def acquired(self):
+        self.taken += 1
+
+    def conflict(self, holder):
+        """Seconds to wait for ``holder`` (its manager, or None), or None to give up."""
+        if (self.priority is not None and holder is not None and type(holder) is type(self)
+                and holder.priority is not None and self.priority > holder.priority):
+            return self.base
+        return None
+
+    def backoff(self):
+        """The attempt was given up; seconds to sleep before the next one."""
+        self.failures += 1
+        return self.base
+
+    def committed(self):
+        self.failures = 0
+        self.ticket = None
+
+
+class ExponentialBackoff(ContentionManager):
+    name = "backoff"
+
+    def backoff(self):
+        self.failures += 1
+        return self.rng.uniform(0, min(self.cap, self.base * (1 << min(self.failures, 32))))
+
+
+class RandomizedPriority(ContentionManager):
+    name = "priority"
+
+    def _priority(self):
+        return self.rng.random()
+
+    def backoff(self):
+        self.failures += 1
+        return self.rng.uniform(0, self.base)
+
+
+class Karma(ContentionManager):
+    name = "karma"
+
+    def __init__(self, base=DEFAULT_BASE, cap=DEFAULT_CAP, rng=None):
+        super().__init__(base, cap, rng)
+        self.karma = 0
+
+    def _priority(self):
+        return (self.karma, -self.ticket)
+
+    def backoff(self):
+        self.failures += 1
+        self.karma += self.taken + 1
+        return self.rng.uniform(0, self.base)
+
+    def committed(self):
+        super().committed()
+        self.karma = 0
+
+
+class PoliteThenAggressive(ExponentialBackoff):
+    name = "polite-aggressive"
+
+    def __init__(self, base=DEFAULT_BASE, cap=DEFAULT_CAP, rng=None, patience=3):
+        super().__init__(base, cap, rng)
+        self.patience = patience
+
+    def _priority(self):
+        if self.failures < self.patience:
+            return None
+        return -self.ticket
+
+    def conflict(self, holder):
+        if self.priority is None:
+            return None
+        if holder is not None and getattr(holder, "priority", None) is None:
+            # Polite holders give way on their own next conflict.
+            return self.base
+        return super().conflict(holder)
+
+
+POLICIES = {cls.name: cls for cls in (ContentionManager, ExponentialBackoff, RandomizedPriority,
+                                      Karma, PoliteThenAggressive)}
+
+
+def make(policy, **kwargs):
+    """A new manager for ``policy`` (a name from :data:`POLICIES`)."""
+    try:
+        cls = POLICIES[policy]
+    except KeyError:
+        raise ValueError(f"policy must be one of {tuple(POLICIES)}, not {policy!r}") from None
+    return cls(**kwargs)
+
+
+class ManagedLock:
+    """A lock that remembers the manager of whoever holds it."""
+
+    __slots__ = ("lock", "holder")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.holder = None
+
+    def release(self):
+        self.holder = None
+        self.lock.release()
+
+
+def acquire(resource, manager):
+    """Take ``resource.lock`` for ``manager``; False if the manager gave up.
+
+    ``resource.holder`` is set to ``manager`` on success, and must be reset
+    to None by whoever releases the lock.
+    """
+    lock = resource.lock
+    acquired = lock.acquire(False)
+    while not acquired:
+        wait = manager.conflict(resource.holder)
+        if wait is None:
+            return False
+        acquired = lock.acquire(timeout=wait)
+    resource.holder = manager
+    manager.acquired()
+    return True
+
+
+# -- progress-rate benchmark ------------------------------------------------
+
+
+def progress_rate(policy, workers, duration=1.0, critical_section=0.0001, step=DEFAULT_BASE,
+                  seed=0, **kwargs):
+    """Completed critical sections per second with ``workers`` around a ring.
+
+    Worker ``i`` needs locks ``i`` and ``i + 1`` and takes them in that
+    order, pausing ``step`` in between: the dining philosophers with
+    try-locks, where a naive policy livelocks.
+    """
+    locks = [ManagedLock() for _ in range(max(workers, 2))]
+    completed = [0] * workers
+    deadline = time.monotonic() + duration
+
+    def worker(i):
+        manager = make(policy, rng=random.Random(seed * 1000 + i), **kwargs)
+        first, second = locks[i], locks[(i + 1) % len(locks)]
+        done = 0
+        while time.monotonic() < deadline:
+            manager.begin()
+            if acquire(first, manager):
+                time.sleep(step)
+                if acquire(second, manager):
+                    time.sleep(critical_section)
+                    done += 1
+                    second.release()
+                    first.release()
+                    manager.committed()
+                    continue
+                first.release()
+            time.sleep(manager.backoff())
+        completed[i] = done
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    return sum(completed) / elapsed if elapsed else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Completed critical sections per second for each contention policy.")
+    parser.add_argument("--policies", nargs="+", default=list(POLICIES), choices=list(POLICIES))
+    parser.add_argument("--workers", nargs="+", type=int, default=[2, 4, 8, 16, 32, 64])
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per measurement")
+    parser.add_argument("--base", type=float, default=DEFAULT_BASE)
+    parser.add_argument("--cap", type=float, default=DEFAULT_CAP)
+    args = parser.parse_args(argv)
+
+    print(f"{'policy':<18}" + "".join(f"{n:>10}" for n in args.workers))
+    for policy in args.policies:
+        rates = [progress_rate(policy, n, args.duration, base=args.base, cap=args.cap)
+                 for n in args.workers]
+        print(f"{policy:<18}" + "".join(f"{rate:>10,.0f}" for rate in rates), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
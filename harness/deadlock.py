@@ -0,0 +1,404 @@
+"""Online wait-for-graph deadlock detection.
+
+Tracked locks, re-entrant locks and semaphores remember which threads hold
+them.  An acquire that succeeds immediately only updates that holder field.
+An acquire that has to block first records the resource as the thread's
+*wants* edge and then follows the graph from it -- resource, its holders,
+what those holders want, and so on.  No graph is ever rebuilt.  A cycle can
+only be closed by a thread that is starting to wait, so checking at that
+moment finds every deadlock when it forms.  The check costs the length of the
+chain it walks.
+
+Holders are recorded after the real acquire and cleared before the real
+release, so every holder edge the walk sees is genuine.  Because the walk
+itself takes no global lock, a candidate cycle is confirmed by re-walking it
+after a short grace period before it is reported.
+
+A resource with several holders (a semaphore with value > 1) only blocks a
+waiter if *all* holders are stuck, so such a resource closes a cycle only
+when every one of its holders is itself waiting.
+
+``install()`` puts the tracked primitives into ``threading``; ``harness.launch``
+does so for ``--deadlock`` (reports on stderr) and ``--deadlock-json PATH``
+(also a JSON list at exit), or when ``HARNESS_DEADLOCK`` is ``1`` or a path.
+"""
+
+import abc
+import atexit
+import gc
+import json
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+CONFIRM_SECONDS = 0.002
+
+_base_lock = threading.Lock
+_base_rlock = threading.RLock
+_base_semaphore = threading.Semaphore
+_base_bounded_semaphore = threading.BoundedSemaphore
+_get_ident = threading.get_ident
+
+# thread ident -> resource it is blocked on
+_wants = {}
+_detector = None
+
+
+class DeadlockError(RuntimeError):
+    def __init__(self, report):
+        super().__init__(report.describe())
+        self.report = report
+
+
+@dataclass
+class DeadlockReport:
+    cycle: list = field(default_factory=list)
+    detected_at: float = 0.0
+    detected_by: str = ""
+
+    def describe(self):
+        parts = [f"{edge['thread']} holds {edge['holds']}, wants {edge['wants']}"
+                 for edge in self.cycle]
+        return "deadlock: " + "; ".join(parts)
+
+
+class _Tracked(abc.ABC):
+    """Holder bookkeeping shared by all tracked primitives."""
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def _holder_idents(self):
+        """Idents of the threads holding the primitive now."""
+
+    def _wait_for(self, acquire, blocking, timeout):
+        """Slow path: register the wait, check for a cycle, then block."""
+        me = _get_ident()
+        if me in _wants:
+            # Already waiting on an outer tracked primitive whose
+            # implementation uses this one; that outer wait is the edge.
+            return acquire(blocking, timeout)
+        _wants[me] = self
+        try:
+            if _detector is not None:
+                cycle = _detector.find_cycle(me)
+                if cycle is not None:
+                    # Give a holder that is about to release the chance to do so.
+                    grace = CONFIRM_SECONDS if timeout == -1 else min(timeout, CONFIRM_SECONDS)
+                    if acquire(True, grace):
+                        return True
+                    if timeout != -1:
+                        timeout = max(timeout - grace, 0)
+                    if _detector.find_cycle(me) == cycle:
+                        _detector.report(me, cycle)
+            return acquire(blocking, timeout)
+        finally:
+            del _wants[me]
+
+
+class TrackedLock(_Tracked):
+    __slots__ = ("_lock", "_holder", "name", "__weakref__")
+
+    def __init__(self, name=None):
+        self._lock = _base_lock()
+        self._holder = None
+        self.name = name
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False) or (
+                blocking and self._wait_for(self._lock.acquire, blocking, timeout)):
+            self._holder = _get_ident()
+            return True
+        return False
+
+    def release(self):
+        self._holder = None
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def _is_owned(self):
+        return self._holder == _get_ident()
+
+    def _holder_idents(self):
+        holder = self._holder
+        return () if holder is None else (holder,)
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._holder = None
+
+
+class TrackedRLock(_Tracked):
+    __slots__ = ("_lock", "_holder", "_depth", "name", "__weakref__")
+
+    def __init__(self, name=None):
+        self._lock = _base_rlock()
+        self._holder = None
+        self._depth = 0
+        self.name = name
+
+    def acquire(self, blocking=True, timeout=-1):
+        me = _get_ident()
+        if self._holder == me:
+            self._lock.acquire()
+            self._depth += 1
+            return True
+        if self._lock.acquire(False) or (
+                blocking and self._wait_for(self._lock.acquire, blocking, timeout)):
+            self._holder = me
+            self._depth = 1
+            return True
+        return False
+
+    def release(self):
+        if self._holder != _get_ident():
+            raise RuntimeError("cannot release un-acquired lock")
+        self._depth -= 1
+        if not self._depth:
+            self._holder = None
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _release_save(self):
+        state = (self._lock._release_save(), self._depth)
+        self._holder = None
+        self._depth = 0
+        return state
+
+    def _acquire_restore(self, state):
+        inner, depth = state
+        self._lock._acquire_restore(inner)
+        self._holder = _get_ident()
+        self._depth = depth
+
+    def _is_owned(self):
+        return self._holder == _get_ident()
+
+    def _holder_idents(self):
+        holder = self._holder
+        return () if holder is None else (holder,)
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._holder = None
+        self._depth = 0
+
+
+class TrackedSemaphore(_Tracked):
+    """Semaphore that attributes each unit to the thread that took it.
+
+    A release by a thread that holds no unit (semaphores allow that) gives
+    back the unit of an arbitrary holder.
+    """
+
+    __slots__ = ("_sem", "_holders", "name", "__weakref__")
+
+    def __init__(self, value=1, name=None):
+        self._sem = self._make(value)
+        self._holders = {}
+        self.name = name
+
+    def _make(self, value):
+        return _base_semaphore(value)
+
+    def acquire(self, blocking=True, timeout=None):
+        sem = self._sem
+        if sem.acquire(False) or (blocking and self._wait_for(
+                lambda _blocking, t: sem.acquire(True, None if t == -1 else t),
+                blocking, -1 if timeout is None else timeout)):
+            me = _get_ident()
+            holders = self._holders
+            holders[me] = holders.get(me, 0) + 1
+            return True
+        return False
+
+    def release(self, n=1):
+        holders = self._holders
+        me = _get_ident()
+        for _ in range(n):
+            owner = me if me in holders else next(iter(holders), None)
+            if owner is not None:
+                left = holders.get(owner, 1) - 1
+                if left > 0:
+                    holders[owner] = left
+                else:
+                    holders.pop(owner, None)
+        self._sem.release(n)
+
+    def _holder_idents(self):
+        return tuple(self._holders)
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class TrackedBoundedSemaphore(TrackedSemaphore):
+    __slots__ = ()
+
+    def _make(self, value):
+        return _base_bounded_semaphore(value)
+
+
+class Detector:
+    def __init__(self, policy="report", stream=sys.stderr):
+        self.policy = policy
+        self.stream = stream
+        self.reports = []
+        self._lock = _base_lock()
+
+    def find_cycle(self, start):
+        """Return the cycle through ``start`` as ``[(ident, resource), ...]``."""
+        path = []
+        on_path = {start}
+
+        def stuck(ident):
+            resource = _wants.get(ident)
+            if resource is None:
+                return False
+            holders = resource._holder_idents()
+            if not holders:
+                return False
+            path.append((ident, resource))
+            if len(holders) == 1:
+                holder = holders[0]
+                if holder == start:
+                    return True
+                if holder not in on_path:
+                    on_path.add(holder)
+                    if stuck(holder):
+                        return True
+                    on_path.discard(holder)
+            elif all(h in _wants for h in holders):
+                # Every holder is waiting; follow the one leading back.
+                for holder in holders:
+                    if holder == start:
+                        return True
+                    if holder not in on_path:
+                        on_path.add(holder)
+                        if stuck(holder):
+                            return True
+                        on_path.discard(holder)
+            path.pop()
+            return False
+
+        try:
+            return path if stuck(start) else None
+        except RecursionError:
+            return None
+
+    def report(self, ident, cycle):
+        threads = threading._active
+        edges = []
+        for i, (waiter, wanted) in enumerate(cycle):
+            held = cycle[i - 1][1]
+            thread = threads.get(waiter)
+            edges.append({
+                "thread": thread.name if thread is not None else f"thread {waiter}",
+                "holds": describe_resource(held),
+                "wants": describe_resource(wanted),
+            })
+        report = DeadlockReport(edges, time.time(), edges[0]["thread"])
+        with self._lock:
+            self.reports.append(report)
+        if self.stream is not None:
+            print(report.describe(), file=self.stream, flush=True)
+        if self.policy == "raise":
+            raise DeadlockError(report)
+
+
+def describe_resource(resource):
+    """Best-effort readable name, e.g. ``DatabaseRecord(record_id=3).lock``."""
+    if getattr(resource, "name", None):
+        return resource.name
+    kind = type(resource).__name__.replace("Tracked", "")
+    for referrer in gc.get_referrers(resource):
+        if isinstance(referrer, dict):
+            attr = next((k for k, v in referrer.items() if v is resource), None)
+            if attr is None:
+                continue
+            for owner in gc.get_referrers(referrer):
+                if getattr(owner, "__dict__", None) is referrer:
+                    return f"{_describe_owner(owner)}.{attr}"
+            if "__builtins__" in referrer and "__name__" in referrer:
+                return f"{referrer['__name__']}.{attr}"
+        elif isinstance(getattr(referrer, "__dict__", None), dict):
+            # Instance dictionaries are often not materialised as separate
+            # objects, so the instance itself shows up as the referrer.
+            attr = next((k for k, v in vars(referrer).items() if v is resource), None)
+            if attr is not None:
+                return f"{_describe_owner(referrer)}.{attr}"
+    return f"{kind}@{id(resource):#x}"
+
+
+def _describe_owner(owner):
+    fields = vars(owner)
+    for key, value in fields.items():
+        if (key.endswith("id") or key == "name") and isinstance(value, (int, str)):
+            return f"{type(owner).__name__}({key}={value!r})"
+    return type(owner).__name__
+
+
+def Lock(name=None):
+    return TrackedLock(name)
+
+
+def RLock(name=None):
+    return TrackedRLock(name)
+
+
+def Semaphore(value=1, name=None):
+    return TrackedSemaphore(value, name)
+
+
+def BoundedSemaphore(value=1, name=None):
+    return TrackedBoundedSemaphore(value, name)
+
+
+def _write_reports(target, detector):
+    if target not in ("1", "-", "stderr"):
+        with open(target, "w") as f:
+            json.dump([asdict(r) for r in detector.reports], f, indent=2)
+
+
+def install(report=None, policy="report"):
+    """Track ``threading.Lock``/``RLock``/``Semaphore``/``BoundedSemaphore``.
+
+    ``policy="raise"`` makes the acquire that closes a cycle raise
+    :class:`DeadlockError` instead of blocking forever.
+    """
+    global _detector, _base_lock, _base_rlock, _base_semaphore, _base_bounded_semaphore
+    if threading.Lock is Lock:
+        return _detector
+    _base_lock = threading.Lock
+    _base_rlock = threading.RLock
+    _base_semaphore = threading.Semaphore
+    _base_bounded_semaphore = threading.BoundedSemaphore
+    _detector = Detector(policy)
+    threading.Lock = Lock
+    threading.RLock = RLock
+    threading.Semaphore = Semaphore
+    threading.BoundedSemaphore = BoundedSemaphore
+    if report:
+        atexit.register(_write_reports, report, _detector)
+    return _detector
+
+
+def enable(policy="report", stream=sys.stderr):
+    """Detect with explicitly created tracked primitives only."""
+    global _detector
+    _detector = Detector(policy, stream)
+    return _detector
@@ -0,0 +1,658 @@
+"""Systematic exploration of thread interleavings.
+
+Runs a target callable many times under a controlled scheduler that lets
+exactly one thread run at a time.  Threads are only switched at *scheduling
+points*: lock acquire/release (and therefore Condition, Event, Semaphore and
+``queue.Queue`` operations), ``time.sleep``, ``Thread.join`` and every read or
+write of an instance attribute of the ``watch``-ed classes.  Each execution is
+fully determined by the sequence of thread choices, so any failure can be
+replayed from its token.
+
+Two strategies are available:
+
+``dpor``
+    Dynamic partial-order reduction (Flanagan & Godefroid, 2005).  Only
+    reorderings of *dependent* operations -- accesses to the same attribute
+    where at least one is a write, or operations on the same lock -- are
+    explored, so schedules that differ only in the order of independent steps
+    are run once.  Exhausting the search proves there is no failing schedule.
+
+``random``
+    Picks a random runnable thread at every scheduling point; the token of a
+    failing run is its seed.
+
+Example::
+
+    python -m harness.explore default_codes/RaceCondtition/r2.py \\
+        --call "run_experiment(2, 1)" --check "result == 2" --watch Counter
+"""
+
+import _thread
+import argparse
+import contextlib
+import io
+import random
+import runpy
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import NamedTuple
+
+_real_sleep = time.sleep
+_real_allocate_lock = _thread.allocate_lock
+
+_scheduler = None
+
+
+class _Abort(BaseException):
+    """Unwinds controlled threads once an execution has been abandoned."""
+
+
+class Op(NamedTuple):
+    kind: str
+    key: object = None
+    target: object = None
+    label: str = ""
+
+    def depends_on(self, other):
+        if self.key is None or self.key != other.key:
+            return False
+        return self.kind != "read" or other.kind != "read"
+
+
+_BEGIN = Op("begin", label="begin")
+_SLEEP = Op("sleep", label="sleep")
+
+
+class _ThreadRecord:
+    __slots__ = ("tid", "name", "gate", "pending", "finished", "thread")
+
+    def __init__(self, tid, name, thread=None):
+        self.tid = tid
+        self.name = name
+        self.gate = _real_allocate_lock()
+        self.gate.acquire()
+        self.pending = None
+        self.finished = False
+        self.thread = thread
+
+
+class ControlledLock:
+    """Lock whose operations are scheduling points for controlled threads.
+
+    Threads the scheduler does not control (and ``threading`` internals run
+    while starting a thread) fall through to an ordinary lock.
+    """
+
+    __slots__ = ("_real", "_held", "__weakref__")
+
+    def __init__(self):
+        self._real = _real_allocate_lock()
+        self._held = False
+
+    def acquire(self, blocking=True, timeout=-1):
+        sched = _scheduler
+        if sched is not None and sched.controlled() is not None:
+            kind = "acquire" if blocking and timeout == -1 else "try_acquire"
+            sched.point(Op(kind, ("lock", id(self)), self, f"{kind} lock@{id(self):#x}"))
+            if self._held:
+                return False
+            self._held = True
+            self._real.acquire(False)
+            return True
+        if self._real.acquire(blocking, timeout):
+            self._held = True
+            return True
+        return False
+
+    def release(self):
+        sched = _scheduler
+        if sched is not None and sched.controlled() is not None:
+            sched.point(Op("release", ("lock", id(self)), self, f"release lock@{id(self):#x}"))
+        if not self._held:
+            raise RuntimeError("release unlocked lock")
+        self._held = False
+        self._real.release()
+
+    def locked(self):
+        return self._held
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _at_fork_reinit(self):
+        self._real = _real_allocate_lock()
+        self._held = False
+
+
+class _Scheduler:
+    def __init__(self, strategy, max_steps):
+        self.strategy = strategy
+        self.max_steps = max_steps
+        self.records = []
+        self.by_ident = {}
+        self.local = threading.local()
+        self.steps = []
+        self.failure = None
+        self.aborted = False
+        self.done_gate = _real_allocate_lock()
+        self.done_gate.acquire()
+
+    def controlled(self):
+        if getattr(self.local, "internal", False):
+            return None
+        return self.by_ident.get(_thread.get_ident())
+
+    # -- thread bookkeeping -------------------------------------------------
+
+    def register_main(self):
+        rec = _ThreadRecord(0, "main")
+        self.records.append(rec)
+        self.by_ident[_thread.get_ident()] = rec
+        return rec
+
+    def spawn(self, thread):
+        parent = self.controlled()
+        rec = _ThreadRecord(len(self.records), thread.name, thread)
+        rec.pending = _BEGIN
+        self.records.append(rec)
+        self.strategy.on_spawn(parent.tid, rec.tid)
+        return rec
+
+    def run_thread(self, rec, run):
+        self.by_ident[_thread.get_ident()] = rec
+        rec.gate.acquire()
+        try:
+            if self.aborted:
+                return
+            run()
+        except _Abort:
+            pass
+        except BaseException as exc:
+            self.fail(f"exception in thread {rec.tid} ({rec.name}): {exc!r}",
+                      traceback.format_exc())
+        finally:
+            self.finish(rec)
+            # Thread idents are reused once the OS thread is gone.
+            self.by_ident.pop(_thread.get_ident(), None)
+
+    def finish(self, rec):
+        if self.aborted:
+            return
+        rec.finished = True
+        rec.pending = None
+        try:
+            self._schedule(rec)
+        except _Abort:
+            pass
+
+    # -- scheduling ---------------------------------------------------------
+
+    def point(self, op):
+        rec = self.controlled()
+        rec.pending = op
+        self._schedule(rec)
+
+    def _enabled(self, rec):
+        op = rec.pending
+        if op.kind == "acquire":
+            return not op.target._held
+        if op.kind == "join":
+            return op.target.finished
+        return True
+
+    def _schedule(self, rec):
+        if self.aborted:
+            raise _Abort
+        alive = [r for r in self.records if not r.finished]
+        enabled = [r for r in alive if self._enabled(r)]
+        if not enabled:
+            if alive:
+                waiting = ", ".join(f"{r.tid}:{r.pending.label}" for r in alive)
+                self.fail(f"deadlock: no runnable thread ({waiting})")
+            else:
+                self.done_gate.release()
+            if self.aborted and not rec.finished:
+                raise _Abort
+            return
+        if len(self.steps) >= self.max_steps:
+            self.fail(f"step limit of {self.max_steps} reached", status="step_limit")
+            raise _Abort
+        nxt = self.strategy.choose(self, alive, enabled, rec)
+        if nxt is None:
+            self.fail("schedule does not match this program", status="diverged")
+            raise _Abort
+        self.steps.append((nxt.tid, nxt.pending))
+        if nxt is rec:
+            return
+        nxt.gate.release()
+        if not rec.finished:
+            rec.gate.acquire()
+            if self.aborted:
+                raise _Abort
+
+    def fail(self, reason, details="", status="failed"):
+        if self.failure is None:
+            self.failure = (status, reason, details)
+        self.abort()
+
+    def abort(self):
+        if self.aborted:
+            return
+        self.aborted = True
+        for rec in self.records:
+            if not rec.finished:
+                rec.gate.release()
+        self.done_gate.release()
+
+
+# -- strategies --------------------------------------------------------------
+
+
+class _State:
+    __slots__ = ("enabled", "backtrack", "done", "chosen")
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.backtrack = set()
+        self.done = set()
+        self.chosen = None
+
+
+def _default_choice(enabled_ids, current):
+    # Keep running the current thread when possible; preemptions are then
+    # introduced only where the search asks for them.
+    return current.tid if current.tid in enabled_ids else min(enabled_ids)
+
+
+class _DporStrategy:
+    name = "dpor"
+
+    def __init__(self):
+        self.stack = []
+
+    def begin(self):
+        self.depth = 0
+        self.reused = len(self.stack)
+        self.transitions = []
+        self.clocks = {0: {}}
+
+    def on_spawn(self, parent, child):
+        self.clocks[child] = dict(self.clocks.get(parent, {}))
+
+    def choose(self, sched, alive, enabled, current):
+        n = self.depth
+        enabled_ids = frozenset(r.tid for r in enabled)
+        if n < len(self.stack):
+            tid = self.stack[n].chosen
+            if tid not in enabled_ids:
+                return None
+        else:
+            state = _State(enabled_ids)
+            self.stack.append(state)
+            self._add_backtrack_points(alive)
+            tid = _default_choice(enabled_ids, current)
+            state.chosen = tid
+            state.backtrack.add(tid)
+            state.done.add(tid)
+        rec = sched.records[tid]
+        self._record(tid, rec.pending)
+        self.depth += 1
+        return rec
+
+    def _add_backtrack_points(self, alive):
+        transitions = self.transitions
+        for rec in alive:
+            op = rec.pending
+            if op.key is None:
+                continue
+            clock = self.clocks.get(rec.tid, {})
+            for i in range(len(transitions) - 1, -1, -1):
+                tid_i, op_i, _ = transitions[i]
+                if tid_i == rec.tid or not op_i.depends_on(op):
+                    continue
+                if i <= clock.get(tid_i, -1):
+                    continue  # already ordered before rec's next step
+                pre = self.stack[i]
+                if rec.tid in pre.enabled:
+                    pre.backtrack.add(rec.tid)
+                else:
+                    pre.backtrack.update(pre.enabled)
+                break
+
+    def _record(self, tid, op):
+        clock = dict(self.clocks.get(tid, {}))
+        if op.key is not None:
+            for _, other, other_clock in self.transitions:
+                if other.depends_on(op):
+                    _merge(clock, other_clock)
+        if op.kind == "join":
+            _merge(clock, self.clocks.get(op.target.tid, {}))
+        clock[tid] = len(self.transitions)
+        self.transitions.append((tid, op, clock))
+        self.clocks[tid] = clock
+
+    def advance(self):
+        while self.stack:
+            state = self.stack[-1]
+            todo = state.backtrack - state.done
+            if todo:
+                state.chosen = min(todo)
+                state.done.add(state.chosen)
+                return True
+            self.stack.pop()
+        return False
+
+    def token(self, sched):
+        return "s:" + ".".join(str(tid) for tid, _ in sched.steps)
+
+
+def _merge(into, other):
+    for tid, index in other.items():
+        if index > into.get(tid, -1):
+            into[tid] = index
+
+
+class _RandomStrategy:
+    name = "random"
+
+    def __init__(self, seed):
+        self.seed = seed
+
+    def begin(self):
+        self.rng = random.Random(self.seed)
+
+    def on_spawn(self, parent, child):
+        pass
+
+    def choose(self, sched, alive, enabled, current):
+        return self.rng.choice(enabled)
+
+    def advance(self):
+        self.seed += 1
+        return True
+
+    def token(self, sched):
+        return f"r:{self.seed}"
+
+
+class _ReplayStrategy:
+    name = "replay"
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+
+    def begin(self):
+        self.depth = 0
+
+    def on_spawn(self, parent, child):
+        pass
+
+    def choose(self, sched, alive, enabled, current):
+        by_tid = {r.tid: r for r in enabled}
+        if self.depth < len(self.schedule):
+            rec = by_tid.get(self.schedule[self.depth])
+        else:
+            rec = by_tid[_default_choice(by_tid.keys(), current)]
+        self.depth += 1
+        return rec
+
+    def advance(self):
+        return False
+
+    def token(self, sched):
+        return "s:" + ".".join(str(tid) for tid, _ in sched.steps)
+
+
+def _strategy_from_token(token):
+    kind, _, value = token.partition(":")
+    if kind == "r":
+        return _RandomStrategy(int(value))
+    if kind == "s":
+        return _ReplayStrategy([int(tid) for tid in value.split(".") if tid])
+    raise ValueError(f"not a schedule token: {token!r}")
+
+
+# -- instrumentation ---------------------------------------------------------
+
+
+def _watch_class(cls, undo):
+    own = cls.__dict__
+    orig_get = cls.__getattribute__
+    orig_set = cls.__setattr__
+    name = cls.__name__
+
+    def __getattribute__(self, attr):
+        sched = _scheduler
+        if sched is not None and sched.controlled() is not None:
+            try:
+                instance_dict = object.__getattribute__(self, "__dict__")
+            except AttributeError:
+                instance_dict = ()
+            if attr in instance_dict:
+                sched.point(Op("read", (id(self), attr), self, f"read {name}.{attr}"))
+        return orig_get(self, attr)
+
+    def __setattr__(self, attr, value):
+        sched = _scheduler
+        if sched is not None and sched.controlled() is not None:
+            sched.point(Op("write", (id(self), attr), self, f"write {name}.{attr}"))
+        orig_set(self, attr, value)
+
+    for attr, func in (("__getattribute__", __getattribute__), ("__setattr__", __setattr__)):
+        undo.append((cls, attr, own.get(attr)))
+        setattr(cls, attr, func)
+
+
+@contextlib.contextmanager
+def _instrumented(watch=()):
+    undo = [
+        (threading, "Lock", threading.Lock),
+        (threading, "_allocate_lock", threading._allocate_lock),
+        (threading, "_CRLock", threading._CRLock),
+        (time, "sleep", time.sleep),
+        (threading.Thread, "start", threading.Thread.__dict__["start"]),
+        (threading.Thread, "join", threading.Thread.__dict__["join"]),
+    ]
+    real_start = threading.Thread.start
+    real_join = threading.Thread.join
+
+    def start(self):
+        sched = _scheduler
+        parent = sched.controlled() if sched is not None else None
+        if parent is None:
+            return real_start(self)
+        rec = sched.spawn(self)
+        self._explore_record = rec
+        run = self.run
+        self.run = lambda: sched.run_thread(rec, run)
+        sched.local.internal = True
+        try:
+            real_start(self)
+        finally:
+            sched.local.internal = False
+
+    def join(self, timeout=None):
+        sched = _scheduler
+        rec = getattr(self, "_explore_record", None)
+        if rec is None or sched is None or sched.controlled() is None:
+            return real_join(self, timeout)
+        sched.point(Op("join", ("thread", rec.tid), rec, f"join thread {rec.tid}"))
+        real_join(self)
+
+    def sleep(secs):
+        sched = _scheduler
+        if sched is not None and sched.controlled() is not None:
+            sched.point(_SLEEP)
+        else:
+            _real_sleep(secs)
+
+    threading.Lock = threading._allocate_lock = ControlledLock
+    threading._CRLock = None
+    time.sleep = sleep
+    threading.Thread.start = start
+    threading.Thread.join = join
+    try:
+        for cls in watch:
+            _watch_class(cls, undo)
+        yield
+    finally:
+        for owner, attr, value in reversed(undo):
+            if value is None and owner is not threading:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, value)
+
+
+# -- driver ------------------------------------------------------------------
+
+
+@dataclass
+class Execution:
+    index: int
+    token: str
+    status: str
+    reason: str = ""
+    details: str = ""
+    result: object = None
+    trace: list = field(default_factory=list)
+
+    def describe_trace(self):
+        return [f"T{tid} {op.label}" for tid, op in self.trace]
+
+
+@dataclass
+class Report:
+    strategy: str
+    executions: int = 0
+    exhausted: bool = False
+    failures: list = field(default_factory=list)
+
+
+def _run_once(target, check, strategy, index, max_steps, random_seed, quiet):
+    global _scheduler
+    sched = _Scheduler(strategy, max_steps)
+    strategy.begin()
+    random.seed(random_seed)
+    main = sched.register_main()
+    _scheduler = sched
+    result = None
+    out = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(out) if quiet else contextlib.nullcontext():
+        try:
+            result = target()
+        except _Abort:
+            pass
+        except Exception as exc:
+            sched.fail(f"exception in main: {exc!r}", traceback.format_exc())
+        finally:
+            sched.finish(main)
+            sched.done_gate.acquire()
+            _scheduler = None
+            for rec in sched.records[1:]:
+                rec.thread.join(1.0)
+
+    status, reason, details = sched.failure or ("ok", "", "")
+    if status == "ok" and check is not None:
+        try:
+            if check(result) is False:
+                status, reason = "failed", f"check failed for result {result!r}"
+        except AssertionError as exc:
+            status, reason, details = "failed", f"check failed: {exc}", traceback.format_exc()
+    return Execution(index, strategy.token(sched), status, reason, details, result, sched.steps)
+
+
+def explore(target, check=None, watch=(), strategy="dpor", max_executions=1000,
+            max_steps=10000, seed=0, random_seed=0, stop_on_failure=True, quiet=True):
+    """Run ``target`` under as many distinct schedules as needed.
+
+    ``check(result)`` decides whether an execution failed, by returning False
+    or raising AssertionError; deadlocks and exceptions in any controlled
+    thread always count as failures.
+    """
+    if strategy == "dpor":
+        strat = _DporStrategy()
+    elif strategy == "random":
+        strat = _RandomStrategy(seed)
+    else:
+        raise ValueError(f"unknown strategy {strategy!r}")
+    report = Report(strat.name)
+    with _instrumented(watch):
+        for index in range(max_executions):
+            execution = _run_once(target, check, strat, index, max_steps, random_seed, quiet)
+            report.executions += 1
+            if execution.status == "failed":
+                report.failures.append(execution)
+                if stop_on_failure:
+                    break
+            if not strat.advance():
+                report.exhausted = True
+                break
+    return report
+
+
+def replay(target, token, check=None, watch=(), max_steps=10000, random_seed=0, quiet=False):
+    """Re-run the single schedule identified by ``token``."""
+    with _instrumented(watch):
+        return _run_once(target, check, _strategy_from_token(token), 0,
+                         max_steps, random_seed, quiet)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Explore thread interleavings of a scenario.")
+    parser.add_argument("script", help="scenario file; its __main__ block is not run")
+    parser.add_argument("--call", required=True,
+                        help="expression evaluated in the scenario's namespace for every execution")
+    parser.add_argument("--check", help="expression over `result` that must be true")
+    parser.add_argument("--watch", action="append", default=[],
+                        help="class whose instance attributes are scheduling points")
+    parser.add_argument("--strategy", choices=("dpor", "random"), default="dpor")
+    parser.add_argument("--max-executions", type=int, default=1000)
+    parser.add_argument("--max-steps", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0, help="first seed of the random strategy")
+    parser.add_argument("--all", action="store_true", help="keep going after the first failure")
+    parser.add_argument("--replay", metavar="TOKEN", help="re-run one schedule and show its output")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sys.path.insert(0, str(Path(args.script).resolve().parent))
+    with _instrumented():
+        namespace = runpy.run_path(args.script, run_name="__explore__")
+    watch = [namespace[name] for name in args.watch]
+    call = compile(args.call, "<call>", "eval")
+    target = lambda: eval(call, namespace)
+    check = None
+    if args.check:
+        check_code = compile(args.check, "<check>", "eval")
+        check = lambda result: bool(eval(check_code, namespace, {"result": result}))
+
+    if args.replay:
+        execution = replay(target, args.replay, check, watch, args.max_steps)
+        print(f"status: {execution.status} {execution.reason}")
+        print("\n".join(execution.describe_trace()))
+        return 0 if execution.status == "ok" else 1
+
+    started = time.perf_counter()
+    report = explore(target, check, watch, args.strategy, args.max_executions,
+                     args.max_steps, args.seed, stop_on_failure=not args.all)
+    elapsed = time.perf_counter() - started
+    verdict = "search exhausted" if report.exhausted else "search not exhausted"
+    print(f"{report.strategy}: {report.executions} executions in {elapsed:.2f}s, "
+          f"{len(report.failures)} failing ({verdict})")
+    for execution in report.failures[:1]:
+        print(f"first failure at execution {execution.index + 1}: {execution.reason}")
+        print(f"replay with: --replay {execution.token}")
+        for line in execution.describe_trace():
+            print(f"  {line}")
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Run one scenario script with harness instrumentation installed first.
+
+    python -m harness.launch [--virtual-clock] [--lockstats | --lockstats-json PATH]
+        [--deadlock | --deadlock-json PATH]
+        [--trace PATH] path/to/scenario.py [args...]
+
+Every option can also be switched on through the environment (for example
+``HARNESS_VIRTUAL_CLOCK=1``) so that the runner and other tools can pass it
+down without changing the command line.
+"""
+
+import argparse
+import os
+import runpy
+import sys
+import threading
+
+ENV_VIRTUAL_CLOCK = "HARNESS_VIRTUAL_CLOCK"
+ENV_LOCKSTATS = "HARNESS_LOCKSTATS"
+ENV_DEADLOCK = "HARNESS_DEADLOCK"
+ENV_TRACE = "HARNESS_TRACE"
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").lower() not in ("", "0", "false", "no")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--virtual-clock", action="store_true",
+                        default=_env_flag(ENV_VIRTUAL_CLOCK),
+                        help="fast-forward sleeps and timeouts on a simulated clock")
+    parser.add_argument("--lockstats", action="store_true",
+                        help="record lock wait/hold histograms; summary on stderr")
+    parser.add_argument("--lockstats-json", metavar="PATH",
+                        help="like --lockstats, but write the histograms as JSON to PATH")
+    parser.add_argument("--deadlock", action="store_true",
+                        help="report wait-for cycles on stderr as they form")
+    parser.add_argument("--deadlock-json", metavar="PATH",
+                        help="like --deadlock, and also write the cycles as JSON to PATH")
+    parser.add_argument("--trace", metavar="PATH", default=os.environ.get(ENV_TRACE) or None,
+                        help="dump harness.trace ring buffers to PATH at exit")
+    parser.add_argument("script")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    return parser
+
+
+def _join_non_daemon_threads():
+    # The interpreter's own shutdown waits on real locks, which the virtual
+    # clock cannot see; joining here keeps sleeping threads able to finish.
+    main = threading.main_thread()
+    for thread in threading.enumerate():
+        if thread is not main and not thread.daemon:
+            thread.join()
+
+
+def run(script, args=(), virtual_clock=False, lockstats=None, deadlock=None, trace=None):
+    if virtual_clock:
+        from harness import vclock
+        vclock.install()
+    if lockstats:
+        # After the clock, so that waits are measured in simulated time.
+        from harness import lockstats as _lockstats
+        _lockstats.install(report=lockstats)
+    if deadlock:
+        from harness import deadlock as _deadlock
+        _deadlock.install(report=deadlock)
+    if trace:
+        from harness import trace as _trace
+        _trace.install(report=trace)
+
+    script = os.path.abspath(script)
+    sys.argv = [script, *args]
+    sys.path.insert(0, os.path.dirname(script))
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        _join_non_daemon_threads()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    lockstats = (args.lockstats_json or ("1" if args.lockstats else None)
+                 or os.environ.get(ENV_LOCKSTATS) or None)
+    deadlock = (args.deadlock_json or ("1" if args.deadlock else None)
+                or os.environ.get(ENV_DEADLOCK) or None)
+    run(args.script, args.args, virtual_clock=args.virtual_clock, lockstats=lockstats,
+        deadlock=deadlock, trace=args.trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""Instrumented locks with constant-memory wait and hold histograms.
+
+``Lock()``, ``RLock()`` and ``Condition()`` behave like their ``threading``
+counterparts but record, per creation site, how long acquirers waited, how
+long the lock was held and how often an acquire found it taken.  Durations
+go into :class:`LogHistogram`, a fixed array of power-of-two nanosecond
+buckets, so a scenario can hammer a lock forever without the statistics
+growing.
+
+Statistics are updated while the lock itself is held, so they need no extra
+synchronisation; an uncontended acquire/release pair costs two clock reads
+on top of the plain lock.
+
+``install()`` swaps the factories into ``threading`` so unmodified scenarios
+are measured too; ``harness.launch`` does this for ``--lockstats`` (a text
+summary on stderr) and ``--lockstats-json PATH`` (a JSON report), or when
+``HARNESS_LOCKSTATS`` is ``1`` or a path.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+N_BUCKETS = 64
+
+_SKIP_FILES = {
+    os.path.normcase(threading.__file__),
+    os.path.normcase(__file__),
+}
+
+_registry = {}
+_registry_lock = threading.Lock()
+_base_lock = threading.Lock
+_base_rlock = threading.RLock
+_now_ns = time.perf_counter_ns
+
+
+class LogHistogram:
+    """Counts of durations in buckets ``[2**(i-1), 2**i)`` nanoseconds."""
+
+    __slots__ = ("counts", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.counts = [0] * N_BUCKETS
+        self.total_ns = 0
+        self.max_ns = 0
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    def add(self, ns):
+        # 2**63 ns is ~292 years, so bit_length() always fits.
+        self.counts[ns.bit_length()] += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the ``q``-th percentile, in ns."""
+        total = self.total
+        if not total:
+            return 0
+        rank = q / 100 * total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << bucket, self.max_ns) if bucket else 0
+        return self.max_ns
+
+    def merge(self, other):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def summary(self):
+        total = self.total
+        return {
+            "count": total,
+            "mean_ns": self.total_ns // total if total else 0,
+            "p50_ns": self.percentile(50),
+            "p99_ns": self.percentile(99),
+            "max_ns": self.max_ns,
+        }
+
+    def to_dict(self):
+        # Trailing empty buckets carry no information.
+        last = max((i for i, c in enumerate(self.counts) if c), default=-1)
+        return {**self.summary(), "buckets": self.counts[:last + 1]}
+
+
+class LockStats:
+    """Counters shared by all locks created at one site.
+
+    ``wait`` only sees acquires that found the lock taken; the uncontended
+    ones are folded in as zero waits by :meth:`wait_histogram`, which keeps
+    the fast path down to a counter increment and a clock read.
+    """
+
+    __slots__ = ("site", "kind", "instances", "acquisitions", "contended", "wait", "hold")
+
+    def __init__(self, site, kind):
+        self.site = site
+        self.kind = kind
+        self.instances = 0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait = LogHistogram()
+        self.hold = LogHistogram()
+
+    def wait_histogram(self):
+        full = LogHistogram()
+        full.merge(self.wait)
+        full.counts[0] += self.acquisitions - self.wait.total
+        return full
+
+    def to_dict(self):
+        return {
+            "site": self.site,
+            "kind": self.kind,
+            "instances": self.instances,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait": self.wait_histogram().to_dict(),
+            "hold": self.hold.to_dict(),
+        }
+
+
+def _creation_site():
+    frame = sys._getframe(2)
+    while frame is not None and os.path.normcase(frame.f_code.co_filename) in _SKIP_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return "<unknown>"
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{frame.f_lineno} ({code.co_name})"
+
+
+def _stats_for(kind, name):
+    site = name or _creation_site()
+    key = (site, kind)
+    with _registry_lock:
+        stats = _registry.get(key)
+        if stats is None:
+            stats = _registry[key] = LockStats(site, kind)
+        stats.instances += 1
+    return stats
+
+
+class InstrumentedLock:
+    __slots__ = ("_lock", "_stats", "_acquired_at", "__weakref__")
+
+    def __init__(self, name=None):
+        self._lock = _base_lock()
+        self._stats = _stats_for("Lock", name)
+        self._acquired_at = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self._stats.acquisitions += 1
+            self._acquired_at = _now_ns()
+            return True
+        if not blocking:
+            return False
+        start = _now_ns()
+        if not self._lock.acquire(True, timeout):
+            return False
+        now = _now_ns()
+        stats = self._stats
+        stats.acquisitions += 1
+        stats.contended += 1
+        stats.wait.add(now - start)
+        self._acquired_at = now
+        return True
+
+    def release(self):
+        ns = _now_ns() - self._acquired_at
+        hold = self._stats.hold
+        hold.counts[ns.bit_length()] += 1
+        hold.total_ns += ns
+        if ns > hold.max_ns:
+            hold.max_ns = ns
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def _is_owned(self):
+        # Same test threading.Condition falls back to, minus the statistics.
+        if self._lock.acquire(False):
+            self._lock.release()
+            return False
+        return True
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def __repr__(self):
+        return f"<InstrumentedLock {self._stats.site} {'locked' if self.locked() else 'unlocked'}>"
+
+
+class InstrumentedRLock:
+    """Re-entrant variant; only the outermost acquire and release are timed."""
+
+    __slots__ = ("_lock", "_stats", "_acquired_at", "_owner", "_depth", "__weakref__")
+
+    def __init__(self, name=None):
+        self._lock = _base_rlock()
+        self._stats = _stats_for("RLock", name)
+        self._acquired_at = 0
+        self._owner = None
+        self._depth = 0
+
+    def acquire(self, blocking=True, timeout=-1):
+        me = threading.get_ident()
+        if self._owner == me:
+            self._lock.acquire()
+            self._depth += 1
+            return True
+        lock = self._lock
+        stats = self._stats
+        if lock.acquire(False):
+            now = _now_ns()
+        elif not blocking:
+            return False
+        else:
+            start = _now_ns()
+            if not lock.acquire(True, timeout):
+                return False
+            now = _now_ns()
+            stats.contended += 1
+            stats.wait.add(now - start)
+        stats.acquisitions += 1
+        self._owner = me
+        self._depth = 1
+        self._acquired_at = now
+        return True
+
+    def release(self):
+        if self._owner != threading.get_ident():
+            raise RuntimeError("cannot release un-acquired lock")
+        self._depth -= 1
+        if not self._depth:
+            self._owner = None
+            self._stats.hold.add(_now_ns() - self._acquired_at)
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    # Used by threading.Condition to drop and restore all recursion levels.
+
+    def _release_save(self):
+        self._stats.hold.add(_now_ns() - self._acquired_at)
+        state = (self._lock._release_save(), self._owner, self._depth)
+        self._owner = None
+        self._depth = 0
+        return state
+
+    def _acquire_restore(self, state):
+        inner, owner, depth = state
+        start = _now_ns()
+        self._lock._acquire_restore(inner)
+        now = _now_ns()
+        stats = self._stats
+        stats.acquisitions += 1
+        stats.wait.add(now - start)
+        self._owner = owner
+        self._depth = depth
+        self._acquired_at = now
+
+    def _is_owned(self):
+        return self._owner == threading.get_ident()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._owner = None
+        self._depth = 0
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def __repr__(self):
+        return f"<InstrumentedRLock {self._stats.site} owner={self._owner} depth={self._depth}>"
+
+
+def Lock(name=None):
+    return InstrumentedLock(name)
+
+
+def RLock(name=None):
+    return InstrumentedRLock(name)
+
+
+def Condition(lock=None, name=None):
+    return threading.Condition(lock if lock is not None else InstrumentedRLock(name))
+
+
+def snapshot():
+    """Statistics of every creation site, busiest (by total wait) first."""
+    with _registry_lock:
+        stats = list(_registry.values())
+    stats.sort(key=lambda s: (s.wait.total_ns, s.acquisitions), reverse=True)
+    return [s.to_dict() for s in stats]
+
+
+def combined():
+    """A single :class:`LockStats` summing every creation site."""
+    total = LockStats("<all>", "*")
+    with _registry_lock:
+        stats = list(_registry.values())
+    for entry in stats:
+        total.instances += entry.instances
+        total.acquisitions += entry.acquisitions
+        total.contended += entry.contended
+        total.wait.merge(entry.wait)
+        total.hold.merge(entry.hold)
+    return total
+
+
+def reset():
+    with _registry_lock:
+        _registry.clear()
+
+
+def _fmt_ns(ns):
+    if ns >= 1_000_000_000:
+        return f"{ns / 1e9:.2f}s"
+    if ns >= 1_000_000:
+        return f"{ns / 1e6:.2f}ms"
+    if ns >= 1_000:
+        return f"{ns / 1e3:.1f}us"
+    return f"{ns}ns"
+
+
+def format_report(entries, limit=20):
+    lines = [f"{'site':<48} {'kind':<5} {'acq':>7} {'cont':>6} "
+             f"{'wait p50':>9} {'wait p99':>9} {'wait max':>9} {'hold p50':>9} {'hold p99':>9}"]
+    for entry in entries[:limit]:
+        if not entry["acquisitions"]:
+            continue
+        wait, hold = entry["wait"], entry["hold"]
+        lines.append(
+            f"{entry['site'][:48]:<48} {entry['kind']:<5} {entry['acquisitions']:>7} "
+            f"{entry['contended']:>6} {_fmt_ns(wait['p50_ns']):>9} {_fmt_ns(wait['p99_ns']):>9} "
+            f"{_fmt_ns(wait['max_ns']):>9} {_fmt_ns(hold['p50_ns']):>9} {_fmt_ns(hold['p99_ns']):>9}"
+        )
+    return "\n".join(lines)
+
+
+def write_report(target):
+    entries = snapshot()
+    if target in ("1", "-", "stderr"):
+        print("\n-- lock statistics --", file=sys.stderr)
+        print(format_report(entries), file=sys.stderr)
+    else:
+        with open(target, "w") as f:
+            json.dump(entries, f, indent=2)
+
+
+def install(report=None):
+    """Make ``threading.Lock``/``RLock`` (and so ``Condition``, ``Event``,
+    ``Semaphore`` and ``queue.Queue``) instrumented for this process.
+
+    Locks created on top of whatever ``threading`` provides at this point, so
+    installing after :mod:`harness.vclock` measures simulated time.
+    """
+    global _base_lock, _base_rlock, _now_ns
+    if threading.Lock is Lock:
+        return
+    _base_lock = threading.Lock
+    _base_rlock = threading.RLock
+    _now_ns = time.perf_counter_ns
+    threading.Lock = Lock
+    threading.RLock = RLock
+    if report:
+        atexit.register(write_report, report)
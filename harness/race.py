@@ -0,0 +1,600 @@
+"""Happens-before data race detection on chosen shared objects.
+
+Every thread carries a vector clock.  Happens-before edges come from
+
+* lock release -> later acquire of the same lock (``Lock``, ``RLock`` and so
+  everything built on them: ``Condition``, ``Event``, ``Semaphore``,
+  ``queue.Queue`` and, with the pure-Python ``SimpleQueue``, executors),
+* ``Thread.start`` -> the new thread, and the finished thread -> ``join``.
+
+Reads and writes of *watched* locations are checked against the last
+accesses to the same location; an access that is not ordered after a
+conflicting one (at least one of them a write) is a race and is reported
+with both stack traces.  Watched locations are instance attributes of
+:func:`watch_class`-ed classes and the keys of dicts wrapped by
+:func:`watch` (iterating or sizing such a dict reads its key set; adding or
+removing a key writes it).
+
+Shadow memory follows FastTrack (Flanagan & Freund, 2009): a location keeps
+the last write as a single *epoch* integer (clock and thread index packed
+together) and the last read as an epoch too, which only grows into a
+per-thread table while reads are actually concurrent.  Stacks are interned
+tuples of code ids and line numbers, so a watched dict of thousands of entries
+costs a few small lists per touched key.
+
+    python -m harness.race default_codes/RaceCondtition/r2.py \\
+        --call "run_experiment(4, 50)" --watch Counter
+"""
+
+import _thread
+import argparse
+import linecache
+import os
+import queue
+import sys
+import threading
+import time
+import types
+from dataclasses import dataclass
+from pathlib import Path
+
+MAX_FRAMES = 8
+_TID_BITS = 16
+_TID_MASK = (1 << _TID_BITS) - 1
+
+_get_ident = _thread.get_ident
+_mutex = _thread.allocate_lock()
+_base_lock = threading.Lock
+_base_rlock = threading.RLock
+
+# thread ident -> _ThreadState of the running threads
+_states = {}
+# thread index -> name, for reports
+_thread_names = []
+# (id(obj), key) -> [write_epoch, write_stack, read, read_stack, label]
+_shadow = {}
+_stacks = {}
+# code id -> whether its frames are left out of stacks; code id -> code
+_hidden_codes = {}
+_codes = {}
+_seen = set()
+_reports = []
+_race_count = 0
+_stream = sys.stderr
+_HARNESS_DIR = os.path.normcase(os.path.dirname(os.path.abspath(__file__)))
+_THREADING_FILE = os.path.normcase(threading.__file__)
+
+
+@dataclass
+class RaceReport:
+    location: str
+    kind: str
+    thread: str
+    stack: list
+    other_thread: str
+    other_stack: list
+
+    def describe(self):
+        lines = [f"data race ({self.kind}) on {self.location}",
+                 f"  {self.thread}:"]
+        lines += [f"    {line}" for line in self.stack]
+        lines.append(f"  {self.other_thread} (not ordered before it):")
+        lines += [f"    {line}" for line in self.other_stack]
+        return "\n".join(lines)
+
+
+class _ThreadState:
+    __slots__ = ("index", "vc")
+
+    def __init__(self, name, parent_vc=None):
+        with _mutex:
+            self.index = len(_thread_names)
+            _thread_names.append(name)
+        vc = list(parent_vc) if parent_vc else []
+        if len(vc) <= self.index:
+            vc.extend([0] * (self.index + 1 - len(vc)))
+        vc[self.index] += 1
+        self.vc = vc
+
+    def epoch(self):
+        return self.vc[self.index] << _TID_BITS | self.index
+
+    def tick(self):
+        self.vc[self.index] += 1
+
+
+def _state():
+    ident = _get_ident()
+    state = _states.get(ident)
+    if state is None:
+        # Not started through Thread.start after install(), e.g. the main
+        # thread.  current_thread() could allocate locks, so look it up.
+        thread = threading._active.get(ident)
+        name = thread.name if thread is not None else f"thread-{ident}"
+        state = _states[ident] = _ThreadState(name)
+    return state
+
+
+def _join_vc(into, other):
+    if len(into) < len(other):
+        into.extend([0] * (len(other) - len(into)))
+    for i, clock in enumerate(other):
+        if clock > into[i]:
+            into[i] = clock
+
+
+def _ordered(epoch, vc):
+    """Whether the access at ``epoch`` happens before a thread with clock ``vc``."""
+    tid = epoch & _TID_MASK
+    return tid < len(vc) and vc[tid] >= epoch >> _TID_BITS
+
+
+# -- synchronisation ----------------------------------------------------------
+
+
+class HBLock:
+    __slots__ = ("_lock", "_vc", "__weakref__")
+
+    def __init__(self):
+        self._lock = _base_lock()
+        self._vc = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        if self._vc is not None:
+            _join_vc(_state().vc, self._vc)
+        return True
+
+    def release(self):
+        state = _state()
+        self._vc = list(state.vc)
+        state.tick()
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._vc = None
+
+
+class HBRLock:
+    __slots__ = ("_lock", "_vc", "__weakref__")
+
+    def __init__(self):
+        self._lock = _base_rlock()
+        self._vc = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        if self._vc is not None:
+            _join_vc(_state().vc, self._vc)
+        return True
+
+    def release(self):
+        state = _state()
+        self._vc = list(state.vc)
+        state.tick()
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _release_save(self):
+        state = _state()
+        self._vc = list(state.vc)
+        state.tick()
+        return self._lock._release_save()
+
+    def _acquire_restore(self, saved):
+        self._lock._acquire_restore(saved)
+        if self._vc is not None:
+            _join_vc(_state().vc, self._vc)
+
+    def _is_owned(self):
+        return self._lock._is_owned()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._vc = None
+
+
+# -- shadow memory --------------------------------------------------------------
+
+
+def _hidden(code):
+    filename = os.path.normcase(code.co_filename)
+    return filename.startswith(_HARNESS_DIR) or filename == _THREADING_FILE
+
+
+def _stack():
+    """The caller's stack as an interned flat tuple ``(code id, lineno, ...)``.
+
+    Hashing ints is much cheaper than hashing code objects, and interning
+    makes every access from the same call path share one tuple.
+    """
+    key = []
+    frame = sys._getframe(2)
+    hidden = _hidden_codes
+    while frame is not None:
+        code = frame.f_code
+        # Code objects do not cache their hash; their id is stable because
+        # _codes keeps them alive.
+        code_id = id(code)
+        skip = hidden.get(code_id)
+        if skip is None:
+            skip = hidden[code_id] = _hidden(code)
+            _codes[code_id] = code
+        if not skip:
+            key.append(code_id)
+            key.append(frame.f_lineno)
+            if len(key) == 2 * MAX_FRAMES:
+                break
+        frame = frame.f_back
+    key = tuple(key)
+    return _stacks.setdefault(key, key)
+
+
+def _format_stack(stack):
+    lines = []
+    for i in range(len(stack) - 2, -1, -2):
+        code, lineno = _codes[stack[i]], stack[i + 1]
+        lines.append(f'File "{code.co_filename}", line {lineno}, in {code.co_name}')
+        source = linecache.getline(code.co_filename, lineno).strip()
+        if source:
+            lines.append(f"  {source}")
+    return lines
+
+
+def _describe(label):
+    # Labels stay tuples until a race is reported; formatting them on every
+    # access would cost more than the check itself.
+    owner, kind, item = label
+    if kind == "[]":
+        return f"{owner}[{item!r}]"
+    if kind == ".":
+        return f"{owner}.{item}"
+    return f"{owner}{kind}"
+
+
+def _report(cell, kind, state, other_epoch, other_stack):
+    global _race_count
+    _race_count += 1
+    stack = _stack()
+    owner, how, item = cell[4]
+    # One report per pair of code sites and attribute; racing on every key
+    # of a big dict from the same two lines is one bug, not thousands.
+    key = (owner, how, item if how == "." else None, kind, stack, other_stack)
+    if key in _seen:
+        return
+    _seen.add(key)
+    report = RaceReport(
+        location=_describe(cell[4]),
+        kind=kind,
+        thread=_thread_names[state.index],
+        stack=_format_stack(stack),
+        other_thread=_thread_names[other_epoch & _TID_MASK],
+        other_stack=_format_stack(other_stack),
+    )
+    _reports.append(report)
+    if _stream is not None:
+        print(report.describe(), file=_stream, flush=True)
+
+
+def _read(key, label):
+    state = _state()
+    vc = state.vc
+    epoch = vc[state.index] << _TID_BITS | state.index
+    cell = _shadow.get(key)
+    if cell is not None and cell[2] == epoch:
+        # Same thread, no synchronisation since its last read: nothing new.
+        return
+    with _mutex:
+        cell = _shadow.get(key)
+        if cell is None:
+            _shadow[key] = [0, None, epoch, _stack(), label]
+            return
+        read = cell[2]
+        if read == epoch:
+            return
+        write = cell[0]
+        if write and not _ordered(write, vc):
+            _report(cell, "write/read", state, write, cell[1])
+        if type(read) is int:
+            if not read or _ordered(read, vc):
+                cell[2] = epoch
+                cell[3] = _stack()
+            else:
+                # Concurrent readers: keep one epoch per thread until the
+                # next write orders them all.
+                cell[2] = {read & _TID_MASK: (read, cell[3]), state.index: (epoch, _stack())}
+                cell[3] = None
+        else:
+            read[state.index] = (epoch, _stack())
+
+
+def _write(key, label):
+    state = _state()
+    vc = state.vc
+    epoch = vc[state.index] << _TID_BITS | state.index
+    with _mutex:
+        cell = _shadow.get(key)
+        if cell is None:
+            _shadow[key] = [epoch, _stack(), 0, None, label]
+            return
+        write = cell[0]
+        if write == epoch:
+            return
+        if write and not _ordered(write, vc):
+            _report(cell, "write/write", state, write, cell[1])
+        read = cell[2]
+        if type(read) is int:
+            if read and not _ordered(read, vc):
+                _report(cell, "read/write", state, read, cell[3])
+        else:
+            for other, (read_epoch, read_stack) in read.items():
+                if other != state.index and not _ordered(read_epoch, vc):
+                    _report(cell, "read/write", state, read_epoch, read_stack)
+        cell[0] = epoch
+        cell[1] = _stack()
+        cell[2] = 0
+        cell[3] = None
+
+
+# -- watched objects --------------------------------------------------------------
+
+# class -> None (every instance) or a set of ids of watched instances
+_watched_classes = {}
+
+
+def _patch_class(cls):
+    orig_get = cls.__getattribute__
+    orig_set = cls.__setattr__
+    name = cls.__name__
+    instances = _watched_classes
+    # Names found on the class (methods, properties, class constants) are not
+    # instance state; everything else read through an instance is.
+    class_names = {attr for klass in cls.__mro__ for attr in vars(klass)}
+
+    def __getattribute__(self, attr):
+        value = orig_get(self, attr)
+        if attr not in class_names:
+            ids = instances.get(cls, ())
+            if ids is None or id(self) in ids:
+                _read((id(self), attr), (name, ".", attr))
+        return value
+
+    def __setattr__(self, attr, value):
+        ids = instances.get(cls, ())
+        if ids is None or id(self) in ids:
+            _write((id(self), attr), (name, ".", attr))
+        orig_set(self, attr, value)
+
+    cls.__getattribute__ = __getattribute__
+    cls.__setattr__ = __setattr__
+
+
+def watch_class(cls):
+    """Check every instance attribute access on instances of ``cls``."""
+    if cls not in _watched_classes:
+        _patch_class(cls)
+    _watched_classes[cls] = None
+    return cls
+
+
+class WatchedDict(dict):
+    """A dict whose per-key accesses and key-set changes are checked."""
+
+    __slots__ = ("_label",)
+
+    def __init__(self, *args, label="dict", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._label = label
+
+    def _key(self, key):
+        return (id(self), "key", key)
+
+    def _keys(self):
+        return (id(self), "keys")
+
+    def __getitem__(self, key):
+        _read(self._key(key), (self._label, "[]", key))
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        _read(self._key(key), (self._label, "[]", key))
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        _read(self._key(key), (self._label, "[]", key))
+        return super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        if not super().__contains__(key):
+            _write(self._keys(), (self._label, " keys", None))
+        _write(self._key(key), (self._label, "[]", key))
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        _write(self._keys(), (self._label, " keys", None))
+        _write(self._key(key), (self._label, "[]", key))
+        super().__delitem__(key)
+
+    def setdefault(self, key, default=None):
+        if super().__contains__(key):
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key, *default):
+        if super().__contains__(key):
+            _write(self._keys(), (self._label, " keys", None))
+            _write(self._key(key), (self._label, "[]", key))
+        return super().pop(key, *default)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __iter__(self):
+        _read(self._keys(), (self._label, " keys", None))
+        return super().__iter__()
+
+    def __len__(self):
+        _read(self._keys(), (self._label, " keys", None))
+        return super().__len__()
+
+    def keys(self):
+        _read(self._keys(), (self._label, " keys", None))
+        return super().keys()
+
+    def values(self):
+        _read(self._keys(), (self._label, " keys", None))
+        return super().values()
+
+    def items(self):
+        _read(self._keys(), (self._label, " keys", None))
+        return super().items()
+
+
+def watch(obj, label=None):
+    """Watch ``obj`` and return what the program should use from now on.
+
+    Dicts are replaced by a :class:`WatchedDict` copy, which must be stored
+    back where the program looks it up; other objects are watched in place.
+    """
+    if isinstance(obj, dict):
+        return WatchedDict(obj, label=label or "dict")
+    cls = type(obj)
+    if cls not in _watched_classes:
+        _patch_class(cls)
+        _watched_classes[cls] = set()
+    ids = _watched_classes[cls]
+    if ids is not None:
+        ids.add(id(obj))
+    return obj
+
+
+def watch_attribute(cls, attr):
+    """Wrap ``attr`` of every new ``cls`` instance (a dict) with :func:`watch`."""
+    orig_init = cls.__init__
+
+    def __init__(self, *args, **kwargs):
+        orig_init(self, *args, **kwargs)
+        setattr(self, attr, watch(getattr(self, attr), label=f"{cls.__name__}.{attr}"))
+
+    cls.__init__ = __init__
+
+
+# -- installation -------------------------------------------------------------------
+
+
+def install(stream=sys.stderr):
+    """Track happens-before through locks, threads and queues in this process."""
+    global _base_lock, _base_rlock, _stream
+    _stream = stream
+    if threading.Lock is HBLock:
+        return
+    _base_lock = threading.Lock
+    _base_rlock = threading.RLock
+    threading.Lock = threading._allocate_lock = HBLock
+    threading.RLock = HBRLock
+    # The C SimpleQueue (executors) hands items over without a lock.
+    queue.SimpleQueue = queue._PySimpleQueue
+
+    thread_cls = threading.Thread
+    real_start = thread_cls.start
+    real_join = thread_cls.join
+    real_bootstrap_inner = thread_cls._bootstrap_inner
+
+    def start(self):
+        state = _state()
+        self._race_parent_vc = list(state.vc)
+        state.tick()
+        real_start(self)
+
+    def _bootstrap_inner(self):
+        ident = _get_ident()
+        state = _states[ident] = _ThreadState(self.name, getattr(self, "_race_parent_vc", None))
+        try:
+            real_bootstrap_inner(self)
+        finally:
+            self._race_final_vc = list(state.vc)
+            _states.pop(ident, None)
+
+    def join(self, timeout=None):
+        real_join(self, timeout)
+        final = getattr(self, "_race_final_vc", None)
+        if final is not None and not self.is_alive():
+            _join_vc(_state().vc, final)
+
+    thread_cls.start = start
+    thread_cls._bootstrap_inner = _bootstrap_inner
+    thread_cls.join = join
+
+
+def reports():
+    return list(_reports)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Detect data races in a scenario.")
+    parser.add_argument("script", help="scenario file; its __main__ block is not run")
+    parser.add_argument("--call", required=True,
+                        help="expression evaluated in the scenario's namespace")
+    parser.add_argument("--watch", action="append", default=[], metavar="NAME",
+                        help="a class (all instance attributes), Class.attr (a dict attribute "
+                             "of every instance) or a global dict; may be repeated")
+    parser.add_argument("--virtual-clock", action="store_true",
+                        help="run on simulated time so that sleeps cost nothing")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only print the summary")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    perf_counter = time.perf_counter
+    if args.virtual_clock:
+        from harness import vclock
+        vclock.install()
+    install(stream=None if args.quiet else sys.stdout)
+
+    script = Path(args.script).resolve()
+    sys.path.insert(0, str(script.parent))
+    # runpy.run_path returns a copy of the globals; rebinding a watched dict
+    # has to happen in the dict the scenario's functions actually use.
+    module = types.ModuleType("__race__")
+    module.__file__ = str(script)
+    sys.modules[module.__name__] = module
+    exec(compile(script.read_text(), str(script), "exec"), module.__dict__)
+    namespace = module.__dict__
+    for name in args.watch:
+        owner, _, attr = name.partition(".")
+        if attr:
+            watch_attribute(namespace[owner], attr)
+        elif isinstance(namespace[name], type):
+            watch_class(namespace[name])
+        else:
+            namespace[name] = watch(namespace[name], label=name)
+
+    started = perf_counter()
+    eval(compile(args.call, "<call>", "eval"), namespace)
+    elapsed = perf_counter() - started
+    print(f"{len(_reports)} distinct race(s), {_race_count} racy access(es), "
+          f"{len(_shadow)} locations watched, {elapsed:.2f}s")
+    return 1 if _reports else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Figures on demand, CSV timelines when there is nothing to draw on.
+
+The Starvation scenarios used to import ``matplotlib.pyplot`` and ``numpy``
+at module load.  That was most of their start-up time (s1 paid it again in
+every spawned worker process) and failed outright on machines without
+them.  They now ask this module instead:
+
+    if report.headless():
+        report.write_csv("waiting_times.csv", ("process_id", "wait_s"), rows)
+    else:
+        plt = report.pyplot()
+        ...
+
+``HARNESS_REPORT=csv`` (or ``plot``) forces a mode.  By default figures are
+drawn when matplotlib can be imported and CSV is written otherwise.  Without
+a display, pyplot gets the non-interactive Agg backend, so ``savefig`` still
+works and ``show`` returns at once.
+
+Scenarios that import the harness anyway (d3, d5, l4, l5) format their
+throughput with :func:`rate`, which leaves it out when no time passed, as
+happens under the virtual clock (:mod:`harness.vclock`).
+"""
+
+import csv
+import importlib.util
+import os
+import sys
+
+ENV_REPORT = "HARNESS_REPORT"
+MODES = ("plot", "csv")
+FLOAT_DIGITS = 6
+
+_pyplot = None
+
+
+def mode():
+    """``"plot"`` or ``"csv"``."""
+    requested = os.environ.get(ENV_REPORT, "").lower()
+    if requested in MODES:
+        return requested
+    if requested:
+        raise ValueError(f"{ENV_REPORT} must be one of {MODES}, not {requested!r}")
+    return "plot" if importlib.util.find_spec("matplotlib") is not None else "csv"
+
+
+def headless():
+    return mode() == "csv"
+
+
+def _has_display():
+    if sys.platform in ("win32", "darwin"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def pyplot():
+    """Import and return ``matplotlib.pyplot`` (once)."""
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        if not _has_display() and "MPLBACKEND" not in os.environ:
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        _pyplot = plt
+    return _pyplot
+
+
+def _cell(value):
+    if isinstance(value, float):
+        return round(value, FLOAT_DIGITS)
+    return value
+
+
+def write_csv(path, columns, rows):
+    """Write ``rows`` under the header ``columns`` and return ``path``.
+
+    Floats are rounded to ``FLOAT_DIGITS`` places; ``None`` becomes an empty
+    cell.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows([_cell(value) for value in row] for row in rows)
+    return path
+
+
+def per_second(count, elapsed):
+    """``count / elapsed`` as ``"12,345"``, or ``"-"`` when ``elapsed`` is 0."""
+    return f"{count / elapsed:,.0f}" if elapsed else "-"
+
+
+def rate(count, elapsed, unit=""):
+    """``" (12,345 <unit>/sec)"`` to append to a report line, or ``""`` when
+    ``elapsed`` is 0.
+    """
+    if not elapsed:
+        return ""
+    unit = f" {unit}" if unit else ""
+    return f" ({per_second(count, elapsed)}{unit}/sec)"
@@ -0,0 +1,264 @@
+"""Run every scenario of the corpus in parallel and collect a JSON report.
+
+Each scenario is started in its own process (and its own session, so that
+children spawned through ``multiprocessing`` die with it) inside a private
+scratch directory.  At most ``--jobs`` scenarios run at once; a scenario that
+outlives ``--timeout`` seconds is killed and reported as ``timeout``.
+
+    python -m harness.runner --jobs 8 --timeout 20 --output report.json
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from harness import launch
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CORPUS_ROOTS = ("default_codes", "short_codes")
+SCENARIO_SUFFIXES = (".py", ".java", ".cpp")
+# Written by the scenario into its scratch directory, relative to its cwd.
+LOCKSTATS_FILE = "lockstats.json"
+DEADLOCK_FILE = "deadlocks.json"
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    language: str
+    status: str
+    returncode: int | None
+    wall_time: float
+    stdout_bytes: int
+    stderr_bytes: int
+    stderr_tail: str = ""
+    lock_stats: list | None = None
+    deadlocks: list | None = None
+
+
+def discover_scenarios(roots=CORPUS_ROOTS, patterns=None):
+    scenarios = []
+    for root in roots:
+        base = REPO_ROOT / root
+        if not base.is_dir():
+            continue
+        for path in sorted(base.rglob("*")):
+            if path.suffix not in SCENARIO_SUFFIXES or "__pycache__" in path.parts:
+                continue
+            if not _is_scenario(path):
+                continue
+            rel = path.relative_to(REPO_ROOT).as_posix()
+            if patterns and not any(fnmatch.fnmatch(rel, p) for p in patterns):
+                continue
+            scenarios.append(path)
+    return scenarios
+
+
+def _is_scenario(path):
+    # Helper modules that live next to a scenario are prefixed with an
+    # underscore and are imported by it rather than run on their own.
+    return not path.name.startswith("_")
+
+
+def _build_command(path, workdir, instrumented):
+    """Return the command that runs ``path``, or ``None`` if no toolchain is available."""
+    if path.suffix == ".py":
+        if instrumented:
+            return [sys.executable, "-m", "harness.launch", str(path)]
+        return [sys.executable, str(path)]
+    if path.suffix == ".java":
+        java = shutil.which("java")
+        # Single-file source launch (JDK 11+) compiles and runs in one go.
+        return [java, str(path)] if java else None
+    if path.suffix == ".cpp":
+        compiler = shutil.which("g++") or shutil.which("clang++")
+        if compiler is None:
+            return None
+        binary = workdir / path.stem
+        build = subprocess.run(
+            [compiler, "-std=c++17", "-O2", "-pthread", str(path), "-o", str(binary)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        if build.returncode != 0:
+            raise RuntimeError(build.stderr.decode(errors="replace"))
+        return [str(binary)]
+    return None
+
+
+def _read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_scenario(path, timeout, harness_env=None):
+    """Run one scenario.
+
+    ``harness_env`` holds ``HARNESS_*`` switches for :mod:`harness.launch`;
+    when it is non-empty Python scenarios are started through the launcher.
+    """
+    rel = path.relative_to(REPO_ROOT).as_posix()
+    language = path.suffix.lstrip(".")
+    env = dict(os.environ)
+    env.setdefault("MPLBACKEND", "Agg")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")]))
+    env["PYTHONUNBUFFERED"] = "1"
+    env.update(harness_env or {})
+
+    with tempfile.TemporaryDirectory(prefix="scenario-") as tmp:
+        workdir = Path(tmp)
+        start = time.perf_counter()
+        try:
+            cmd = _build_command(path, workdir, bool(harness_env))
+        except RuntimeError as exc:
+            return ScenarioResult(rel, language, "build_error", None,
+                                  time.perf_counter() - start, 0, 0, str(exc)[-2000:])
+        if cmd is None:
+            return ScenarioResult(rel, language, "skipped", None, 0.0, 0, 0,
+                                  "no toolchain available")
+
+        proc = subprocess.Popen(
+            cmd,
+            cwd=workdir,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        timed_out = False
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            _kill_group(proc)
+            stdout, stderr = proc.communicate()
+        finally:
+            # Daemon children may survive a clean exit of the parent.
+            _kill_group(proc)
+        wall_time = time.perf_counter() - start
+        lock_stats = _read_json(workdir / LOCKSTATS_FILE)
+        deadlocks = _read_json(workdir / DEADLOCK_FILE)
+
+    if timed_out:
+        status = "timeout"
+    elif proc.returncode == 0:
+        status = "ok"
+    else:
+        status = "error"
+    return ScenarioResult(
+        scenario=rel,
+        language=language,
+        status=status,
+        returncode=None if timed_out else proc.returncode,
+        wall_time=round(wall_time, 4),
+        stdout_bytes=len(stdout),
+        stderr_bytes=len(stderr),
+        stderr_tail=stderr[-2000:].decode(errors="replace") if status != "ok" else "",
+        lock_stats=lock_stats,
+        deadlocks=deadlocks,
+    )
+
+
+def run_corpus(scenarios, jobs, timeout, harness_env=None, progress=None):
+    lock = threading.Lock()
+
+    def task(path):
+        result = run_scenario(path, timeout, harness_env)
+        if progress is not None:
+            with lock:
+                progress(result)
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(task, scenarios))
+    elapsed = time.perf_counter() - start
+
+    summary = {}
+    for result in results:
+        summary[result.status] = summary.get(result.status, 0) + 1
+    return {
+        "jobs": jobs,
+        "timeout": timeout,
+        "harness_env": dict(harness_env or {}),
+        "total_wall_time": round(elapsed, 4),
+        "summary": summary,
+        "results": [asdict(r) for r in results],
+    }
+
+
+def _print_progress(result):
+    print(f"{result.status:>11}  {result.wall_time:8.2f}s  {result.scenario}", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the concurrency bug corpus in parallel.")
+    # Most scenarios spend their time sleeping or blocked on a lock, so the
+    # pool is deliberately much larger than the number of CPUs.
+    parser.add_argument("-j", "--jobs", type=int, default=max(16, 4 * (os.cpu_count() or 1)),
+                        help="number of scenarios to run concurrently")
+    parser.add_argument("-t", "--timeout", type=float, default=30.0,
+                        help="seconds before a scenario is killed")
+    parser.add_argument("-o", "--output", default="-",
+                        help="where to write the JSON report ('-' for stdout)")
+    parser.add_argument("-k", "--filter", action="append", dest="patterns",
+                        help="glob on the repo-relative path, may be repeated")
+    parser.add_argument("--roots", nargs="+", default=list(CORPUS_ROOTS))
+    parser.add_argument("--virtual-clock", action="store_true",
+                        help="run Python scenarios on simulated time (see harness.vclock)")
+    parser.add_argument("--lockstats", action="store_true",
+                        help="attach per-site lock wait/hold histograms (see harness.lockstats)")
+    parser.add_argument("--deadlock", action="store_true",
+                        help="detect wait-for cycles as they form (see harness.deadlock)")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    return parser
+
+
+def harness_env_from_args(args):
+    env = {}
+    if args.virtual_clock:
+        env[launch.ENV_VIRTUAL_CLOCK] = "1"
+    if args.lockstats:
+        env[launch.ENV_LOCKSTATS] = LOCKSTATS_FILE
+    if args.deadlock:
+        env[launch.ENV_DEADLOCK] = DEADLOCK_FILE
+    return env
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    scenarios = discover_scenarios(args.roots, args.patterns)
+    jobs = max(1, min(args.jobs, len(scenarios) or 1))
+    report = run_corpus(scenarios, jobs, args.timeout, harness_env_from_args(args),
+                        progress=None if args.quiet else _print_progress)
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        Path(args.output).write_text(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Binary event tracing for hot paths.
+
+Each thread writes fixed-size records into its own preallocated ring buffer:
+
+    timestamp_ns  int64   time.time_ns() (simulated under harness.vclock)
+    thread        uint64  threading.get_ident()
+    code          uint16  event code from :func:`event`
+    obj           int64   object the event is about (account, worker, ...)
+    arg           int64   one integer argument (amount, duration in ns, ...)
+
+Recording is one ``struct.pack_into`` into memory nobody else touches, so it
+needs no lock and does no formatting or I/O.  Rings grow by doubling up to
+their capacity; after that the oldest records are overwritten and counted as
+dropped.  Text (or JSON) is produced
+only after the run by :func:`format_text`/:func:`to_json`, from the message
+template given to :func:`event`::
+
+    DEPOSIT = trace.event("deposit", "Client {obj} deposited ${arg}")
+    trace.emit(DEPOSIT, client_id, amount)
+    ...
+    print(trace.format_text(trace.drain()))
+
+Templates can use ``obj``, ``arg``, ``arg_s`` (``arg`` nanoseconds as
+seconds) and ``thread``.  ``harness.launch --trace PATH`` (``HARNESS_TRACE``)
+writes every record still buffered at exit to a binary file that
+``python -m harness.trace PATH [--json]`` decodes.
+"""
+
+import argparse
+import atexit
+import json
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+RECORD = struct.Struct("<qQHqq")
+_SIZE = RECORD.size
+_pack = RECORD.pack_into
+DEFAULT_CAPACITY = 8192
+# Rings start this small and double up to their capacity, so that a scenario
+# with hundreds of short-lived threads does not pay for full rings.
+INITIAL_RECORDS = 64
+MAGIC = b"HTRC1\n"
+
+_local = threading.local()
+_buffers = []
+_buffers_lock = threading.Lock()
+_events = []
+_capacity = DEFAULT_CAPACITY
+_time_ns = time.time_ns
+
+
+class EventType(int):
+    """An event code that also carries its name and message template."""
+
+    def __new__(cls, code, name, template):
+        self = super().__new__(cls, code)
+        self.name = name
+        self.template = template
+        return self
+
+    @property
+    def code(self):
+        return int(self)
+
+    def __repr__(self):
+        return f"<EventType {int(self)} {self.name}>"
+
+
+class RingBuffer:
+    """Records of one thread; only that thread writes to it.
+
+    ``capacity`` is rounded up to a power of two so that the slot index is a
+    mask rather than a division.  ``data`` only covers the slots written so
+    far; writing past its end raises ``struct.error``, which is the signal to
+    :meth:`grow` and keeps the common path free of a length check.
+    """
+
+    __slots__ = ("ident", "thread_name", "capacity", "mask", "data", "written")
+
+    def __init__(self, capacity):
+        thread = threading.current_thread()
+        self.ident = thread.ident
+        self.thread_name = thread.name
+        self.capacity = 1 << max(0, capacity - 1).bit_length()
+        self.mask = self.capacity - 1
+        self.data = bytearray(min(self.capacity, INITIAL_RECORDS) * _SIZE)
+        self.written = 0
+
+    def grow(self):
+        self.data.extend(bytes(min(len(self.data), self.capacity * _SIZE - len(self.data))))
+
+    def append(self, code, obj=0, arg=0):
+        written = self.written
+        offset = (written & self.mask) * _SIZE
+        try:
+            _pack(self.data, offset, _time_ns(), self.ident, code, obj, arg)
+        except struct.error:
+            self.grow()
+            _pack(self.data, offset, _time_ns(), self.ident, code, obj, arg)
+        self.written = written + 1
+
+    @property
+    def dropped(self):
+        return max(0, self.written - self.capacity)
+
+    def records(self):
+        """Buffered records, oldest first."""
+        count = min(self.written, self.capacity)
+        first = self.written - count
+        unpack = RECORD.unpack_from
+        return [unpack(self.data, ((first + i) & self.mask) * _SIZE) for i in range(count)]
+
+    def clear(self):
+        self.written = 0
+
+
+def event(name, template=None):
+    """Register an event type and return it (usable wherever a code is)."""
+    for existing in _events:
+        if existing.name == name:
+            return existing
+    if len(_events) > 0xFFFF:
+        raise ValueError("too many event types")
+    etype = EventType(len(_events), name, template or name + " obj={obj} arg={arg}")
+    _events.append(etype)
+    return etype
+
+
+def _new_buffer():
+    buffer = _local.buffer = RingBuffer(_capacity)
+    with _buffers_lock:
+        _buffers.append(buffer)
+    return buffer
+
+
+def emit(code, obj=0, arg=0):
+    """Record one event for the calling thread."""
+    try:
+        buffer = _local.buffer
+    except AttributeError:
+        buffer = _new_buffer()
+    # RingBuffer.append inlined: this is the hot path.
+    written = buffer.written
+    offset = (written & buffer.mask) * _SIZE
+    try:
+        _pack(buffer.data, offset, _time_ns(), buffer.ident, code, obj, arg)
+    except struct.error:
+        buffer.grow()
+        _pack(buffer.data, offset, _time_ns(), buffer.ident, code, obj, arg)
+    buffer.written = written + 1
+
+
+def configure(capacity=DEFAULT_CAPACITY):
+    """Set the ring size (in records) for threads that have not traced yet."""
+    global _capacity
+    _capacity = capacity
+
+
+def records():
+    """Every buffered record of every thread, in timestamp order."""
+    with _buffers_lock:
+        buffers = list(_buffers)
+    merged = []
+    for buffer in buffers:
+        merged.extend(buffer.records())
+    merged.sort(key=lambda record: record[0])
+    return merged
+
+
+def drain():
+    """Return :func:`records` and empty all buffers."""
+    with _buffers_lock:
+        buffers = list(_buffers)
+    result = records()
+    for buffer in buffers:
+        buffer.clear()
+    return result
+
+
+def dropped():
+    with _buffers_lock:
+        return sum(buffer.dropped for buffer in _buffers)
+
+
+def _thread_names():
+    with _buffers_lock:
+        return {buffer.ident: buffer.thread_name for buffer in _buffers}
+
+
+def _decode(record, events, names):
+    ts, ident, code, obj, arg = record
+    etype = events[code] if code < len(events) else None
+    name = etype.name if etype is not None else f"event{code}"
+    template = etype.template if etype is not None else name + " obj={obj} arg={arg}"
+    thread = names.get(ident, ident)
+    text = template.format(obj=obj, arg=arg, arg_s=arg / 1e9, thread=thread)
+    return ts, thread, name, obj, arg, text
+
+
+def format_text(recs, events=None, names=None):
+    """One ``[HH:MM:SS.mmm] message`` line per record."""
+    events = _events if events is None else events
+    names = _thread_names() if names is None else names
+    lines = []
+    for record in recs:
+        ts, _, _, _, _, text = _decode(record, events, names)
+        stamp = datetime.fromtimestamp(ts / 1e9).strftime("%H:%M:%S.%f")[:-3]
+        lines.append(f"[{stamp}] {text}")
+    return "\n".join(lines)
+
+
+def to_json(recs, events=None, names=None):
+    events = _events if events is None else events
+    names = _thread_names() if names is None else names
+    out = []
+    for record in recs:
+        ts, thread, name, obj, arg, text = _decode(record, events, names)
+        out.append({"ts_ns": ts, "thread": thread, "event": name, "obj": obj, "arg": arg,
+                    "message": text})
+    return out
+
+
+# -- binary dump ------------------------------------------------------------
+
+
+def write_binary(path):
+    """Write the event table, thread names and all buffered records to ``path``."""
+    recs = records()
+    header = {
+        "record_format": RECORD.format,
+        "events": [[e.name, e.template] for e in _events],
+        "threads": {str(ident): name for ident, name in _thread_names().items()},
+        "dropped": dropped(),
+        "count": len(recs),
+    }
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        meta = json.dumps(header).encode()
+        f.write(struct.pack("<I", len(meta)))
+        f.write(meta)
+        for record in recs:
+            f.write(RECORD.pack(*record))
+
+
+def read_binary(path):
+    """Return ``(records, events, thread_names, dropped)`` from a dump."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a trace dump")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+        record = struct.Struct(header["record_format"])
+        data = f.read()
+    recs = [record.unpack_from(data, i * record.size) for i in range(len(data) // record.size)]
+    events = [EventType(code, name, template)
+              for code, (name, template) in enumerate(header["events"])]
+    names = {int(ident): name for ident, name in header["threads"].items()}
+    return recs, events, names, header["dropped"]
+
+
+def install(report):
+    """Dump everything still buffered to ``report`` when the process exits."""
+    global _time_ns
+    # Pick up the virtual clock if it was installed first.
+    _time_ns = time.time_ns
+    atexit.register(write_binary, report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode a binary trace dump.")
+    parser.add_argument("path")
+    parser.add_argument("--json", action="store_true", help="print a JSON list instead of text")
+    args = parser.parse_args(argv)
+    recs, events, names, lost = read_binary(args.path)
+    if args.json:
+        print(json.dumps(to_json(recs, events, names), indent=2))
+    else:
+        print(format_text(recs, events, names))
+        if lost:
+            print(f"({lost} older records were overwritten)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
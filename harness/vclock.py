@@ -0,0 +1,367 @@
+"""Simulated time for the corpus scenarios.
+
+``install()`` replaces the clock functions of ``time`` and ``datetime`` and the
+lock primitive that ``threading`` builds everything on (``Lock``, ``RLock``,
+``Condition``, ``Event``, ``Semaphore``, ``Barrier``, ``queue.Queue`` and
+``Thread.join``) with versions driven by one shared :class:`VirtualClock`.
+
+The clock never moves while any thread is runnable.  Only once every thread
+known to the clock is blocked -- in ``sleep``, in a timed wait, or waiting on
+another thread -- does it jump straight to the earliest pending deadline and
+wake that thread.  Interleavings therefore stay the ones the scenario would
+produce with real time, while a scenario that sleeps for a minute finishes as
+soon as its threads have done their actual work.
+
+Limits: time only passes for threads started after ``install()``; a thread
+that spins without ever blocking freezes the clock; and processes started by
+``multiprocessing`` each get their own clock.
+"""
+
+import _thread
+import datetime as _datetime
+import heapq
+import os
+import queue
+import selectors
+import threading
+import time
+from collections import deque
+from itertools import count
+
+_real_time = time.time
+_real_monotonic = time.monotonic
+_real_perf_counter = time.perf_counter
+_real_sleep = time.sleep
+_real_allocate_lock = _thread.allocate_lock
+
+MIN_STEP = 1e-6
+
+_clock = None
+
+
+class _Waiter:
+    __slots__ = ("gate", "deadline", "woken", "timed_out")
+
+    def __init__(self, deadline):
+        self.gate = _real_allocate_lock()
+        self.gate.acquire()
+        self.deadline = deadline
+        self.woken = False
+        self.timed_out = False
+
+
+class VirtualClock:
+    def __init__(self, start=None):
+        self._mutex = _real_allocate_lock()
+        # Simulated seconds since install.  Kept separate from the epoch so
+        # that small steps are not lost to float rounding.
+        self._now = 0.0
+        self._epoch = _real_time() if start is None else start
+        self._monotonic_base = _real_monotonic()
+        self._perf_base = _real_perf_counter()
+        # Threads that are neither parked on the clock nor finished.  The
+        # thread calling install() counts as the first one.
+        self._running = 1
+        self._timers = []
+        self._seq = count()
+
+    # -- time sources -------------------------------------------------------
+
+    def elapsed(self):
+        """Simulated seconds since the clock was installed."""
+        return self._now
+
+    def time(self):
+        return self._epoch + self._now
+
+    def time_ns(self):
+        return int(self.time() * 1e9)
+
+    def monotonic(self):
+        return self._monotonic_base + self._now
+
+    def monotonic_ns(self):
+        return int(self.monotonic() * 1e9)
+
+    def perf_counter(self):
+        return self._perf_base + self._now
+
+    def perf_counter_ns(self):
+        return int(self.perf_counter() * 1e9)
+
+    def sleep(self, secs):
+        if secs < 0:
+            raise ValueError("sleep length must be non-negative")
+        if secs == 0:
+            _real_sleep(0)
+            return
+        with self._mutex:
+            self._park(_Waiter(self._deadline(secs)))
+
+    # -- scheduling core (all called with _mutex held) ----------------------
+
+    def _park(self, waiter):
+        """Block the calling thread until ``waiter`` is woken.
+
+        Releases ``_mutex`` while blocked and re-acquires it before returning.
+        Whoever wakes the waiter counts it as running again, so the clock can
+        never jump ahead between the wake-up and the thread resuming.
+        """
+        if waiter.deadline is not None:
+            heapq.heappush(self._timers, (waiter.deadline, next(self._seq), waiter))
+        self._running -= 1
+        self._advance()
+        self._mutex.release()
+        try:
+            waiter.gate.acquire()
+        finally:
+            self._mutex.acquire()
+
+    def _wake(self, waiter, timed_out=False):
+        if waiter.woken:
+            return False
+        waiter.woken = True
+        waiter.timed_out = timed_out
+        self._running += 1
+        waiter.gate.release()
+        return True
+
+    def _advance(self):
+        timers = self._timers
+        while self._running <= 0 and timers:
+            deadline, _, waiter = heapq.heappop(timers)
+            if waiter.woken:
+                continue
+            if deadline > self._now:
+                self._now = deadline
+            self._wake(waiter, timed_out=True)
+
+    def _deadline(self, timeout):
+        if timeout is None:
+            return None
+        if timeout <= 0:
+            return self._now
+        # Round tiny waits up so that callers polling the clock (asyncio
+        # computes sub-microsecond timeouts) always see it move.
+        return self._now + max(timeout, MIN_STEP)
+
+    def _blocking_call(self, func, *args):
+        """Run a real blocking call, counting the thread as parked meanwhile."""
+        with self._mutex:
+            self._running -= 1
+            self._advance()
+        try:
+            return func(*args)
+        finally:
+            with self._mutex:
+                self._running += 1
+
+    # -- thread lifecycle ---------------------------------------------------
+
+    def _thread_starting(self, thread):
+        with self._mutex:
+            self._running += 1
+            thread._vclock_done = False
+            thread._vclock_joiners = []
+
+    def _thread_start_failed(self, thread):
+        with self._mutex:
+            self._running -= 1
+            thread._vclock_done = True
+
+    def _thread_finished(self, thread):
+        with self._mutex:
+            thread._vclock_done = True
+            for waiter in thread._vclock_joiners:
+                self._wake(waiter)
+            thread._vclock_joiners.clear()
+            self._running -= 1
+            self._advance()
+
+    def _join(self, thread, timeout):
+        """Wait for ``thread``; return False if ``timeout`` ran out first."""
+        with self._mutex:
+            deadline = self._deadline(timeout)
+            while not thread._vclock_done:
+                if deadline is not None and self._now >= deadline:
+                    return False
+                waiter = _Waiter(deadline)
+                thread._vclock_joiners.append(waiter)
+                self._park(waiter)
+                if waiter.timed_out:
+                    thread._vclock_joiners.remove(waiter)
+        return True
+
+    def _after_fork_in_child(self):
+        self._mutex = _real_allocate_lock()
+        self._running = 1
+        self._timers = []
+
+
+class VirtualLock:
+    """Drop-in for ``_thread.LockType`` whose timeouts run on the virtual clock.
+
+    Like the real lock it is not fair: ``release`` wakes the longest waiter,
+    but any thread that gets there first may take the lock.
+    """
+
+    __slots__ = ("_locked", "_waiters", "__weakref__")
+
+    def __init__(self):
+        self._locked = False
+        self._waiters = deque()
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not blocking and timeout != -1:
+            raise ValueError("can't specify a timeout for a non-blocking call")
+        if timeout < 0 and timeout != -1:
+            raise ValueError("timeout value must be a non-negative number")
+        clock = _clock
+        with clock._mutex:
+            if not self._locked:
+                self._locked = True
+                return True
+            if not blocking:
+                return False
+            deadline = None if timeout == -1 else clock._deadline(timeout)
+            while self._locked:
+                if deadline is not None and clock._now >= deadline:
+                    return False
+                waiter = _Waiter(deadline)
+                self._waiters.append(waiter)
+                clock._park(waiter)
+                if waiter.timed_out:
+                    self._waiters.remove(waiter)
+            self._locked = True
+            return True
+
+    def release(self):
+        clock = _clock
+        with clock._mutex:
+            if not self._locked:
+                raise RuntimeError("release unlocked lock")
+            self._locked = False
+            waiters = self._waiters
+            while waiters:
+                if clock._wake(waiters.popleft()):
+                    break
+
+    def locked(self):
+        return self._locked
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _at_fork_reinit(self):
+        self._locked = False
+        self._waiters = deque()
+
+    def __repr__(self):
+        state = "locked" if self._locked else "unlocked"
+        return f"<{state} {type(self).__module__}.{type(self).__qualname__} object at {id(self):#x}>"
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Selector for asyncio loops: waits for timers on the virtual clock."""
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready or timeout is not None and timeout <= 0:
+            return ready
+        if timeout is None:
+            return _clock._blocking_call(super().select, None)
+        _clock.sleep(timeout)
+        return super().select(0)
+
+
+def _make_datetime_class(clock):
+    class datetime(_datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.fromtimestamp(clock.time(), tz)
+
+        @classmethod
+        def today(cls):
+            return cls.fromtimestamp(clock.time())
+
+        @classmethod
+        def utcnow(cls):
+            return cls.utcfromtimestamp(clock.time())
+
+    class date(_datetime.date):
+        @classmethod
+        def today(cls):
+            return cls.fromtimestamp(clock.time())
+
+    return datetime, date
+
+
+def install(start=None):
+    """Switch this process to virtual time and return the clock.
+
+    Must be called from the main thread before the scenario creates any
+    locks or threads; there is no way back to real time.
+    """
+    global _clock
+    if _clock is not None:
+        return _clock
+    clock = _clock = VirtualClock(start)
+
+    time.time = clock.time
+    time.time_ns = clock.time_ns
+    time.monotonic = clock.monotonic
+    time.monotonic_ns = clock.monotonic_ns
+    time.perf_counter = clock.perf_counter
+    time.perf_counter_ns = clock.perf_counter_ns
+    time.sleep = clock.sleep
+    _datetime.datetime, _datetime.date = _make_datetime_class(clock)
+
+    # Condition, Event, Semaphore, Barrier and the pure-Python RLock all
+    # allocate their locks through these names at call time.
+    threading.Lock = threading._allocate_lock = VirtualLock
+    threading._CRLock = None
+    # The C SimpleQueue (used by ThreadPoolExecutor) blocks outside the clock.
+    queue.SimpleQueue = queue._PySimpleQueue
+    selectors.DefaultSelector = _VirtualSelector
+
+    thread_cls = threading.Thread
+    real_start = thread_cls.start
+    real_join = thread_cls.join
+    real_bootstrap_inner = thread_cls._bootstrap_inner
+
+    def start(self):
+        clock._thread_starting(self)
+        try:
+            real_start(self)
+        except BaseException:
+            clock._thread_start_failed(self)
+            raise
+
+    def _bootstrap_inner(self):
+        try:
+            real_bootstrap_inner(self)
+        finally:
+            if hasattr(self, "_vclock_done"):
+                clock._thread_finished(self)
+
+    def join(self, timeout=None):
+        if not hasattr(self, "_vclock_done"):
+            return real_join(self, timeout)
+        if self is threading.current_thread():
+            raise RuntimeError("cannot join current thread")
+        if clock._join(self, timeout):
+            # Only the interpreter's own thread teardown is left to wait for.
+            real_join(self)
+
+    thread_cls.start = start
+    thread_cls._bootstrap_inner = _bootstrap_inner
+    thread_cls.join = join
+
+    os.register_at_fork(after_in_child=clock._after_fork_in_child)
+    return clock
+
+
+def installed():
+    return _clock